@@ -8,23 +8,13 @@ import json
 import os
 import hashlib
 import secrets
-from typing import Dict, Any, Optional
-from pydantic import BaseModel, EmailStr, Field, ValidationError
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Dict, Any
+from db import (
+    instrument_handler, parse_request, serialize_body, get_db_connection, release_db_connection,
+    hash_token, validate_session_token, evict_session
+)
 
-class RegisterRequest(BaseModel):
-    email: EmailStr
-    password: str = Field(..., min_length=6)
-    full_name: str = Field(..., min_length=1)
-
-class LoginRequest(BaseModel):
-    email: EmailStr
-    password: str = Field(..., min_length=6)
-
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+SESSION_LIFETIME_HOURS = int(os.environ.get('SESSION_LIFETIME_HOURS', '720'))
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -32,6 +22,23 @@ def hash_password(password: str) -> str:
 def generate_token() -> str:
     return secrets.token_urlsafe(32)
 
+def create_session(cur, user_id: int) -> str:
+    token = generate_token()
+    cur.execute(
+        "INSERT INTO sessions (token_hash, user_id, expires_at) VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))",
+        (hash_token(token), user_id, SESSION_LIFETIME_HOURS)
+    )
+    return token
+
+def revoke_session(cur, token: str) -> bool:
+    evict_session(token)
+    cur.execute(
+        "UPDATE sessions SET revoked_at = CURRENT_TIMESTAMP WHERE token_hash = %s AND revoked_at IS NULL",
+        (hash_token(token),)
+    )
+    return cur.rowcount > 0
+
+@instrument_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -50,13 +57,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
         action = body_data.get('action')
+        if action in ('register', 'login'):
+            from models import RegisterRequest, LoginRequest
         
         conn = get_db_connection()
         cur = conn.cursor()
         
         try:
             if action == 'register':
-                req = RegisterRequest(**body_data)
+                req = parse_request(RegisterRequest, body_data)
                 password_hash = hash_password(req.password)
                 
                 cur.execute(
@@ -64,10 +73,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     (req.email, password_hash, req.full_name)
                 )
                 user = cur.fetchone()
+                token = create_session(cur, user['id'])
                 conn.commit()
                 
-                token = generate_token()
-                
                 user_data = {
                     'id': user['id'],
                     'email': user['email'],
@@ -81,7 +89,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps({
+                    'body': serialize_body({
                         'success': True,
                         'token': token,
                         'user': user_data
@@ -89,7 +97,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             elif action == 'login':
-                req = LoginRequest(**body_data)
+                req = parse_request(LoginRequest, body_data)
                 password_hash = hash_password(req.password)
                 
                 cur.execute(
@@ -105,10 +113,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'Content-Type': 'application/json',
                             'Access-Control-Allow-Origin': '*'
                         },
-                        'body': json.dumps({'success': False, 'error': 'Invalid credentials'})
+                        'body': serialize_body({'success': False, 'error': 'Invalid credentials'})
                     }
                 
-                token = generate_token()
+                token = create_session(cur, user['id'])
+                conn.commit()
                 
                 user_data = {
                     'id': user['id'],
@@ -123,16 +132,89 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps({
+                    'body': serialize_body({
                         'success': True,
                         'token': token,
                         'user': user_data
                     })
                 }
+            
+            elif action == 'logout':
+                headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+                token = headers.get('x-auth-token') or body_data.get('token')
+                revoked = bool(token) and revoke_session(cur, token)
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': serialize_body({'success': revoked})
+                }
+        
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    
+    if method == 'GET':
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        token = headers.get('x-auth-token')
+        
+        if not token:
+            return {
+                'statusCode': 401,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': serialize_body({'success': False, 'error': 'Authentication required'})
+            }
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        try:
+            user_id = validate_session_token(cur, token)
+            user = None
+            if user_id is not None:
+                cur.execute(
+                    "SELECT id, email, full_name, balance_usd FROM users WHERE id = %s",
+                    (user_id,)
+                )
+                user = cur.fetchone()
+            
+            if not user:
+                return {
+                    'statusCode': 401,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': serialize_body({'success': False, 'error': 'Invalid or expired session'})
+                }
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': serialize_body({
+                    'success': True,
+                    'user': {
+                        'id': user['id'],
+                        'email': user['email'],
+                        'full_name': user['full_name'],
+                        'balance_usd': float(user['balance_usd'])
+                    }
+                })
+            }
         
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
     
     return {
         'statusCode': 405,
@@ -140,5 +222,5 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({'error': 'Method not allowed'})
+        'body': serialize_body({'error': 'Method not allowed'})
     }
\ No newline at end of file
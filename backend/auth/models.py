@@ -0,0 +1,14 @@
+'''
+Схемы запросов функции auth. Импортируются лениво из обработчиков POST,
+чтобы OPTIONS и проверка сессии не загружали pydantic и email-validator.
+'''
+from pydantic import BaseModel, EmailStr, Field
+
+class RegisterRequest(BaseModel):
+    email: EmailStr
+    password: str = Field(..., min_length=6)
+    full_name: str = Field(..., min_length=1)
+
+class LoginRequest(BaseModel):
+    email: EmailStr
+    password: str = Field(..., min_length=6)
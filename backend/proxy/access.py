@@ -0,0 +1,245 @@
+'''
+Допуск запросов к функции: проверка сессии и админ-токена, лимиты частоты (token bucket
+на клиента и на инстанс) и идемпотентность POST по заголовку Idempotency-Key.
+Одинаковая копия модуля лежит в trading и proxy; область ключей идемпотентности передаёт index.py.
+'''
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Tuple, Optional
+from db import serialize_body, validate_session_token, cached_session_user, close_quietly
+
+# Без токена запросы к данным пользователя принимаются только при явном AUTH_REQUIRED=0 (локальные скрипты)
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '1') not in ('0', 'false')
+# Токен для платформенной статистики (action=stats); пока он не задан, статистика закрыта
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+RATE_LIMIT_USER_RPS = float(os.environ.get('RATE_LIMIT_USER_RPS', '5'))
+RATE_LIMIT_USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', '20'))
+RATE_LIMIT_GLOBAL_RPS = float(os.environ.get('RATE_LIMIT_GLOBAL_RPS', '200'))
+RATE_LIMIT_GLOBAL_BURST = float(os.environ.get('RATE_LIMIT_GLOBAL_BURST', '400'))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000'))
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+    
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def retry_after(self) -> float:
+        return (1 - self.tokens) / self.rate
+
+_global_bucket = TokenBucket(RATE_LIMIT_GLOBAL_RPS, RATE_LIMIT_GLOBAL_BURST, time.monotonic())
+_client_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+_rate_limit_lock = threading.Lock()
+
+def client_key(event: Dict[str, Any]) -> Optional[str]:
+    # user_id из запроса ещё не проверен: по пользователю ключуется только токен, уже подтверждённый
+    # кешем сессий, остальной трафик — по IP, чтобы подменой user_id нельзя было получить новый бакет
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    token = headers.get('x-auth-token')
+    user_id = cached_session_user(token) if token else None
+    if user_id is not None:
+        return f'user:{user_id}'
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    return f'ip:{source_ip}' if source_ip else None
+
+def admit_request(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    now = time.monotonic()
+    with _rate_limit_lock:
+        buckets = []
+        if RATE_LIMIT_GLOBAL_RPS > 0:
+            buckets.append(_global_bucket)
+        if key and RATE_LIMIT_USER_RPS > 0:
+            bucket = _client_buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(RATE_LIMIT_USER_RPS, RATE_LIMIT_USER_BURST, now)
+                _client_buckets[key] = bucket
+                if len(_client_buckets) > RATE_LIMIT_MAX_CLIENTS:
+                    _client_buckets.popitem(last=False)
+            else:
+                _client_buckets.move_to_end(key)
+            buckets.append(bucket)
+        
+        for bucket in buckets:
+            bucket.refill(now)
+        exhausted = [bucket for bucket in buckets if bucket.tokens < 1]
+        if not exhausted:
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return None
+        retry_after = max(bucket.retry_after() for bucket in exhausted)
+    
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(int(retry_after) + 1)
+        },
+        'body': serialize_body({'success': False, 'error': 'Too many requests'})
+    }
+
+def error_response(status: int, error: str, details: Any = None) -> Dict[str, Any]:
+    body = {'success': False, 'error': error}
+    if details is not None:
+        body['details'] = details
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body(body)
+    }
+
+def authorize_request(cur, event: Dict[str, Any], user_id: Any) -> Optional[Dict[str, Any]]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    token = headers.get('x-auth-token')
+    
+    if not token:
+        if not AUTH_REQUIRED:
+            return None
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Authentication required'})
+        }
+    
+    session_user_id = validate_session_token(cur, token)
+    if session_user_id is None:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Invalid or expired session'})
+        }
+    
+    if user_id is not None and str(user_id) != str(session_user_id):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Token does not match user'})
+        }
+    
+    return None
+
+def authorize_admin(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    token = headers.get('x-admin-token') or ''
+    
+    if ADMIN_TOKEN and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return None
+    
+    return {
+        'statusCode': 403,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({'success': False, 'error': 'Admin token required'})
+    }
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_CACHE_TTL = float(os.environ.get('IDEMPOTENCY_CACHE_TTL', '300'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+_idempotency_cache: 'OrderedDict[Tuple[int, str], Tuple[str, Dict[str, Any], float]]' = OrderedDict()
+_idempotency_cache_lock = threading.Lock()
+
+def parse_idempotency_key(event: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    key = headers.get('idempotency-key')
+    if key is None:
+        return None, None
+    key = key.strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return None, error_response(400, 'Invalid Idempotency-Key header')
+    return key, None
+
+def request_fingerprint(kind: str, req: Any) -> str:
+    return hashlib.sha256(json.dumps([kind, req.model_dump()], sort_keys=True, default=str).encode()).hexdigest()
+
+def _cache_idempotent_response(cache_key: Tuple[int, str], request_hash: str, response: Dict[str, Any]):
+    with _idempotency_cache_lock:
+        _idempotency_cache[cache_key] = (request_hash, response, time.monotonic() + IDEMPOTENCY_CACHE_TTL)
+        _idempotency_cache.move_to_end(cache_key)
+        while len(_idempotency_cache) > IDEMPOTENCY_CACHE_SIZE:
+            _idempotency_cache.popitem(last=False)
+
+def _replay_response(request_hash: str, stored_hash: str, response: Dict[str, Any]) -> Dict[str, Any]:
+    if stored_hash != request_hash:
+        return error_response(422, 'Idempotency-Key was already used with a different request')
+    return {**response, 'headers': {**response['headers'], 'Idempotent-Replayed': 'true'}}
+
+def _release_idempotency_lock(conn, lock_id: int):
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_unlock(%s)', (lock_id,))
+        conn.commit()
+    except psycopg2.Error:
+        close_quietly(conn)
+
+def run_idempotent(conn, cur, scope: str, user_id: int, key: str, request_hash: str, execute) -> Dict[str, Any]:
+    cache_key = (user_id, key)
+    with _idempotency_cache_lock:
+        cached = _idempotency_cache.get(cache_key)
+        if cached and cached[2] <= time.monotonic():
+            del _idempotency_cache[cache_key]
+            cached = None
+    if cached:
+        return _replay_response(request_hash, cached[0], cached[1])
+    
+    lock_id = int.from_bytes(hashlib.sha256(f'{scope}:{user_id}:{key}'.encode()).digest()[:8], 'big', signed=True)
+    cur.execute('SELECT pg_advisory_lock(%s)', (lock_id,))
+    try:
+        cur.execute(
+            '''SELECT request_hash, status_code, response_headers, response_body FROM idempotency_keys
+               WHERE scope = %s AND user_id = %s AND idempotency_key = %s AND expires_at > CURRENT_TIMESTAMP''',
+            (scope, user_id, key)
+        )
+        stored = cur.fetchone()
+        if stored and stored['status_code'] is None:
+            return error_response(409, 'Request with this Idempotency-Key did not record its response')
+        if stored:
+            response = {'statusCode': stored['status_code'], 'headers': stored['response_headers'], 'body': stored['response_body']}
+            _cache_idempotent_response(cache_key, stored['request_hash'], response)
+            return _replay_response(request_hash, stored['request_hash'], response)
+        
+        cur.execute(
+            '''INSERT INTO idempotency_keys (scope, user_id, idempotency_key, request_hash, expires_at)
+               VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+               ON CONFLICT (scope, user_id, idempotency_key) DO UPDATE SET
+                   request_hash = EXCLUDED.request_hash, status_code = NULL, response_headers = NULL, response_body = NULL,
+                   created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at''',
+            (scope, user_id, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+        )
+        response = execute()
+        
+        if 200 <= response['statusCode'] < 300:
+            cur.execute(
+                '''UPDATE idempotency_keys SET status_code = %s, response_headers = %s, response_body = %s
+                   WHERE scope = %s AND user_id = %s AND idempotency_key = %s''',
+                (response['statusCode'], json.dumps(response['headers']), response['body'], scope, user_id, key)
+            )
+            conn.commit()
+            _cache_idempotent_response(cache_key, request_hash, response)
+        else:
+            conn.rollback()
+            cur.execute(
+                "DELETE FROM idempotency_keys WHERE scope = %s AND user_id = %s AND idempotency_key = %s AND status_code IS NULL",
+                (scope, user_id, key)
+            )
+            conn.commit()
+        return response
+    finally:
+        _release_idempotency_lock(conn, lock_id)
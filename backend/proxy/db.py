@@ -0,0 +1,282 @@
+'''
+Обвязка функции вокруг БД: замеры запроса (время фаз, число и длительность SQL, медленные запросы),
+пул соединений и кеш проверенных сессий. Функции деплоятся по отдельности, поэтому одинаковая
+копия модуля лежит рядом с index.py каждой из них.
+'''
+import functools
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Dict, Any, List, Tuple, Optional
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+INSTRUMENT_SAMPLE_RATE = float(os.environ.get('INSTRUMENT_SAMPLE_RATE', '1'))
+EXPLAIN_SLOW_QUERIES = os.environ.get('EXPLAIN_SLOW_QUERIES', '') in ('1', 'true')
+
+_request_metrics = threading.local()
+
+def record_phase(phase: str, started: float):
+    metrics = getattr(_request_metrics, 'current', None)
+    if metrics is not None:
+        key = f'{phase}_ms'
+        metrics[key] = metrics.get(key, 0.0) + (time.perf_counter() - started) * 1000
+
+def _explain(cursor, query, vars) -> Any:
+    import psycopg2
+    explain_cur = cursor.connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        explain_cur.execute('SAVEPOINT explain_capture')
+        try:
+            explain_cur.execute('EXPLAIN (FORMAT JSON) ' + query, vars)
+            plan = explain_cur.fetchone()[0]
+            explain_cur.execute('RELEASE SAVEPOINT explain_capture')
+            return plan
+        except psycopg2.Error as e:
+            explain_cur.execute('ROLLBACK TO SAVEPOINT explain_capture')
+            return {'error': str(e).strip()}
+    finally:
+        explain_cur.close()
+
+class InstrumentedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            result = super().execute(query, vars)
+            succeeded = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics = getattr(_request_metrics, 'current', None)
+            if metrics is not None:
+                metrics['statements'] += 1
+                metrics['sql_ms'] += elapsed_ms
+                if succeeded and self.description is not None and self.rowcount > 0:
+                    metrics['rows'] += self.rowcount
+            
+            if elapsed_ms >= SLOW_QUERY_MS:
+                entry = {
+                    'event': 'slow_query',
+                    'request_id': metrics.get('request_id') if metrics else None,
+                    'duration_ms': round(elapsed_ms, 2),
+                    'rows': self.rowcount,
+                    'query': ' '.join(str(query).split())[:1000]
+                }
+                if succeeded and EXPLAIN_SLOW_QUERIES and not self.name and isinstance(query, str):
+                    entry['plan'] = _explain(self, query, vars)
+                print(json.dumps(entry, default=str))
+
+_cursor_factory = None
+
+def get_cursor_factory():
+    global _cursor_factory
+    if _cursor_factory is None:
+        from psycopg2.extras import RealDictCursor
+        _cursor_factory = type('InstrumentedCursor', (InstrumentedCursorMixin, RealDictCursor), {})
+    return _cursor_factory
+
+def parse_request(model, data: Dict[str, Any]):
+    started = time.perf_counter()
+    try:
+        return model(**data)
+    finally:
+        record_phase('validation', started)
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def serialize_body(payload: Any, compact: bool = False) -> str:
+    started = time.perf_counter()
+    body = json.dumps(payload, default=_json_default, separators=(',', ':') if compact else None)
+    record_phase('serialization', started)
+    return body
+
+def instrument_handler(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        request_id = getattr(context, 'request_id', None)
+        metrics = {'request_id': request_id, 'statements': 0, 'sql_ms': 0.0, 'rows': 0}
+        _request_metrics.current = metrics
+        started = time.perf_counter()
+        response = None
+        
+        try:
+            response = func(event, context)
+            return response
+        finally:
+            _request_metrics.current = None
+            total_ms = (time.perf_counter() - started) * 1000
+            
+            if total_ms >= SLOW_QUERY_MS or random.random() < INSTRUMENT_SAMPLE_RATE:
+                entry = {
+                    'event': 'request',
+                    'request_id': request_id,
+                    'function': getattr(context, 'function_name', None),
+                    'method': event.get('httpMethod'),
+                    'action': (event.get('queryStringParameters') or {}).get('action'),
+                    'status': response.get('statusCode') if response else 500,
+                    'total_ms': round(total_ms, 2),
+                    'response_bytes': len(response.get('body') or '') if response else 0
+                }
+                for key, value in metrics.items():
+                    if key != 'request_id':
+                        entry[key] = round(value, 2) if isinstance(value, float) else value
+                print(json.dumps(entry))
+    
+    return wrapper
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_lock = threading.Lock()
+_db_pool_in_use = 0
+
+def get_db_pool_stats() -> Dict[str, int]:
+    return {'size': DB_POOL_SIZE, 'idle': len(_db_pool), 'in_use': _db_pool_in_use}
+
+def _log_db_pool(event: str):
+    print(json.dumps({'event': event, 'db_pool': get_db_pool_stats()}))
+
+def _is_connection_alive(conn, idle_since: float) -> bool:
+    import psycopg2
+    if conn.closed:
+        return False
+    if time.monotonic() - idle_since < DB_POOL_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def get_db_connection():
+    global _db_pool_in_use
+    started = time.perf_counter()
+    while True:
+        with _db_pool_lock:
+            if not _db_pool:
+                break
+            conn, idle_since = _db_pool.pop()
+        if _is_connection_alive(conn, idle_since):
+            with _db_pool_lock:
+                _db_pool_in_use += 1
+            record_phase('connect', started)
+            return conn
+        close_quietly(conn)
+        _log_db_pool('db_pool_discard')
+    
+    import psycopg2
+    dsn = os.environ.get('DATABASE_URL')
+    conn = psycopg2.connect(dsn, cursor_factory=get_cursor_factory())
+    with _db_pool_lock:
+        _db_pool_in_use += 1
+    _log_db_pool('db_pool_connect')
+    record_phase('connect', started)
+    return conn
+
+def release_db_connection(conn):
+    import psycopg2
+    global _db_pool_in_use
+    reusable = not conn.closed
+    if reusable:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            reusable = False
+    
+    with _db_pool_lock:
+        _db_pool_in_use -= 1
+        if reusable and len(_db_pool) < DB_POOL_SIZE:
+            _db_pool.append((conn, time.monotonic()))
+            return
+    
+    close_quietly(conn)
+
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '60'))
+# Отзыв сессии виден только кешу того инстанса auth, что её отозвал: запись старше этого срока перепроверяется в БД
+SESSION_REVALIDATE_AFTER = float(os.environ.get('SESSION_REVALIDATE_AFTER', '5'))
+SESSION_STATS_LOG_EVERY = 1000
+
+_session_cache: 'OrderedDict[str, Tuple[int, float, float]]' = OrderedDict()
+_session_cache_lock = threading.Lock()
+_session_stats = {'hits': 0, 'misses': 0}
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_session_cache_stats() -> Dict[str, Any]:
+    lookups = _session_stats['hits'] + _session_stats['misses']
+    return {
+        'hits': _session_stats['hits'],
+        'misses': _session_stats['misses'],
+        'hit_rate': round(_session_stats['hits'] / lookups, 4) if lookups else 0.0,
+        'size': len(_session_cache)
+    }
+
+def _count_session_lookup(hit: bool):
+    _session_stats['hits' if hit else 'misses'] += 1
+    if (_session_stats['hits'] + _session_stats['misses']) % SESSION_STATS_LOG_EVERY == 0:
+        print(json.dumps({'event': 'session_cache', **get_session_cache_stats()}))
+
+def validate_session_token(cur, token: str) -> Optional[int]:
+    token_hash = hash_token(token)
+    now = time.monotonic()
+    
+    with _session_cache_lock:
+        entry = _session_cache.get(token_hash)
+        if entry and entry[1] > now and now - entry[2] < SESSION_REVALIDATE_AFTER:
+            _session_cache.move_to_end(token_hash)
+            _count_session_lookup(True)
+            return entry[0]
+        if entry:
+            del _session_cache[token_hash]
+        _count_session_lookup(False)
+    
+    cur.execute(
+        "SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)::float8 AS ttl FROM sessions WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP",
+        (token_hash,)
+    )
+    session = cur.fetchone()
+    if not session:
+        return None
+    
+    with _session_cache_lock:
+        _session_cache[token_hash] = (session['user_id'], now + min(SESSION_CACHE_TTL, session['ttl']), now)
+        _session_cache.move_to_end(token_hash)
+        while len(_session_cache) > SESSION_CACHE_SIZE:
+            _session_cache.popitem(last=False)
+    
+    return session['user_id']
+
+def cached_session_user(token: str) -> Optional[int]:
+    # Только чтение кеша без похода в БД: ключ лимита частоты не должен стоить запроса
+    with _session_cache_lock:
+        entry = _session_cache.get(hash_token(token))
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def evict_session(token: str):
+    with _session_cache_lock:
+        _session_cache.pop(hash_token(token), None)
@@ -4,52 +4,490 @@ Args: event - dict с httpMethod, body, queryStringParameters, headers
       context - объект с request_id, function_name
 Returns: HTTP response dict с данными прокси или результатом операции
 '''
+import csv
+import io
+import gzip
 import json
 import os
-from typing import Dict, Any
+import time
+import base64
+import hashlib
+import binascii
+from typing import Dict, Any, List, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
-import random
-from pydantic import BaseModel, Field
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-class PurchaseRequest(BaseModel):
-    user_id: int
-    plan_id: int
-    location: str
-    quantity: int = Field(..., gt=0, le=100)
-    duration_months: int = Field(..., gt=0, le=12)
-
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
-
-def generate_proxy_credentials(location: str, quantity: int):
-    proxies = []
-    base_ips = {
-        'Russia': '45.141.',
-        'USA': '192.168.',
-        'Germany': '195.201.',
-        'France': '51.158.',
-        'Japan': '103.75.',
-        'Singapore': '128.199.'
+from db import instrument_handler, record_phase, parse_request, serialize_body, get_db_connection, release_db_connection
+from access import (
+    admit_request, client_key, authorize_request, authorize_admin, error_response,
+    parse_idempotency_key, request_fingerprint, run_idempotent
+)
+
+ORDERS_PAGE_SIZE = int(os.environ.get('ORDERS_PAGE_SIZE', '50'))
+ORDERS_MAX_PAGE_SIZE = 200
+PROXY_INLINE_LIMIT = int(os.environ.get('PROXY_INLINE_LIMIT', '100'))
+CREDENTIALS_MAX_PAGE_SIZE = 5000
+PLANS_CACHE_TTL = float(os.environ.get('PLANS_CACHE_TTL', '300'))
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '20000'))
+# Тело ответа функции ограничено платформой (3.5 МБ): страница экспорта закрывается, как только
+# достигает этого размера, остальное отдаётся следующими страницами по X-Next-Cursor
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+EXPORT_COLUMNS = ['id', 'order_id', 'host', 'port', 'username', 'password', 'location', 'status']
+PLAN_COLUMNS = ['id', 'name', 'type', 'description', 'price_per_month', 'max_connections', 'speed', 'locations']
+ORDER_COLUMNS = ['id', 'plan_name', 'plan_type', 'location', 'quantity', 'duration_months', 'total_price', 'status', 'expires_at', 'created_at']
+CREDENTIAL_COLUMNS = ['order_id', 'host', 'port', 'username', 'password', 'location', 'status']
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+def columnar(rows: List[Dict[str, Any]], columns: List[str]) -> Dict[str, Any]:
+    # Один массив на колонку вместо словаря на строку; Decimal и datetime остаются как есть до serialize_body
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'columns': {column: [row[column] for row in rows] for column in columns}
+    }
+
+_brotli_state: Dict[str, Any] = {'available': None}
+
+def _brotli_available() -> bool:
+    if _brotli_state['available'] is None:
+        import importlib.util
+        _brotli_state['available'] = importlib.util.find_spec('brotli') is not None
+    return _brotli_state['available']
+
+def negotiate_encoding(event: Dict[str, Any]) -> Optional[str]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    accepted: Dict[str, float] = {}
+    for part in (headers.get('accept-encoding') or '').split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = q
+    
+    for encoding in ('br', 'gzip'):
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0 and (encoding != 'br' or _brotli_available()):
+            return encoding
+    return None
+
+def compress_body(body: str, encoding: str) -> str:
+    started = time.perf_counter()
+    raw = body.encode()
+    if encoding == 'br':
+        import brotli
+        data = brotli.compress(raw, quality=RESPONSE_BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=RESPONSE_GZIP_LEVEL)
+    record_phase('compression', started)
+    return base64.b64encode(data).decode()
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    response['headers'] = dict(response['headers'], Vary='Accept-Encoding')
+    encoding = negotiate_encoding(event)
+    if not encoding or len(response['body']) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+    
+    response['headers']['Content-Encoding'] = encoding
+    response['body'] = compress_body(response['body'], encoding)
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def write_export(export_cur, columns: List[str], fmt: str, max_rows: int, max_bytes: int) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    
+    count = 0
+    last_row = None
+    has_more = False
+    for row in export_cur:
+        if count == max_rows or buffer.tell() >= max_bytes:
+            has_more = True
+            break
+        values = [_export_value(row[column]) for column in columns]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        count += 1
+        last_row = row
+    
+    return buffer.getvalue(), count, last_row if has_more else None
+
+def export_response(body: str, fmt: str, count: int, next_cursor: Optional[str]) -> Dict[str, Any]:
+    headers = {
+        'Content-Type': 'text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Export-Rows',
+        'X-Export-Rows': str(count)
+    }
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body
+    }
+
+def allocate_proxy_credentials(cur, order_id: int, location: str, plan_type: str, quantity: int) -> List[Dict[str, Any]]:
+    cur.execute(
+        '''WITH claimed AS (
+               SELECT id FROM proxy_inventory
+               WHERE location = %s AND plan_type = %s AND status = 'available'
+               ORDER BY id
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           ), allocated AS (
+               UPDATE proxy_inventory pi
+               SET status = 'allocated', order_id = %s, allocated_at = CURRENT_TIMESTAMP
+               FROM claimed
+               WHERE pi.id = claimed.id
+               RETURNING pi.host, pi.port, pi.username, pi.password, pi.location
+           )
+           INSERT INTO proxy_credentials 
+               (order_id, proxy_host, proxy_port, proxy_username, proxy_password, location)
+           SELECT %s, host, port, username, password, location FROM allocated
+           RETURNING proxy_host, proxy_port, proxy_username, proxy_password''',
+        (location, plan_type, quantity, order_id, order_id)
+    )
+    return [
+        {
+            'host': row['proxy_host'],
+            'port': row['proxy_port'],
+            'username': row['proxy_username'],
+            'password': row['proxy_password']
+        }
+        for row in cur.fetchall()
+    ]
+
+# entry: тела json/columnar и лениво заполняемые варианты по (format, encoding) с собственным ETag;
+# заменяется целиком при смене версии, поэтому сжатие выполняется один раз на версию тарифов
+_plans_cache: Dict[str, Any] = {'entry': None, 'version': None, 'expires_at': 0.0}
+
+def refresh_plans_cache():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("SELECT version FROM cache_versions WHERE name = 'proxy_plans'")
+        row = cur.fetchone()
+        version = row['version'] if row else None
+        
+        if _plans_cache['entry'] is None or version is None or version != _plans_cache['version']:
+            cur.execute('SELECT * FROM proxy_plans ORDER BY price_per_month')
+            plans = cur.fetchall()
+            
+            result = []
+            for plan in plans:
+                result.append({
+                    'id': plan['id'],
+                    'name': plan['name'],
+                    'type': plan['type'],
+                    'description': plan['description'],
+                    'price_per_month': float(plan['price_per_month']),
+                    'max_connections': plan['max_connections'],
+                    'speed': plan['speed'],
+                    'locations': plan['locations']
+                })
+            
+            _plans_cache['entry'] = {
+                'bodies': {
+                    'json': json.dumps(result),
+                    'columnar': serialize_body(columnar(plans, PLAN_COLUMNS), compact=True)
+                },
+                'variants': {}
+            }
+            _plans_cache['version'] = version
+        
+        _plans_cache['expires_at'] = time.monotonic() + PLANS_CACHE_TTL
+    
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def is_timer_trigger(event: Dict[str, Any]) -> bool:
+    return any(
+        'TimerMessage' in ((message.get('event_metadata') or {}).get('event_type') or '')
+        for message in event.get('messages') or []
+    )
+
+def run_expiry_sweep() -> Dict[str, Any]:
+    from sweeper import sweep_expired_orders, purge_expired_rows
+    
+    conn = get_db_connection()
+    try:
+        stats = sweep_expired_orders(conn)
+        stats['purged'] = purge_expired_rows(conn)
+    finally:
+        release_db_connection(conn)
+    
+    print(json.dumps({'event': 'proxy_sweep', **stats}))
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': serialize_body(stats)
+    }
+
+def plans_variant(entry: Dict[str, Any], fmt: str, encoding: Optional[str]) -> Dict[str, Any]:
+    key = (fmt, encoding)
+    variant = entry['variants'].get(key)
+    if variant is None:
+        body = entry['bodies'][fmt]
+        etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+        if encoding:
+            variant = {'body': compress_body(body, encoding), 'etag': f'"{etag}-{encoding}"'}
+        else:
+            variant = {'body': body, 'etag': f'"{etag}"'}
+        entry['variants'][key] = variant
+    return variant
+
+def get_plans_response(event: Dict[str, Any]) -> Dict[str, Any]:
+    fmt = (event.get('queryStringParameters') or {}).get('format', 'json')
+    if fmt not in ('json', 'columnar'):
+        return error_response(400, 'Unsupported format')
+    
+    if time.monotonic() >= _plans_cache['expires_at']:
+        import psycopg2
+        try:
+            refresh_plans_cache()
+        except psycopg2.Error as e:
+            if _plans_cache['entry'] is None:
+                raise
+            # Тарифы меняются редко: при недоступной БД отдаётся прежний список, следующая проверка — через PLANS_CACHE_TTL
+            _plans_cache['expires_at'] = time.monotonic() + PLANS_CACHE_TTL
+            print(json.dumps({'event': 'plans_cache_stale', 'version': _plans_cache['version'], 'error': str(e).strip()}))
+    
+    entry = _plans_cache['entry']
+    encoding = negotiate_encoding(event)
+    if len(entry['bodies'][fmt]) < RESPONSE_COMPRESS_MIN_BYTES:
+        encoding = None
+    variant = plans_variant(entry, fmt, encoding)
+    
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': f'public, max-age={int(PLANS_CACHE_TTL)}',
+        'Vary': 'Accept-Encoding',
+        'ETag': variant['etag']
     }
     
-    base_ip = base_ips.get(location, '192.168.')
+    if request_headers.get('if-none-match') == variant['etag']:
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
     
-    for _ in range(quantity):
-        proxy = {
-            'host': f'{base_ip}{random.randint(1, 255)}.{random.randint(1, 255)}',
-            'port': random.randint(8000, 9999),
-            'username': f'user_{random.randint(1000, 9999)}',
-            'password': f'pass_{random.randint(10000, 99999)}'
+    response = {'statusCode': 200, 'headers': headers, 'body': variant['body']}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        response['isBase64Encoded'] = True
+    return response
+
+def parse_json_body(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None, error_response(400, 'Malformed JSON body')
+    if not isinstance(body_data, dict):
+        return None, error_response(400, 'Request body must be a JSON object')
+    return body_data, None
+
+def credentials_ref(order_id: int, user_id: int) -> str:
+    # Заказы крупнее PROXY_INLINE_LIMIT отдают креды не в ответе, а постранично через action=credentials
+    return f'?action=credentials&order_id={order_id}&user_id={user_id}'
+
+# purchase_proxies не фиксирует транзакцию: при Idempotency-Key ответ сохраняется до того же commit
+def commit_write(conn, response: Dict[str, Any]) -> Dict[str, Any]:
+    if 200 <= response['statusCode'] < 300:
+        conn.commit()
+    else:
+        conn.rollback()
+    return response
+
+def purchase_proxies(conn, cur, req) -> Dict[str, Any]:
+    cur.execute('SELECT * FROM proxy_plans WHERE id = %s', (req.plan_id,))
+    plan = cur.fetchone()
+    
+    if not plan:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Plan not found'})
         }
-        proxies.append(proxy)
     
-    return proxies
+    total_price = Decimal(str(plan['price_per_month'])) * req.quantity * req.duration_months
+    
+    cur.execute(
+        'UPDATE users SET balance_usd = balance_usd - %s WHERE id = %s AND balance_usd >= %s RETURNING balance_usd',
+        (total_price, req.user_id, total_price)
+    )
+    user = cur.fetchone()
+    
+    if not user:
+        cur.execute('SELECT 1 FROM users WHERE id = %s', (req.user_id,))
+        if not cur.fetchone():
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': serialize_body({'success': False, 'error': 'User not found'})
+            }
+        
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Insufficient balance'})
+        }
+    
+    expires_at = datetime.now() + timedelta(days=30 * req.duration_months)
+    
+    cur.execute(
+        '''INSERT INTO proxy_orders 
+           (user_id, plan_id, location, quantity, duration_months, total_price, expires_at) 
+           VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id, total_price''',
+        (req.user_id, req.plan_id, req.location, req.quantity, req.duration_months, 
+         float(total_price), expires_at)
+    )
+    order = cur.fetchone()
+    order_id = order['id']
+    
+    provision_started = time.perf_counter()
+    proxies = allocate_proxy_credentials(cur, order_id, req.location, plan['type'], req.quantity)
+    
+    if len(proxies) < req.quantity:
+        conn.rollback()
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Not enough proxies available in this location'})
+        }
+    
+    apply_revenue(cur, req.plan_id, req.location, req.quantity, order['total_price'])
+    provision_ms = round((time.perf_counter() - provision_started) * 1000, 1)
+    print(json.dumps({'event': 'proxy_provisioned', 'order_id': order_id, 'quantity': req.quantity, 'provision_ms': provision_ms}))
+    
+    result = {
+        'success': True,
+        'order_id': order_id,
+        'message': 'Proxy purchased successfully',
+        'balance_usd': float(user['balance_usd']),
+        'quantity': req.quantity,
+        'provision_ms': provision_ms
+    }
+    if req.quantity <= PROXY_INLINE_LIMIT:
+        result['proxies'] = proxies
+    else:
+        result['credentials_ref'] = credentials_ref(order_id, req.user_id)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body(result)
+    }
+
+def apply_revenue(cur, plan_id: int, location: str, quantity: int, total_price: Decimal):
+    # Вызывается в транзакции покупки до commit, чтобы агрегат фиксировался вместе с заказом;
+    # total_price берётся из RETURNING, чтобы округление совпадало с таблицей
+    cur.execute(
+        '''INSERT INTO proxy_revenue (plan_id, location, orders, proxies, revenue_usd) VALUES (%s, %s, 1, %s, %s)
+           ON CONFLICT (plan_id, location) DO UPDATE SET
+               orders = proxy_revenue.orders + EXCLUDED.orders,
+               proxies = proxy_revenue.proxies + EXCLUDED.proxies,
+               revenue_usd = proxy_revenue.revenue_usd + EXCLUDED.revenue_usd,
+               updated_at = CURRENT_TIMESTAMP''',
+        (plan_id, location, quantity, total_price)
+    )
+
+IDEMPOTENCY_SCOPE = 'proxy'
+GET_ACTIONS = ('orders', 'credentials', 'export', 'stats')
+USER_ACTIONS = ('orders', 'credentials', 'export')
 
+def parse_post_request(event: Dict[str, Any]) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+    body_data, error = parse_json_body(event)
+    if error:
+        return None, error
+    
+    from pydantic import ValidationError
+    from models import PurchaseRequest
+    
+    try:
+        return parse_request(PurchaseRequest, body_data), None
+    except ValidationError as e:
+        return None, error_response(400, 'Invalid purchase', e.errors(include_url=False, include_context=False))
+
+def parse_get_request(params: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    action = params.get('action', 'plans')
+    if action not in GET_ACTIONS:
+        return None, error_response(400, 'Unknown action')
+    
+    query: Dict[str, Any] = {'action': action, 'user_id': params.get('user_id')}
+    if action in USER_ACTIONS:
+        try:
+            query['user_id'] = int(params.get('user_id') or '')
+        except ValueError:
+            return None, error_response(400, 'user_id must be an integer')
+    
+    if action == 'orders':
+        query['summary'] = params.get('summary') in ('1', 'true')
+        query['include_expired'] = params.get('include_expired') in ('1', 'true')
+        try:
+            query['limit'] = min(max(int(params.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_MAX_PAGE_SIZE)
+            query['cursor'] = decode_cursor(params.get('cursor'))
+        except ValueError:
+            return None, error_response(400, 'Invalid limit or cursor')
+        query['format'] = params.get('format', 'json')
+        if query['format'] not in ('json', 'columnar'):
+            return None, error_response(400, 'Unsupported format')
+    
+    elif action == 'credentials':
+        try:
+            query['order_id'] = int(params.get('order_id', ''))
+            query['limit'] = min(max(int(params.get('limit', PROXY_INLINE_LIMIT)), 1), CREDENTIALS_MAX_PAGE_SIZE)
+            query['after_id'] = int(params.get('cursor', 0))
+        except ValueError:
+            return None, error_response(400, 'Invalid order_id, limit or cursor')
+    
+    elif action == 'export':
+        query['format'] = params.get('format', 'ndjson')
+        try:
+            if query['format'] not in ('ndjson', 'csv'):
+                raise ValueError('Unsupported format')
+            query['after_id'] = int(params.get('cursor', 0))
+        except ValueError:
+            return None, error_response(400, 'Invalid format or cursor')
+    
+    return query, None
+
+@instrument_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if is_timer_trigger(event):
+        return run_expiry_sweep()
+    
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -58,64 +496,127 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Admin-Token, If-None-Match, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('action', 'plans') == 'plans':
+        return get_plans_response(event)
+    
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'error': 'Method not allowed'})
+        }
+    
+    idempotency_key = None
+    if method == 'POST':
+        idempotency_key, error = parse_idempotency_key(event)
+        if error:
+            return error
+        parsed, error = parse_post_request(event)
+        user_id = parsed.user_id if parsed else None
+    else:
+        parsed, error = parse_get_request(event.get('queryStringParameters') or {})
+        user_id = parsed['user_id'] if parsed else None
+    if error:
+        return error
+    
+    throttled = admit_request(client_key(event))
+    if throttled:
+        return throttled
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            action = params.get('action', 'plans')
+            query = parsed
+            action = query['action']
             
-            if action == 'plans':
-                cur.execute('SELECT * FROM proxy_plans ORDER BY price_per_month')
-                plans = cur.fetchall()
-                
-                result = []
-                for plan in plans:
-                    result.append({
-                        'id': plan['id'],
-                        'name': plan['name'],
-                        'type': plan['type'],
-                        'description': plan['description'],
-                        'price_per_month': float(plan['price_per_month']),
-                        'max_connections': plan['max_connections'],
-                        'speed': plan['speed'],
-                        'locations': plan['locations']
-                    })
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(result)
-                }
+            auth_error = authorize_admin(event) if action == 'stats' else authorize_request(cur, event, user_id)
+            if auth_error:
+                return auth_error
             
-            elif action == 'orders':
-                user_id = params.get('user_id')
+            if action == 'orders':
+                summary_only, limit, cursor = query['summary'], query['limit'], query['cursor']
+                
+                conditions = ['po.user_id = %s']
+                query_params: List[Any] = [user_id]
+                if not query['include_expired']:
+                    conditions.append("po.status = 'active' AND po.expires_at > CURRENT_TIMESTAMP")
+                if cursor:
+                    conditions.append('(po.created_at, po.id) < (%s, %s)')
+                    query_params.extend(cursor)
+                query_params.append(limit + 1)
                 
-                cur.execute('''
-                    SELECT po.*, pp.name as plan_name, pp.type as plan_type
-                    FROM proxy_orders po
-                    JOIN proxy_plans pp ON po.plan_id = pp.id
-                    WHERE po.user_id = %s
-                    ORDER BY po.created_at DESC
-                ''', (user_id,))
+                cur.execute(
+                    '''SELECT po.*, pp.name as plan_name, pp.type as plan_type
+                       FROM proxy_orders po
+                       JOIN proxy_plans pp ON po.plan_id = pp.id
+                       WHERE ''' + ' AND '.join(conditions) + '''
+                       ORDER BY po.created_at DESC, po.id DESC
+                       LIMIT %s''',
+                    query_params
+                )
                 orders = cur.fetchall()
                 
-                result = []
-                for order in orders:
+                next_cursor = None
+                if len(orders) > limit:
+                    orders = orders[:limit]
+                    next_cursor = encode_cursor(orders[-1]['created_at'], orders[-1]['id'])
+                
+                credentials = []
+                inline_ids = [order['id'] for order in orders if order['quantity'] <= PROXY_INLINE_LIMIT]
+                if not summary_only and inline_ids:
                     cur.execute(
-                        'SELECT * FROM proxy_credentials WHERE order_id = %s',
-                        (order['id'],)
+                        '''SELECT order_id, proxy_host AS host, proxy_port AS port, proxy_username AS username,
+                                  CASE WHEN status = 'active' THEN proxy_password END AS password, location, status
+                           FROM proxy_credentials WHERE order_id = ANY(%s) ORDER BY order_id, id''',
+                        (inline_ids,)
                     )
                     credentials = cur.fetchall()
-                    
-                    result.append({
+                
+                headers = {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'X-Next-Cursor'
+                }
+                if next_cursor:
+                    headers['X-Next-Cursor'] = next_cursor
+                
+                if query['format'] == 'columnar':
+                    # Креды отдаются отдельной таблицей с order_id вместо вложенных списков
+                    payload = columnar(orders, ORDER_COLUMNS)
+                    if not summary_only:
+                        payload['columns']['credentials_ref'] = [
+                            credentials_ref(order['id'], user_id) if order['quantity'] > PROXY_INLINE_LIMIT else None
+                            for order in orders
+                        ]
+                        payload['proxies'] = columnar(credentials, CREDENTIAL_COLUMNS)
+                    return compress_response(event, {
+                        'statusCode': 200,
+                        'headers': headers,
+                        'body': serialize_body(payload, compact=True)
+                    })
+                
+                credentials_by_order: Dict[int, List[Dict[str, Any]]] = {}
+                for cred in credentials:
+                    credentials_by_order.setdefault(cred['order_id'], []).append({
+                        'host': cred['host'],
+                        'port': cred['port'],
+                        'username': cred['username'],
+                        'password': cred['password'],
+                        'location': cred['location'],
+                        'status': cred['status']
+                    })
+                
+                result = []
+                for order in orders:
+                    item = {
                         'id': order['id'],
                         'plan_name': order['plan_name'],
                         'plan_type': order['plan_type'],
@@ -125,105 +626,125 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'total_price': float(order['total_price']),
                         'status': order['status'],
                         'expires_at': order['expires_at'].isoformat() if order['expires_at'] else None,
-                        'created_at': order['created_at'].isoformat() if order['created_at'] else None,
-                        'proxies': [
-                            {
-                                'host': cred['proxy_host'],
-                                'port': cred['proxy_port'],
-                                'username': cred['proxy_username'],
-                                'password': cred['proxy_password'],
-                                'location': cred['location'],
-                                'status': cred['status']
-                            }
-                            for cred in credentials
-                        ]
-                    })
+                        'created_at': order['created_at'].isoformat() if order['created_at'] else None
+                    }
+                    if not summary_only and order['quantity'] > PROXY_INLINE_LIMIT:
+                        item['credentials_ref'] = credentials_ref(order['id'], user_id)
+                    elif not summary_only:
+                        item['proxies'] = credentials_by_order.get(order['id'], [])
+                    result.append(item)
                 
-                return {
+                return compress_response(event, {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(result)
-                }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            req = PurchaseRequest(**body_data)
-            
-            cur.execute('SELECT * FROM proxy_plans WHERE id = %s', (req.plan_id,))
-            plan = cur.fetchone()
+                    'headers': headers,
+                    'body': serialize_body(result)
+                })
             
-            if not plan:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': False, 'error': 'Plan not found'})
+            elif action == 'credentials':
+                order_id, limit, after_id = query['order_id'], query['limit'], query['after_id']
+                
+                # Пароль отдаётся только активным учётным данным: эндпоинт истёкшего заказа уже продаётся снова
+                cur.execute(
+                    '''SELECT pc.id, pc.proxy_host, pc.proxy_port, pc.proxy_username,
+                              CASE WHEN pc.status = 'active' THEN pc.proxy_password END AS proxy_password, pc.location, pc.status
+                       FROM proxy_credentials pc
+                       JOIN proxy_orders po ON pc.order_id = po.id
+                       WHERE po.id = %s AND po.user_id = %s AND pc.id > %s
+                       ORDER BY pc.id
+                       LIMIT %s''',
+                    (order_id, user_id, after_id, limit + 1)
+                )
+                credentials = cur.fetchall()
+                
+                headers = {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'X-Next-Cursor'
                 }
-            
-            cur.execute('SELECT balance_usd FROM users WHERE id = %s', (req.user_id,))
-            user = cur.fetchone()
-            
-            if not user:
+                if len(credentials) > limit:
+                    credentials = credentials[:limit]
+                    headers['X-Next-Cursor'] = str(credentials[-1]['id'])
+                
                 return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': False, 'error': 'User not found'})
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': serialize_body([
+                        {
+                            'host': cred['proxy_host'],
+                            'port': cred['proxy_port'],
+                            'username': cred['proxy_username'],
+                            'password': cred['proxy_password'],
+                            'location': cred['location'],
+                            'status': cred['status']
+                        }
+                        for cred in credentials
+                    ])
                 }
             
-            total_price = Decimal(str(plan['price_per_month'])) * req.quantity * req.duration_months
+            elif action == 'export':
+                fmt, after_id = query['format'], query['after_id']
+                
+                export_cur = conn.cursor(name='credentials_export')
+                export_cur.itersize = EXPORT_ITERSIZE
+                try:
+                    export_cur.execute(
+                        '''SELECT pc.id, pc.order_id, pc.proxy_host AS host, pc.proxy_port AS port,
+                                  pc.proxy_username AS username, CASE WHEN pc.status = 'active' THEN pc.proxy_password END AS password,
+                                  pc.location, pc.status
+                           FROM proxy_credentials pc
+                           JOIN proxy_orders po ON pc.order_id = po.id
+                           WHERE po.user_id = %s AND pc.id > %s
+                           ORDER BY pc.id''',
+                        (user_id, after_id)
+                    )
+                    body, count, last_row = write_export(export_cur, EXPORT_COLUMNS, fmt, EXPORT_MAX_ROWS, EXPORT_MAX_BYTES)
+                finally:
+                    export_cur.close()
+                
+                return export_response(body, fmt, count, str(last_row['id']) if last_row else None)
             
-            if Decimal(str(user['balance_usd'])) < total_price:
+            elif action == 'stats':
+                cur.execute(
+                    '''SELECT pr.plan_id, pp.name AS plan_name, pr.location, pr.orders, pr.proxies, pr.revenue_usd
+                       FROM proxy_revenue pr
+                       JOIN proxy_plans pp ON pp.id = pr.plan_id
+                       ORDER BY pr.plan_id, pr.location'''
+                )
+                revenue = cur.fetchall()
+                
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': False, 'error': 'Insufficient balance'})
+                    'body': serialize_body({
+                        'revenue': [
+                            {
+                                'plan_id': row['plan_id'],
+                                'plan_name': row['plan_name'],
+                                'location': row['location'],
+                                'orders': row['orders'],
+                                'proxies': row['proxies'],
+                                'revenue_usd': float(row['revenue_usd'])
+                            }
+                            for row in revenue
+                        ],
+                        'total_usd': float(sum((row['revenue_usd'] for row in revenue), Decimal('0')))
+                    })
                 }
+        
+        else:
+            req = parsed
             
-            expires_at = datetime.now() + timedelta(days=30 * req.duration_months)
-            
-            cur.execute(
-                '''INSERT INTO proxy_orders 
-                   (user_id, plan_id, location, quantity, duration_months, total_price, expires_at) 
-                   VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id''',
-                (req.user_id, req.plan_id, req.location, req.quantity, req.duration_months, 
-                 float(total_price), expires_at)
-            )
-            order_id = cur.fetchone()['id']
-            
-            cur.execute(
-                'UPDATE users SET balance_usd = balance_usd - %s WHERE id = %s',
-                (float(total_price), req.user_id)
-            )
-            
-            proxies = generate_proxy_credentials(req.location, req.quantity)
+            auth_error = authorize_request(cur, event, req.user_id)
+            if auth_error:
+                return auth_error
             
-            for proxy in proxies:
-                cur.execute(
-                    '''INSERT INTO proxy_credentials 
-                       (order_id, proxy_host, proxy_port, proxy_username, proxy_password, location) 
-                       VALUES (%s, %s, %s, %s, %s, %s)''',
-                    (order_id, proxy['host'], proxy['port'], proxy['username'], 
-                     proxy['password'], req.location)
+            if idempotency_key:
+                return run_idempotent(
+                    conn, cur, IDEMPOTENCY_SCOPE, req.user_id, idempotency_key, request_fingerprint('purchase', req),
+                    lambda: purchase_proxies(conn, cur, req)
                 )
-            
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'success': True,
-                    'order_id': order_id,
-                    'message': 'Proxy purchased successfully',
-                    'proxies': proxies
-                })
-            }
+            return commit_write(conn, purchase_proxies(conn, cur, req))
     
     finally:
         cur.close()
-        conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+        release_db_connection(conn)
@@ -0,0 +1,15 @@
+'''
+Схемы запросов функции proxy. Импортируются лениво при покупке,
+чтобы OPTIONS и список тарифов не загружали pydantic.
+'''
+import os
+from pydantic import BaseModel, Field
+
+PROXY_MAX_QUANTITY = int(os.environ.get('PROXY_MAX_QUANTITY', '50000'))
+
+class PurchaseRequest(BaseModel):
+    user_id: int
+    plan_id: int
+    location: str
+    quantity: int = Field(..., gt=0, le=PROXY_MAX_QUANTITY)
+    duration_months: int = Field(..., gt=0, le=12)
@@ -0,0 +1,107 @@
+'''
+Истечение заказов прокси порциями: заказ, его учётные данные и эндпоинты пула
+обновляются функцией expire_proxy_orders() с FOR UPDATE SKIP LOCKED, поэтому воркеры
+можно запускать параллельно. Затем удаляются просроченные ключи идемпотентности и сессии.
+Вызывается таймер-триггером функции proxy или вручную:
+DATABASE_URL=... python backend/proxy/sweeper.py --workers 4 --batch-size 500
+'''
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', '500'))
+SWEEP_MAX_BATCHES = int(os.environ.get('SWEEP_MAX_BATCHES', '200'))
+
+def sweep_expired_orders(conn, batch_size: int = SWEEP_BATCH_SIZE, max_batches: int = SWEEP_MAX_BATCHES) -> Dict[str, Any]:
+    totals = {'batches': 0, 'orders': 0, 'credentials': 0, 'inventory': 0}
+    started = time.perf_counter()
+    
+    cur = conn.cursor()
+    try:
+        while totals['batches'] < max_batches:
+            cur.execute('SELECT orders, credentials, inventory FROM expire_proxy_orders(%s)', (batch_size,))
+            row = cur.fetchone()
+            conn.commit()
+            
+            totals['batches'] += 1
+            for key in ('orders', 'credentials', 'inventory'):
+                totals[key] += row[key]
+            if row['orders'] < batch_size:
+                break
+    finally:
+        cur.close()
+    
+    elapsed = time.perf_counter() - started
+    rows = totals['orders'] + totals['credentials'] + totals['inventory']
+    totals['elapsed_ms'] = round(elapsed * 1000, 1)
+    totals['rows_per_sec'] = round(rows / elapsed, 1) if elapsed else 0.0
+    return totals
+
+# Просроченные ключи идемпотентности и сессии больше не читаются (запросы фильтруют по expires_at),
+# поэтому удаляются порциями по индексу expires_at, чтобы таблицы не росли бесконечно
+PURGE_TABLES = ('idempotency_keys', 'sessions')
+
+def purge_expired_rows(conn, batch_size: int = SWEEP_BATCH_SIZE, max_batches: int = SWEEP_MAX_BATCHES) -> Dict[str, int]:
+    purged = {table: 0 for table in PURGE_TABLES}
+    
+    cur = conn.cursor()
+    try:
+        for table in PURGE_TABLES:
+            for _ in range(max_batches):
+                cur.execute(
+                    f'''DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+                           SELECT ctid FROM {table} WHERE expires_at < CURRENT_TIMESTAMP LIMIT %s FOR UPDATE SKIP LOCKED))''',
+                    (batch_size,)
+                )
+                deleted = cur.rowcount
+                conn.commit()
+                
+                purged[table] += deleted
+                if deleted < batch_size:
+                    break
+    finally:
+        cur.close()
+    return purged
+
+def main():
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    
+    parser = argparse.ArgumentParser(description='Expire proxy orders whose term has ended')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, default=SWEEP_MAX_BATCHES)
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    
+    def worker(_):
+        conn = psycopg2.connect(args.dsn, cursor_factory=RealDictCursor)
+        try:
+            return sweep_expired_orders(conn, args.batch_size, args.max_batches)
+        finally:
+            conn.close()
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(worker, range(args.workers)))
+    elapsed = time.perf_counter() - started
+    
+    report = {key: sum(result[key] for result in results) for key in ('batches', 'orders', 'credentials', 'inventory')}
+    report['workers'] = args.workers
+    report['elapsed_ms'] = round(elapsed * 1000, 1)
+    report['rows_per_sec'] = round((report['orders'] + report['credentials'] + report['inventory']) / elapsed, 1) if elapsed else 0.0
+    conn = psycopg2.connect(args.dsn, cursor_factory=RealDictCursor)
+    try:
+        report['purged'] = purge_expired_rows(conn, args.batch_size, args.max_batches)
+    finally:
+        conn.close()
+    print(json.dumps({'event': 'proxy_sweep', **report}))
+
+if __name__ == '__main__':
+    main()
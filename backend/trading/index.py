@@ -4,26 +4,957 @@ Args: event - dict с httpMethod, body, queryStringParameters, headers
       context - объект с request_id, function_name
 Returns: HTTP response dict с результатом операции
 '''
+import csv
+import io
+import gzip
 import json
 import os
-from typing import Dict, Any
-from decimal import Decimal
-from pydantic import BaseModel, Field, ValidationError
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-class TradeRequest(BaseModel):
-    user_id: int
-    action: str = Field(..., pattern='^(buy|sell)$')
-    symbol: str
-    amount: float = Field(..., gt=0)
-    price_usd: float = Field(..., gt=0)
-
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+import time
+import random
+import base64
+import binascii
+from typing import Dict, Any, List, Tuple, Optional
+from decimal import Decimal, ROUND_DOWN
+from datetime import datetime
+from orderbook import OrderBook, Order, Fill, PRICE_SCALE, AMOUNT_SCALE
+from db import instrument_handler, record_phase, parse_request, serialize_body, get_db_connection, release_db_connection
+from access import (
+    admit_request, client_key, authorize_request, authorize_admin, error_response,
+    parse_idempotency_key, request_fingerprint, run_idempotent
+)
 
+BATCH_MAX_TRADES = int(os.environ.get('BATCH_MAX_TRADES', '500'))
+ORDER_BOOK_DEPTH = 50
+PORTFOLIO_FETCH_SIZE = int(os.environ.get('PORTFOLIO_FETCH_SIZE', '50000'))
+PORTFOLIO_LATE_COMMIT_WINDOW = int(os.environ.get('PORTFOLIO_LATE_COMMIT_WINDOW', '10000'))
+MARKET_TICK_CAPACITY = int(os.environ.get('MARKET_TICK_CAPACITY', '4096'))
+MARKET_CANDLE_CAPACITY = int(os.environ.get('MARKET_CANDLE_CAPACITY', '1440'))
+MARKET_SLIPPAGE_BAND = float(os.environ.get('MARKET_SLIPPAGE_BAND', '0.02'))
+MARKET_SYNC_INTERVAL = float(os.environ.get('MARKET_SYNC_INTERVAL', '1'))
+MARKET_SYNC_BATCH = int(os.environ.get('MARKET_SYNC_BATCH', '10000'))
+MARKET_BACKFILL_ROWS = int(os.environ.get('MARKET_BACKFILL_ROWS', '50000'))
+MARKET_LATE_COMMIT_WINDOW = int(os.environ.get('MARKET_LATE_COMMIT_WINDOW', '1000'))
+MARKET_REPLAY_FILE = os.environ.get('MARKET_REPLAY_FILE')
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '50'))
+HISTORY_MAX_PAGE_SIZE = 500
+STATS_MAX_DAYS = 90
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '20000'))
+# Тело ответа функции ограничено платформой (3.5 МБ): страница экспорта закрывается, как только
+# достигает этого размера, остальное отдаётся следующими страницами по X-Next-Cursor
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+EXPORT_COLUMNS = ['id', 'type', 'symbol', 'amount', 'price_usd', 'total_usd', 'created_at']
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+def columnar(rows: List[Dict[str, Any]], columns: List[str]) -> Dict[str, Any]:
+    # Один массив на колонку вместо словаря на строку; Decimal и datetime остаются как есть до serialize_body
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'columns': {column: [row[column] for row in rows] for column in columns}
+    }
+
+_brotli_state: Dict[str, Any] = {'available': None}
+
+def _brotli_available() -> bool:
+    if _brotli_state['available'] is None:
+        import importlib.util
+        _brotli_state['available'] = importlib.util.find_spec('brotli') is not None
+    return _brotli_state['available']
+
+def negotiate_encoding(event: Dict[str, Any]) -> Optional[str]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    accepted: Dict[str, float] = {}
+    for part in (headers.get('accept-encoding') or '').split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = q
+    
+    for encoding in ('br', 'gzip'):
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0 and (encoding != 'br' or _brotli_available()):
+            return encoding
+    return None
+
+def compress_body(body: str, encoding: str) -> str:
+    started = time.perf_counter()
+    raw = body.encode()
+    if encoding == 'br':
+        import brotli
+        data = brotli.compress(raw, quality=RESPONSE_BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=RESPONSE_GZIP_LEVEL)
+    record_phase('compression', started)
+    return base64.b64encode(data).decode()
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    response['headers'] = dict(response['headers'], Vary='Accept-Encoding')
+    encoding = negotiate_encoding(event)
+    if not encoding or len(response['body']) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+    
+    response['headers']['Content-Encoding'] = encoding
+    response['body'] = compress_body(response['body'], encoding)
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def write_export(export_cur, columns: List[str], fmt: str, max_rows: int, max_bytes: int) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    
+    count = 0
+    last_row = None
+    has_more = False
+    for row in export_cur:
+        if count == max_rows or buffer.tell() >= max_bytes:
+            has_more = True
+            break
+        values = [_export_value(row[column]) for column in columns]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        count += 1
+        last_row = row
+    
+    return buffer.getvalue(), count, last_row if has_more else None
+
+def export_response(body: str, fmt: str, count: int, next_cursor: Optional[str]) -> Dict[str, Any]:
+    headers = {
+        'Content-Type': 'text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Export-Rows',
+        'X-Export-Rows': str(count)
+    }
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body
+    }
+
+def trade_rejected_response(cur, user_id: int, error: str) -> Dict[str, Any]:
+    cur.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
+    if not cur.fetchone():
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'User not found'})
+        }
+    
+    return {
+        'statusCode': 400,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({'success': False, 'error': error})
+    }
+
+_order_books: Dict[str, OrderBook] = {}
+
+def to_ticks(value: Any, scale: int) -> int:
+    return int(Decimal(str(value)).scaleb(scale).to_integral_value(ROUND_DOWN))
+
+def from_ticks(value: int, scale: int) -> Decimal:
+    return Decimal(value).scaleb(-scale)
+
+def load_order_book(cur, symbol: str, version: int) -> OrderBook:
+    book = _order_books.get(symbol)
+    if book is not None and book.version == version:
+        return book
+    
+    book = OrderBook(symbol)
+    cur.execute(
+        "SELECT id, user_id, side, price_usd, remaining, reserved_usd FROM orders WHERE symbol = %s AND status IN ('open', 'partial') ORDER BY id",
+        (symbol,)
+    )
+    for row in cur.fetchall():
+        book.rest(Order(
+            row['id'],
+            row['user_id'],
+            row['side'],
+            to_ticks(row['price_usd'], PRICE_SCALE),
+            to_ticks(row['remaining'], AMOUNT_SCALE),
+            to_ticks(row['reserved_usd'], PRICE_SCALE)
+        ))
+    book.version = version
+    _order_books[symbol] = book
+    return book
+
+def lock_order_book(cur, symbol: str) -> OrderBook:
+    cur.execute(
+        "INSERT INTO order_book_state (symbol) VALUES (%s) ON CONFLICT (symbol) DO UPDATE SET version = order_book_state.version + 1 RETURNING version",
+        (symbol,)
+    )
+    version = cur.fetchone()['version']
+    book = load_order_book(cur, symbol, version - 1)
+    book.version = version
+    return book
+
+def settle_fills(cur, symbol: str, fills: List[Fill]):
+    from psycopg2.extras import execute_values
+    usd: Dict[int, int] = {}
+    crypto: Dict[int, int] = {}
+    touched: Dict[int, Order] = {}
+    tx_rows = []
+    
+    for fill in fills:
+        buy, sell = (fill.taker, fill.maker) if fill.taker.side == 'buy' else (fill.maker, fill.taker)
+        cost = fill.price * fill.amount // 10 ** AMOUNT_SCALE
+        buy.reserved -= cost
+        crypto[buy.user_id] = crypto.get(buy.user_id, 0) + fill.amount
+        usd[sell.user_id] = usd.get(sell.user_id, 0) + cost
+        touched[fill.maker.id] = fill.maker
+        touched[fill.taker.id] = fill.taker
+        
+        amount = from_ticks(fill.amount, AMOUNT_SCALE)
+        price = from_ticks(fill.price, PRICE_SCALE)
+        total = from_ticks(cost, PRICE_SCALE)
+        tx_rows.append((buy.user_id, 'buy', symbol, amount, price, total))
+        tx_rows.append((sell.user_id, 'sell', symbol, amount, price, total))
+    
+    for order in touched.values():
+        if order.side == 'buy' and not order.remaining and order.reserved:
+            usd[order.user_id] = usd.get(order.user_id, 0) + order.reserved
+            order.reserved = 0
+    
+    if usd:
+        execute_values(
+            cur,
+            "UPDATE users u SET balance_usd = u.balance_usd + v.delta FROM (VALUES %s) AS v(id, delta) WHERE u.id = v.id",
+            [(user_id, from_ticks(cents, PRICE_SCALE)) for user_id, cents in sorted(usd.items())],
+            template='(%s, %s::numeric)'
+        )
+    
+    if crypto:
+        execute_values(
+            cur,
+            "INSERT INTO crypto_balances (user_id, symbol, amount) VALUES %s ON CONFLICT (user_id, symbol) DO UPDATE SET amount = crypto_balances.amount + EXCLUDED.amount",
+            [(user_id, symbol, from_ticks(units, AMOUNT_SCALE)) for user_id, units in sorted(crypto.items())]
+        )
+    
+    inserted = []
+    if tx_rows:
+        inserted = execute_values(
+            cur,
+            "INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd) VALUES %s RETURNING type, symbol, amount, total_usd, created_at",
+            tx_rows,
+            page_size=len(tx_rows),
+            fetch=True
+        )
+    
+    if touched:
+        execute_values(
+            cur,
+            "UPDATE orders o SET remaining = v.remaining, reserved_usd = v.reserved, status = v.status, updated_at = CURRENT_TIMESTAMP FROM (VALUES %s) AS v(id, remaining, reserved, status) WHERE o.id = v.id",
+            [
+                (
+                    order.id,
+                    from_ticks(order.remaining, AMOUNT_SCALE),
+                    from_ticks(order.reserved, PRICE_SCALE),
+                    'partial' if order.remaining else 'filled'
+                )
+                for _, order in sorted(touched.items())
+            ],
+            template='(%s, %s::numeric, %s::numeric, %s)'
+        )
+    
+    return inserted
+
+def place_limit_order(conn, cur, req) -> Dict[str, Any]:
+    price = to_ticks(req.price_usd, PRICE_SCALE)
+    amount = to_ticks(req.amount, AMOUNT_SCALE)
+    
+    if not price or not amount:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Price or amount below minimum tick'})
+        }
+    
+    reserved = -(-price * amount // 10 ** AMOUNT_SCALE) if req.side == 'buy' else 0
+    
+    # Порядок блокировок: стакан символа, строки users по возрастанию id, затем crypto_balances —
+    # тот же, что у execute_trade и пакетных сделок, поэтому встречные транзакции не образуют цикла.
+    # Фиксирует транзакцию handler; если она не зафиксируется, он сбрасывает стакан в памяти
+    book = lock_order_book(cur, req.symbol)
+    cur.execute("SELECT nextval(pg_get_serial_sequence('orders', 'id')) AS id")
+    order = Order(cur.fetchone()['id'], req.user_id, req.side, price, amount, reserved)
+    fills = book.add(order)
+    cur.execute(
+        "SELECT id FROM users WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+        (sorted({req.user_id} | {fill.maker.user_id for fill in fills}),)
+    )
+    
+    if req.side == 'buy':
+        cur.execute(
+            "UPDATE users SET balance_usd = balance_usd - %s WHERE id = %s AND balance_usd >= %s RETURNING balance_usd",
+            (from_ticks(reserved, PRICE_SCALE), req.user_id, from_ticks(reserved, PRICE_SCALE))
+        )
+        error = None if cur.fetchone() else 'Insufficient balance'
+    else:
+        cur.execute(
+            "UPDATE crypto_balances SET amount = amount - %s WHERE user_id = %s AND symbol = %s AND amount >= %s RETURNING amount",
+            (from_ticks(amount, AMOUNT_SCALE), req.user_id, req.symbol, from_ticks(amount, AMOUNT_SCALE))
+        )
+        error = None if cur.fetchone() else 'Insufficient crypto balance'
+    
+    if error:
+        # book.add уже изменил стакан в памяти: он перечитывается из БД при следующей заявке
+        _order_books.pop(req.symbol, None)
+        conn.rollback()
+        return trade_rejected_response(cur, req.user_id, error)
+    
+    cur.execute(
+        "INSERT INTO orders (id, user_id, symbol, side, price_usd, amount, remaining, reserved_usd) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        (order.id, req.user_id, req.symbol, req.side, from_ticks(price, PRICE_SCALE), from_ticks(amount, AMOUNT_SCALE),
+         from_ticks(amount, AMOUNT_SCALE), from_ticks(reserved, PRICE_SCALE))
+    )
+    tx_rows = settle_fills(cur, req.symbol, fills)
+    held = sum((row['amount'] for row in tx_rows if row['type'] == 'buy'), Decimal('0'))
+    if req.side == 'sell':
+        held -= from_ticks(amount, AMOUNT_SCALE)
+    apply_rollups(cur, tx_rows, {req.symbol: held})
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({
+            'success': True,
+            'order_id': order.id,
+            'status': ('partial' if order.remaining else 'filled') if fills else 'open',
+            'filled': float(from_ticks(amount - order.remaining, AMOUNT_SCALE)),
+            'remaining': float(from_ticks(order.remaining, AMOUNT_SCALE)),
+            'fills': [
+                {
+                    'price_usd': float(from_ticks(fill.price, PRICE_SCALE)),
+                    'amount': float(from_ticks(fill.amount, AMOUNT_SCALE))
+                }
+                for fill in fills
+            ]
+        })
+    }
+
+def cancel_limit_order(conn, cur, req) -> Dict[str, Any]:
+    cur.execute("SELECT symbol FROM orders WHERE id = %s AND user_id = %s", (req.order_id, req.user_id))
+    row = cur.fetchone()
+    
+    if not row:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Order not found'})
+        }
+    
+    symbol = row['symbol']
+    book = lock_order_book(cur, symbol)
+    cur.execute(
+        "UPDATE orders SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP WHERE id = %s AND status IN ('open', 'partial') RETURNING side, remaining, reserved_usd",
+        (req.order_id,)
+    )
+    cancelled = cur.fetchone()
+    
+    if not cancelled:
+        # Ответ 400 откатывает и увеличение версии стакана, поэтому копия в памяти больше не совпадает с БД
+        _order_books.pop(symbol, None)
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Order is not open'})
+        }
+    
+    book.cancel(req.order_id)
+    if cancelled['side'] == 'buy':
+        cur.execute(
+            "UPDATE users SET balance_usd = balance_usd + %s WHERE id = %s",
+            (cancelled['reserved_usd'], req.user_id)
+        )
+    else:
+        cur.execute("SELECT 1 FROM users WHERE id = %s FOR UPDATE", (req.user_id,))
+        cur.execute(
+            "UPDATE crypto_balances SET amount = amount + %s WHERE user_id = %s AND symbol = %s",
+            (cancelled['remaining'], req.user_id, symbol)
+        )
+        apply_rollups(cur, [], {symbol: cancelled['remaining']})
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({'success': True, 'order_id': req.order_id, 'status': 'cancelled'})
+    }
+
+def load_portfolio_trades(conn, user_id: int, after_id: int, since: Optional[datetime] = None):
+    import numpy as np
+    import psycopg2
+    ids, symbols, is_buy, amounts, prices = [], [], [], [], []
+    
+    trades_cur = conn.cursor(name='portfolio_trades', cursor_factory=psycopg2.extensions.cursor)
+    try:
+        trades_cur.execute(
+            "SELECT id, symbol, type = 'buy', amount::float8, price_usd::float8 FROM transactions WHERE user_id = %s AND id > %s AND created_at >= %s ORDER BY id",
+            (user_id, after_id, since or datetime.min)
+        )
+        while True:
+            rows = trades_cur.fetchmany(PORTFOLIO_FETCH_SIZE)
+            if not rows:
+                break
+            chunk_ids, chunk_symbols, chunk_buys, chunk_amounts, chunk_prices = zip(*rows)
+            ids.append(np.fromiter(chunk_ids, dtype=np.int64, count=len(rows)))
+            symbols.append(np.array(chunk_symbols))
+            is_buy.append(np.fromiter(chunk_buys, dtype=bool, count=len(rows)))
+            amounts.append(np.fromiter(chunk_amounts, dtype=np.float64, count=len(rows)))
+            prices.append(np.fromiter(chunk_prices, dtype=np.float64, count=len(rows)))
+    finally:
+        trades_cur.close()
+    
+    if not ids:
+        return None
+    return np.concatenate(ids), np.concatenate(symbols), np.concatenate(is_buy), np.concatenate(amounts), np.concatenate(prices)
+
+def position_state(row: Dict[str, Any]):
+    from portfolio import PositionState
+    return PositionState(
+        row['position'], row['avg_cost'], row['realized_pnl_avg'], row['realized_pnl_fifo'],
+        row['last_price'], row['fifo_lot_amounts'], row['fifo_lot_prices']
+    )
+
+def refresh_portfolio(conn, cur, user_id: int, recompute: bool) -> Dict[str, Any]:
+    from psycopg2.extras import execute_values
+    from portfolio import PositionState, apply_trades, split_by_symbol
+    
+    cur.execute(
+        "SELECT * FROM portfolio_snapshots WHERE user_id = %s ORDER BY symbol FOR UPDATE",
+        (user_id,)
+    )
+    snapshots = cur.fetchall()
+    cur.execute("SELECT * FROM portfolio_openings WHERE user_id = %s ORDER BY symbol", (user_id,))
+    openings = cur.fetchall()
+    
+    # Сделки до границы архива есть только в открывающих позициях: снимок, не дошедший до последней
+    # заархивированной сделки, продолжить нельзя, и расчёт начинается с открывающих позиций
+    if snapshots and openings and max(row['last_tx_id'] for row in snapshots) < max(row['last_tx_id'] for row in openings):
+        recompute = True
+    
+    states: Dict[str, PositionState] = {}
+    recent: Dict[str, set] = {}
+    last_tx_id = 0
+    since = None
+    if recompute or not snapshots:
+        for row in openings:
+            states[row['symbol']] = position_state(row)
+        if openings:
+            since = max(row['archived_through'] for row in openings)
+    else:
+        for row in snapshots:
+            states[row['symbol']] = position_state(row)
+            recent[row['symbol']] = set(row['recent_tx_ids'])
+            last_tx_id = max(last_tx_id, row['last_tx_id'])
+    
+    # id выдаётся при INSERT, а видна сделка только после commit: сделка с меньшим id (например, из
+    # settle_fills в долгой транзакции) может появиться после уже учтённой с большим. Поэтому окно
+    # PORTFOLIO_LATE_COMMIT_WINDOW ниже отметки перечитывается, а уже учтённые в нём id отбрасываются
+    trades = load_portfolio_trades(conn, user_id, max(last_tx_id - PORTFOLIO_LATE_COMMIT_WINDOW, 0), since)
+    processed = 0
+    
+    if trades is not None:
+        import numpy as np
+        seen = np.fromiter(set().union(*recent.values()), dtype=np.int64)
+        fresh = ~np.isin(trades[0], seen)
+        ids, symbols, is_buy, amounts, prices = (column[fresh] for column in trades)
+        processed = len(ids)
+    
+    if processed:
+        last_tx_id = max(last_tx_id, int(ids[-1]))
+        
+        for symbol, idx in split_by_symbol(symbols):
+            states[symbol] = apply_trades(states.get(symbol, PositionState()), is_buy[idx], amounts[idx], prices[idx])
+            recent[symbol] = recent.get(symbol, set()).union(ids[idx].tolist())
+        
+        floor = last_tx_id - PORTFOLIO_LATE_COMMIT_WINDOW
+        execute_values(
+            cur,
+            """INSERT INTO portfolio_snapshots
+               (user_id, symbol, last_tx_id, position, avg_cost, realized_pnl_avg, realized_pnl_fifo, last_price,
+                fifo_lot_amounts, fifo_lot_prices, recent_tx_ids)
+               VALUES %s
+               ON CONFLICT (user_id, symbol) DO UPDATE SET
+                   last_tx_id = EXCLUDED.last_tx_id, position = EXCLUDED.position, avg_cost = EXCLUDED.avg_cost,
+                   realized_pnl_avg = EXCLUDED.realized_pnl_avg, realized_pnl_fifo = EXCLUDED.realized_pnl_fifo,
+                   last_price = EXCLUDED.last_price, fifo_lot_amounts = EXCLUDED.fifo_lot_amounts,
+                   fifo_lot_prices = EXCLUDED.fifo_lot_prices, recent_tx_ids = EXCLUDED.recent_tx_ids,
+                   updated_at = CURRENT_TIMESTAMP""",
+            [
+                (user_id, symbol, last_tx_id, state.position, state.avg_cost, state.realized_avg, state.realized_fifo,
+                 state.last_price, state.lot_amounts.tolist(), state.lot_prices.tolist(),
+                 sorted(tx_id for tx_id in recent.get(symbol, ()) if tx_id > floor))
+                for symbol, state in sorted(states.items())
+            ],
+            template='(%s, %s, %s, %s, %s, %s, %s, %s, %s::float8[], %s::float8[], %s::integer[])'
+        )
+        conn.commit()
+    
+    symbols_summary = []
+    for symbol, state in sorted(states.items()):
+        item = state.summary()
+        item['symbol'] = symbol
+        symbols_summary.append(item)
+    
+    return {
+        'last_tx_id': last_tx_id,
+        'processed': processed,
+        'symbols': symbols_summary,
+        'totals': {
+            key: round(sum(item[key] for item in symbols_summary), 2)
+            for key in ('realized_pnl_avg', 'unrealized_pnl_avg', 'realized_pnl_fifo', 'unrealized_pnl_fifo')
+        }
+    }
+
+def is_timer_trigger(event: Dict[str, Any]) -> bool:
+    return any(
+        'TimerMessage' in ((message.get('event_metadata') or {}).get('event_type') or '')
+        for message in event.get('messages') or []
+    )
+
+_market_data = None
+_market_replay = None
+_market_sync: Dict[str, Any] = {'last_tx_id': None, 'recent_ids': set(), 'synced_at': 0.0}
+
+def get_market_data():
+    global _market_data, _market_replay
+    if _market_data is None:
+        from marketdata import MarketData, ReplayTickSource
+        _market_replay = ReplayTickSource(MARKET_REPLAY_FILE) if MARKET_REPLAY_FILE else None
+        _market_data = MarketData(MARKET_TICK_CAPACITY, MARKET_CANDLE_CAPACITY)
+    return _market_data
+
+# Вызывается только с GET-путей и таймера: запись сделки не ждёт догрузки кэша и проверяет
+# проскальзывание по уже загруженной цене
+def sync_market_data(cur):
+    import numpy as np
+    market_data = get_market_data()
+    if _market_replay is not None:
+        batch = _market_replay.poll()
+        while batch is not None:
+            market_data.ingest_batch(batch)
+            batch = _market_replay.poll()
+        return
+    
+    now = time.monotonic()
+    if now - _market_sync['synced_at'] < MARKET_SYNC_INTERVAL:
+        return
+    
+    if _market_sync['last_tx_id'] is None:
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS id FROM transactions")
+        _market_sync['last_tx_id'] = max(cur.fetchone()['id'] - MARKET_BACKFILL_ROWS, 0)
+    
+    # Как и в refresh_portfolio: id выдаются до commit, поэтому сделка с id ниже отметки может стать видна
+    # позже. MARKET_LATE_COMMIT_WINDOW ниже отметки перечитывается, уже загруженные в нём id отбрасываются
+    recent = _market_sync['recent_ids']
+    after_id = max(_market_sync['last_tx_id'] - MARKET_LATE_COMMIT_WINDOW, 0)
+    while True:
+        cur.execute(
+            "SELECT id, symbol, EXTRACT(EPOCH FROM created_at)::float8 AS ts, price_usd::float8 AS price, amount::float8 AS amount FROM transactions WHERE id > %s ORDER BY id LIMIT %s",
+            (after_id, MARKET_SYNC_BATCH)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        
+        after_id = rows[-1]['id']
+        fresh = [row for row in rows if row['id'] not in recent]
+        if fresh:
+            market_data.ingest_batch((
+                np.array([row['symbol'] for row in fresh]),
+                np.fromiter((row['ts'] for row in fresh), dtype=np.float64, count=len(fresh)),
+                np.fromiter((row['price'] for row in fresh), dtype=np.float64, count=len(fresh)),
+                np.fromiter((row['amount'] for row in fresh), dtype=np.float64, count=len(fresh))
+            ))
+            recent.update(row['id'] for row in fresh)
+        _market_sync['last_tx_id'] = max(_market_sync['last_tx_id'], after_id)
+        if len(rows) < MARKET_SYNC_BATCH:
+            break
+    
+    floor_id = _market_sync['last_tx_id'] - MARKET_LATE_COMMIT_WINDOW
+    _market_sync['recent_ids'] = {tx_id for tx_id in recent if tx_id > floor_id}
+    _market_sync['synced_at'] = now
+
+def run_market_sync() -> Dict[str, Any]:
+    # Таймер держит кэш инстанса прогретым, чтобы проверка проскальзывания на записи видела свежую цену
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        sync_market_data(cur)
+        conn.commit()
+    finally:
+        cur.close()
+        release_db_connection(conn)
+    
+    stats = {'last_tx_id': _market_sync['last_tx_id'], 'symbols': len(get_market_data().symbols)}
+    print(json.dumps({'event': 'market_sync', **stats}))
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': serialize_body(stats)
+    }
+
+def outside_slippage_band(symbol: str, price_usd: float) -> bool:
+    # Пока кэш инстанса не загружен (холодный старт без GET и таймера), полоса не проверяется
+    last = get_market_data().last_price(symbol)
+    if not last:
+        return False
+    return abs(price_usd - last[1]) > last[1] * MARKET_SLIPPAGE_BAND
+
+def execute_trade_batch(conn, cur, req) -> Dict[str, Any]:
+    from psycopg2.extras import execute_values
+    cur.execute("SELECT balance_usd FROM users WHERE id = %s FOR UPDATE", (req.user_id,))
+    user = cur.fetchone()
+    
+    if not user:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'User not found'})
+        }
+    
+    symbols = sorted({trade.symbol for trade in req.trades})
+    cur.execute(
+        "SELECT symbol, amount FROM crypto_balances WHERE user_id = %s AND symbol = ANY(%s) ORDER BY symbol FOR UPDATE",
+        (req.user_id, symbols)
+    )
+    crypto = {row['symbol']: Decimal(str(row['amount'])) for row in cur.fetchall()}
+    usd = Decimal(str(user['balance_usd']))
+    
+    results = []
+    accepted = []
+    usd_delta = Decimal('0')
+    crypto_delta: Dict[str, Decimal] = {}
+    
+    for index, trade in enumerate(req.trades):
+        amount = Decimal(str(trade.amount))
+        total_usd = amount * Decimal(str(trade.price_usd))
+        held = crypto.get(trade.symbol, Decimal('0')) + crypto_delta.get(trade.symbol, Decimal('0'))
+        
+        error = None
+        if outside_slippage_band(trade.symbol, trade.price_usd):
+            error = 'Price outside allowed slippage band'
+        elif trade.action == 'buy' and usd + usd_delta < total_usd:
+            error = 'Insufficient balance'
+        elif trade.action == 'sell' and held < amount:
+            error = 'Insufficient crypto balance'
+        
+        if error:
+            results.append({'index': index, 'success': False, 'error': error})
+            continue
+        
+        sign = 1 if trade.action == 'buy' else -1
+        usd_delta -= sign * total_usd
+        crypto_delta[trade.symbol] = crypto_delta.get(trade.symbol, Decimal('0')) + sign * amount
+        accepted.append((trade, total_usd))
+        results.append({'index': index, 'success': True})
+    
+    rejected = len(req.trades) - len(accepted)
+    if req.mode == 'atomic' and rejected:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({
+                'success': False,
+                'mode': req.mode,
+                'error': 'Batch rejected',
+                'results': results
+            })
+        }
+    
+    if accepted:
+        cur.execute(
+            "UPDATE users SET balance_usd = balance_usd + %s WHERE id = %s",
+            (usd_delta, req.user_id)
+        )
+        
+        changed = [(req.user_id, symbol, delta) for symbol, delta in sorted(crypto_delta.items()) if delta != 0]
+        if changed:
+            execute_values(
+                cur,
+                "INSERT INTO crypto_balances (user_id, symbol, amount) VALUES %s ON CONFLICT (user_id, symbol) DO UPDATE SET amount = crypto_balances.amount + EXCLUDED.amount",
+                changed
+            )
+        
+        tx_rows = execute_values(
+            cur,
+            "INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd) VALUES %s RETURNING type, symbol, amount, total_usd, created_at",
+            [
+                (req.user_id, trade.action, trade.symbol, trade.amount, trade.price_usd, total_usd)
+                for trade, total_usd in accepted
+            ],
+            page_size=BATCH_MAX_TRADES,
+            fetch=True
+        )
+        
+        held: Dict[str, Decimal] = {}
+        for row in tx_rows:
+            held[row['symbol']] = held.get(row['symbol'], Decimal('0')) + (row['amount'] if row['type'] == 'buy' else -row['amount'])
+        apply_rollups(cur, tx_rows, held)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({
+            'success': True,
+            'mode': req.mode,
+            'executed': len(accepted),
+            'rejected': rejected,
+            'results': results,
+            'usd': float(usd + usd_delta)
+        })
+    }
+
+def execute_trade(conn, cur, req) -> Dict[str, Any]:
+    if outside_slippage_band(req.symbol, req.price_usd):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'success': False, 'error': 'Price outside allowed slippage band'})
+        }
+    
+    total_usd = Decimal(str(req.amount)) * Decimal(str(req.price_usd))
+    
+    if req.action == 'buy':
+        cur.execute(
+            "UPDATE users SET balance_usd = balance_usd - %s WHERE id = %s AND balance_usd >= %s RETURNING balance_usd",
+            (total_usd, req.user_id, total_usd)
+        )
+        user = cur.fetchone()
+        
+        if not user:
+            return trade_rejected_response(cur, req.user_id, 'Insufficient balance')
+        
+        cur.execute(
+            "INSERT INTO crypto_balances (user_id, symbol, amount) VALUES (%s, %s, %s) ON CONFLICT (user_id, symbol) DO UPDATE SET amount = crypto_balances.amount + %s",
+            (req.user_id, req.symbol, req.amount, req.amount)
+        )
+    
+    elif req.action == 'sell':
+        # Строка users блокируется первой, как в покупке и пакетных сделках; при нехватке крипты
+        # зачисление откатывается
+        cur.execute(
+            "UPDATE users SET balance_usd = balance_usd + %s WHERE id = %s RETURNING balance_usd",
+            (total_usd, req.user_id)
+        )
+        user = cur.fetchone()
+        
+        if not user:
+            return trade_rejected_response(cur, req.user_id, 'Insufficient crypto balance')
+        
+        cur.execute(
+            "UPDATE crypto_balances SET amount = amount - %s WHERE user_id = %s AND symbol = %s AND amount >= %s RETURNING amount",
+            (req.amount, req.user_id, req.symbol, req.amount)
+        )
+        
+        if not cur.fetchone():
+            conn.rollback()
+            return trade_rejected_response(cur, req.user_id, 'Insufficient crypto balance')
+    
+    cur.execute(
+        "INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd) VALUES (%s, %s, %s, %s, %s, %s) RETURNING type, symbol, amount, total_usd, created_at",
+        (req.user_id, req.action, req.symbol, req.amount, req.price_usd, float(total_usd))
+    )
+    tx = cur.fetchone()
+    apply_rollups(cur, [tx], {req.symbol: tx['amount'] if req.action == 'buy' else -tx['amount']})
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': serialize_body({
+            'success': True,
+            'message': f'{req.action.capitalize()} successful',
+            'balance_usd': float(user['balance_usd'])
+        })
+    }
+
+# Число шардов счётчиков trade_volume_daily и holdings_totals: одновременные сделки по одному символу
+# попадают в разные строки и не ждут друг друга до commit
+ROLLUP_SHARDS = int(os.environ.get('ROLLUP_SHARDS', '16'))
+
+def apply_rollups(cur, tx_rows: List[Dict[str, Any]], holdings: Dict[str, Decimal]):
+    # Вызывается в транзакции сделки до commit: агрегаты фиксируются вместе с ней и не теряются при
+    # остановке инстанса. Строки берутся из RETURNING, чтобы округление совпадало с таблицей; строки
+    # агрегатов блокируются последними и в одном порядке — trade_volume_daily, затем holdings_totals.
+    # Вся транзакция пишет в один случайный шард, поэтому порядок блокировок внутри неё не меняется
+    from psycopg2.extras import execute_values
+    shard = random.randrange(ROLLUP_SHARDS)
+    volume: Dict[Tuple[Any, str], List[Any]] = {}
+    for row in tx_rows:
+        values = volume.setdefault((row['created_at'].date(), row['symbol']), [0, Decimal('0'), Decimal('0'), Decimal('0')])
+        values[0] += 1
+        values[1 if row['type'] == 'buy' else 2] += row['amount']
+        values[3] += row['total_usd']
+    
+    if volume:
+        execute_values(
+            cur,
+            """INSERT INTO trade_volume_daily (day, symbol, shard, trades, buy_amount, sell_amount, volume_usd) VALUES %s
+               ON CONFLICT (day, symbol, shard) DO UPDATE SET
+                   trades = trade_volume_daily.trades + EXCLUDED.trades,
+                   buy_amount = trade_volume_daily.buy_amount + EXCLUDED.buy_amount,
+                   sell_amount = trade_volume_daily.sell_amount + EXCLUDED.sell_amount,
+                   volume_usd = trade_volume_daily.volume_usd + EXCLUDED.volume_usd,
+                   updated_at = CURRENT_TIMESTAMP""",
+            [(day, symbol, shard, *values) for (day, symbol), values in sorted(volume.items())]
+        )
+    
+    changed = sorted((symbol, shard, delta) for symbol, delta in holdings.items() if delta)
+    if changed:
+        execute_values(
+            cur,
+            """INSERT INTO holdings_totals (symbol, shard, amount) VALUES %s
+               ON CONFLICT (symbol, shard) DO UPDATE SET amount = holdings_totals.amount + EXCLUDED.amount, updated_at = CURRENT_TIMESTAMP""",
+            changed
+        )
+
+# Функции записи не фиксируют транзакцию сами: это делает вызывающий после построения ответа,
+# а run_idempotent до commit сохраняет ответ в idempotency_keys
+def execute_post(conn, cur, kind: str, req) -> Dict[str, Any]:
+    if kind == 'cancel':
+        return cancel_limit_order(conn, cur, req)
+    if kind == 'limit':
+        return place_limit_order(conn, cur, req)
+    if kind == 'batch':
+        return execute_trade_batch(conn, cur, req)
+    return execute_trade(conn, cur, req)
+
+def commit_write(conn, response: Dict[str, Any]) -> Dict[str, Any]:
+    if 200 <= response['statusCode'] < 300:
+        conn.commit()
+    else:
+        conn.rollback()
+    return response
+
+def parse_json_body(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None, error_response(400, 'Malformed JSON body')
+    if not isinstance(body_data, dict):
+        return None, error_response(400, 'Request body must be a JSON object')
+    return body_data, None
+
+IDEMPOTENCY_SCOPE = 'trading'
+GET_ACTIONS = ('balance', 'history', 'book', 'portfolio', 'price', 'candles', 'export', 'stats')
+USER_ACTIONS = ('balance', 'history', 'portfolio', 'export')
+SYMBOL_ACTIONS = ('book', 'price', 'candles')
+
+def parse_post_request(event: Dict[str, Any]) -> Tuple[Optional[Tuple[str, Any]], Optional[Dict[str, Any]]]:
+    body_data, error = parse_json_body(event)
+    if error:
+        return None, error
+    
+    from pydantic import ValidationError
+    from models import TradeRequest, LimitOrderRequest, CancelOrderRequest, BatchTradeRequest
+    
+    if body_data.get('action') == 'cancel':
+        kind, model, message = 'cancel', CancelOrderRequest, 'Invalid order'
+    elif body_data.get('order_type') == 'limit':
+        kind, model, message = 'limit', LimitOrderRequest, 'Invalid order'
+    elif 'trades' in body_data:
+        kind, model, message = 'batch', BatchTradeRequest, 'Invalid batch'
+    else:
+        kind, model, message = 'trade', TradeRequest, 'Invalid trade'
+    
+    try:
+        return (kind, parse_request(model, body_data)), None
+    except ValidationError as e:
+        return None, error_response(400, message, e.errors(include_url=False, include_context=False))
+
+def parse_get_request(params: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    action = params.get('action', 'balance')
+    if action not in GET_ACTIONS:
+        return None, error_response(400, 'Unknown action')
+    
+    query: Dict[str, Any] = {'action': action, 'user_id': params.get('user_id'), 'symbol': params.get('symbol')}
+    if action in USER_ACTIONS:
+        try:
+            query['user_id'] = int(params.get('user_id') or '')
+        except ValueError:
+            return None, error_response(400, 'user_id must be an integer')
+    if action in SYMBOL_ACTIONS and not query['symbol']:
+        return None, error_response(400, 'symbol is required')
+    
+    if action == 'history':
+        try:
+            query['limit'] = min(max(int(params.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+            query['cursor'] = decode_cursor(params.get('cursor'))
+            query['date_from'] = datetime.fromisoformat(params['from']) if params.get('from') else None
+            query['date_to'] = datetime.fromisoformat(params['to']) if params.get('to') else None
+        except ValueError:
+            return None, error_response(400, 'Invalid limit, cursor or date range')
+        query['format'] = params.get('format', 'json')
+        if query['format'] not in ('json', 'columnar'):
+            return None, error_response(400, 'Unsupported format')
+    
+    elif action == 'portfolio':
+        query['recompute'] = params.get('recompute') in ('1', 'true')
+    
+    elif action == 'candles':
+        from marketdata import INTERVALS
+        query['interval'] = params.get('interval', '1m')
+        try:
+            if query['interval'] not in INTERVALS:
+                raise ValueError('Unsupported interval')
+            query['limit'] = min(max(int(params.get('limit', 100)), 1), MARKET_CANDLE_CAPACITY)
+        except ValueError:
+            return None, error_response(400, 'Invalid interval or limit')
+    
+    elif action == 'stats':
+        try:
+            query['days'] = min(max(int(params.get('days', 1)), 1), STATS_MAX_DAYS)
+        except ValueError:
+            return None, error_response(400, 'days must be an integer')
+    
+    elif action == 'export':
+        query['format'] = params.get('format', 'ndjson')
+        try:
+            if query['format'] not in ('ndjson', 'csv'):
+                raise ValueError('Unsupported format')
+            query['cursor'] = decode_cursor(params.get('cursor'))
+        except ValueError:
+            return None, error_response(400, 'Invalid format or cursor')
+    
+    return query, None
+
+@instrument_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if is_timer_trigger(event):
+        return run_market_sync()
+    
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -32,91 +963,73 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Admin-Token, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': serialize_body({'error': 'Method not allowed'})
+        }
+    
+    idempotency_key = None
+    if method == 'POST':
+        idempotency_key, error = parse_idempotency_key(event)
+        if error:
+            return error
+        parsed, error = parse_post_request(event)
+        user_id = parsed[1].user_id if parsed else None
+    else:
+        parsed, error = parse_get_request(event.get('queryStringParameters') or {})
+        user_id = parsed['user_id'] if parsed else None
+    if error:
+        return error
+    
+    throttled = admit_request(client_key(event))
+    if throttled:
+        return throttled
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            req = TradeRequest(**body_data)
+            kind, req = parsed
             
-            total_usd = Decimal(str(req.amount)) * Decimal(str(req.price_usd))
+            auth_error = authorize_request(cur, event, req.user_id)
+            if auth_error:
+                return auth_error
             
-            cur.execute("SELECT balance_usd FROM users WHERE id = %s", (req.user_id,))
-            user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': False, 'error': 'User not found'})
-                }
-            
-            if req.action == 'buy':
-                if Decimal(str(user['balance_usd'])) < total_usd:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'success': False, 'error': 'Insufficient balance'})
-                    }
-                
-                cur.execute(
-                    "UPDATE users SET balance_usd = balance_usd - %s WHERE id = %s",
-                    (float(total_usd), req.user_id)
-                )
-                
-                cur.execute(
-                    "INSERT INTO crypto_balances (user_id, symbol, amount) VALUES (%s, %s, %s) ON CONFLICT (user_id, symbol) DO UPDATE SET amount = crypto_balances.amount + %s",
-                    (req.user_id, req.symbol, req.amount, req.amount)
-                )
-            
-            elif req.action == 'sell':
-                cur.execute(
-                    "SELECT amount FROM crypto_balances WHERE user_id = %s AND symbol = %s",
-                    (req.user_id, req.symbol)
-                )
-                balance = cur.fetchone()
-                
-                if not balance or Decimal(str(balance['amount'])) < Decimal(str(req.amount)):
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'success': False, 'error': 'Insufficient crypto balance'})
-                    }
-                
-                cur.execute(
-                    "UPDATE crypto_balances SET amount = amount - %s WHERE user_id = %s AND symbol = %s",
-                    (req.amount, req.user_id, req.symbol)
-                )
-                
-                cur.execute(
-                    "UPDATE users SET balance_usd = balance_usd + %s WHERE id = %s",
-                    (float(total_usd), req.user_id)
-                )
-            
-            cur.execute(
-                "INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd) VALUES (%s, %s, %s, %s, %s, %s)",
-                (req.user_id, req.action, req.symbol, req.amount, req.price_usd, float(total_usd))
-            )
-            
-            conn.commit()
+            try:
+                if idempotency_key:
+                    return run_idempotent(
+                        conn, cur, IDEMPOTENCY_SCOPE, req.user_id, idempotency_key, request_fingerprint(kind, req),
+                        lambda: execute_post(conn, cur, kind, req)
+                    )
+                return commit_write(conn, execute_post(conn, cur, kind, req))
+            except Exception:
+                # Стакан в памяти уже изменён заявкой, а её транзакция не зафиксирована
+                if kind in ('limit', 'cancel'):
+                    _order_books.clear()
+                raise
+        
+        else:
+            query = parsed
+            action = query['action']
+            symbol = query['symbol']
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'message': f'{req.action.capitalize()} successful'})
-            }
-        
-        elif method == 'GET':
-            params = event.get('queryStringParameters', {})
-            user_id = params.get('user_id')
-            action = params.get('action', 'balance')
+            if action == 'stats':
+                auth_error = authorize_admin(event)
+            elif action in USER_ACTIONS:
+                auth_error = authorize_request(cur, event, user_id)
+            else:
+                auth_error = None
+            if auth_error:
+                return auth_error
             
             if action == 'balance':
                 cur.execute(
@@ -141,16 +1054,54 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(result)
+                    'body': serialize_body(result)
                 }
             
             elif action == 'history':
+                limit, cursor = query['limit'], query['cursor']
+                date_from, date_to = query['date_from'], query['date_to']
+                
+                conditions = ['user_id = %s']
+                query_params: List[Any] = [user_id]
+                if symbol:
+                    conditions.append('symbol = %s')
+                    query_params.append(symbol)
+                if date_from:
+                    conditions.append('created_at >= %s')
+                    query_params.append(date_from)
+                if date_to:
+                    conditions.append('created_at < %s')
+                    query_params.append(date_to)
+                if cursor:
+                    # Отдельное условие по created_at отсекает секции новее курсора; сравнение строк его не даёт
+                    conditions.append('created_at <= %s AND (created_at, id) < (%s, %s)')
+                    query_params.extend([cursor[0], cursor[0], cursor[1]])
+                query_params.append(limit + 1)
+                
                 cur.execute(
-                    "SELECT * FROM transactions WHERE user_id = %s ORDER BY created_at DESC LIMIT 50",
-                    (user_id,)
+                    "SELECT id, type, symbol, amount, price_usd, total_usd, created_at FROM transactions WHERE "
+                    + ' AND '.join(conditions)
+                    + " ORDER BY created_at DESC, id DESC LIMIT %s",
+                    query_params
                 )
                 transactions = cur.fetchall()
                 
+                headers = {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'X-Next-Cursor'
+                }
+                if len(transactions) > limit:
+                    transactions = transactions[:limit]
+                    headers['X-Next-Cursor'] = encode_cursor(transactions[-1]['created_at'], transactions[-1]['id'])
+                
+                if query['format'] == 'columnar':
+                    return compress_response(event, {
+                        'statusCode': 200,
+                        'headers': headers,
+                        'body': serialize_body(columnar(transactions, EXPORT_COLUMNS), compact=True)
+                    })
+                
                 result = []
                 for tx in transactions:
                     result.append({
@@ -163,18 +1114,127 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'created_at': tx['created_at'].isoformat() if tx['created_at'] else None
                     })
                 
+                return compress_response(event, {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': serialize_body(result)
+                })
+            
+            elif action == 'book':
+                cur.execute("SELECT version FROM order_book_state WHERE symbol = %s", (symbol,))
+                state = cur.fetchone()
+                book = load_order_book(cur, symbol, state['version'] if state else 0)
+                depth = book.depth(ORDER_BOOK_DEPTH)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': serialize_body({
+                        'symbol': symbol,
+                        'bids': [
+                            {'price_usd': float(from_ticks(price, PRICE_SCALE)), 'amount': float(from_ticks(volume, AMOUNT_SCALE))}
+                            for price, volume in depth['buy']
+                        ],
+                        'asks': [
+                            {'price_usd': float(from_ticks(price, PRICE_SCALE)), 'amount': float(from_ticks(volume, AMOUNT_SCALE))}
+                            for price, volume in depth['sell']
+                        ]
+                    })
+                }
+            
+            elif action == 'portfolio':
+                result = refresh_portfolio(conn, cur, user_id, query['recompute'])
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': serialize_body(result)
+                }
+            
+            elif action == 'price':
+                sync_market_data(cur)
+                last = get_market_data().last_price(symbol)
+                
+                if not last:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': serialize_body({'success': False, 'error': 'No market data for symbol'})
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': serialize_body({'symbol': symbol, 'price_usd': last[1], 'ts': last[0]})
+                }
+            
+            elif action == 'candles':
+                interval, limit = query['interval'], query['limit']
+                sync_market_data(cur)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': serialize_body({
+                        'symbol': symbol,
+                        'interval': interval,
+                        'candles': get_market_data().candles(symbol, interval, limit)
+                    })
+                }
+            
+            elif action == 'export':
+                fmt, cursor = query['format'], query['cursor']
+                export_cur = conn.cursor(name='transactions_export')
+                export_cur.itersize = EXPORT_ITERSIZE
+                try:
+                    if cursor:
+                        export_cur.execute(
+                            "SELECT id, type, symbol, amount, price_usd, total_usd, created_at FROM transactions WHERE user_id = %s AND (created_at, id) > (%s, %s) ORDER BY created_at, id",
+                            (user_id, cursor[0], cursor[1])
+                        )
+                    else:
+                        export_cur.execute(
+                            "SELECT id, type, symbol, amount, price_usd, total_usd, created_at FROM transactions WHERE user_id = %s ORDER BY created_at, id",
+                            (user_id,)
+                        )
+                    body, count, last_row = write_export(export_cur, EXPORT_COLUMNS, fmt, EXPORT_MAX_ROWS, EXPORT_MAX_BYTES)
+                finally:
+                    export_cur.close()
+                
+                next_cursor = encode_cursor(last_row['created_at'], last_row['id']) if last_row else None
+                return export_response(body, fmt, count, next_cursor)
+            
+            elif action == 'stats':
+                cur.execute("SELECT symbol, SUM(amount) AS amount FROM holdings_totals GROUP BY symbol ORDER BY symbol")
+                holdings = cur.fetchall()
+                cur.execute(
+                    '''SELECT day, symbol, SUM(trades) AS trades, SUM(buy_amount) AS buy_amount, SUM(sell_amount) AS sell_amount,
+                              SUM(volume_usd) AS volume_usd
+                       FROM trade_volume_daily WHERE day > CURRENT_DATE - %s GROUP BY day, symbol ORDER BY day DESC, symbol''',
+                    (query['days'],)
+                )
+                volume = cur.fetchall()
+                
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(result)
+                    'body': serialize_body({
+                        'days': query['days'],
+                        'holdings': [{'symbol': row['symbol'], 'amount': float(row['amount'])} for row in holdings],
+                        'volume': [
+                            {
+                                'day': row['day'].isoformat(),
+                                'symbol': row['symbol'],
+                                'trades': int(row['trades']),
+                                'buy_amount': float(row['buy_amount']),
+                                'sell_amount': float(row['sell_amount']),
+                                'volume_usd': float(row['volume_usd'])
+                            }
+                            for row in volume
+                        ]
+                    })
                 }
     
     finally:
         cur.close()
-        conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+        release_db_connection(conn)
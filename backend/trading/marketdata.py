@@ -0,0 +1,208 @@
+'''
+Кэш рыночных данных: кольцевые буферы тиков и инкрементальные свечи OHLCV по символам.
+Источник тиков подключаемый: сделки из БД или локальный файл реплея (CSV/NDJSON).
+'''
+import csv
+import json
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+INTERVALS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+TickBatch = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+class TickRing:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.volume = np.zeros(capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+    
+    def extend(self, ts: np.ndarray, price: np.ndarray, volume: np.ndarray):
+        n = len(ts)
+        if n > self.capacity:
+            ts, price, volume = ts[-self.capacity:], price[-self.capacity:], volume[-self.capacity:]
+            n = self.capacity
+        idx = (self.head + np.arange(n)) % self.capacity
+        self.ts[idx] = ts
+        self.price[idx] = price
+        self.volume[idx] = volume
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+    
+    def append(self, ts: float, price: float, volume: float):
+        i = self.head
+        self.ts[i] = ts
+        self.price[i] = price
+        self.volume[i] = volume
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+    
+    def last(self) -> Optional[Tuple[float, float]]:
+        if not self.count:
+            return None
+        i = (self.head - 1) % self.capacity
+        return float(self.ts[i]), float(self.price[i])
+
+class CandleSeries:
+    def __init__(self, interval: int, capacity: int):
+        self.interval = interval
+        self.capacity = capacity
+        self.data = np.zeros((capacity, 6), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+    
+    def _current(self) -> Optional[np.ndarray]:
+        if not self.count:
+            return None
+        return self.data[(self.head - 1) % self.capacity]
+    
+    def append(self, ts: float, price: float, volume: float):
+        bucket = ts // self.interval * self.interval
+        current = self._current()
+        if current is not None:
+            start = current[0]
+            if bucket < start:
+                return
+            if bucket == start:
+                if price > current[2]:
+                    current[2] = price
+                if price < current[3]:
+                    current[3] = price
+                current[4] = price
+                current[5] += volume
+                return
+        self.data[self.head] = (bucket, price, price, price, price, volume)
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+    
+    def extend(self, ts: np.ndarray, price: np.ndarray, volume: np.ndarray):
+        buckets = ts // self.interval * self.interval
+        current = self._current()
+        if current is not None:
+            keep = buckets >= current[0]
+            if not keep.all():
+                buckets, price, volume = buckets[keep], price[keep], volume[keep]
+        if not len(buckets):
+            return
+        
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:] - 1, len(buckets) - 1]
+        rows = np.column_stack((
+            buckets[starts],
+            price[starts],
+            np.maximum.reduceat(price, starts),
+            np.minimum.reduceat(price, starts),
+            price[ends],
+            np.add.reduceat(volume, starts)
+        ))
+        
+        if current is not None and rows[0, 0] == current[0]:
+            current[2] = max(current[2], rows[0, 2])
+            current[3] = min(current[3], rows[0, 3])
+            current[4] = rows[0, 4]
+            current[5] += rows[0, 5]
+            rows = rows[1:]
+        
+        n = len(rows)
+        if not n:
+            return
+        if n > self.capacity:
+            rows = rows[-self.capacity:]
+            n = self.capacity
+        idx = (self.head + np.arange(n)) % self.capacity
+        self.data[idx] = rows
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+    
+    def latest(self, limit: int) -> np.ndarray:
+        n = min(limit, self.count)
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        return self.data[idx]
+
+class SymbolMarket:
+    def __init__(self, tick_capacity: int, candle_capacity: int):
+        self.ticks = TickRing(tick_capacity)
+        self.candles = {name: CandleSeries(seconds, candle_capacity) for name, seconds in INTERVALS.items()}
+    
+    def ingest(self, ts: np.ndarray, price: np.ndarray, volume: np.ndarray):
+        self.ticks.extend(ts, price, volume)
+        for series in self.candles.values():
+            series.extend(ts, price, volume)
+
+class MarketData:
+    def __init__(self, tick_capacity: int, candle_capacity: int):
+        self.tick_capacity = tick_capacity
+        self.candle_capacity = candle_capacity
+        self.symbols: Dict[str, SymbolMarket] = {}
+    
+    def _market(self, symbol: str) -> SymbolMarket:
+        market = self.symbols.get(symbol)
+        if market is None:
+            market = SymbolMarket(self.tick_capacity, self.candle_capacity)
+            self.symbols[symbol] = market
+        return market
+    
+    def ingest(self, symbol: str, ts: float, price: float, volume: float):
+        market = self._market(symbol)
+        market.ticks.append(ts, price, volume)
+        for series in market.candles.values():
+            series.append(ts, price, volume)
+    
+    def ingest_batch(self, batch: TickBatch):
+        symbols, ts, price, volume = batch
+        if not len(symbols):
+            return
+        order = np.lexsort((ts, symbols))
+        symbols, ts, price, volume = symbols[order], ts[order], price[order], volume[order]
+        unique, starts = np.unique(symbols, return_index=True)
+        bounds = list(starts[1:]) + [len(symbols)]
+        for symbol, start, end in zip(unique, starts, bounds):
+            self._market(str(symbol)).ingest(ts[start:end], price[start:end], volume[start:end])
+    
+    def last_price(self, symbol: str) -> Optional[Tuple[float, float]]:
+        market = self.symbols.get(symbol)
+        return market.ticks.last() if market else None
+    
+    def candles(self, symbol: str, interval: str, limit: int) -> List[Dict[str, float]]:
+        market = self.symbols.get(symbol)
+        if market is None:
+            return []
+        return [
+            {'ts': int(row[0]), 'open': row[1], 'high': row[2], 'low': row[3], 'close': row[4], 'volume': row[5]}
+            for row in market.candles[interval].latest(limit).tolist()
+        ]
+
+class ReplayTickSource:
+    def __init__(self, path: str, chunk_size: int = 100000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._rows = None
+    
+    def _read_rows(self):
+        with open(self.path, newline='') as f:
+            if self.path.endswith('.csv'):
+                for row in csv.DictReader(f):
+                    yield row['symbol'], float(row['ts']), float(row['price']), float(row.get('volume') or 0)
+            else:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        yield row['symbol'], float(row['ts']), float(row['price']), float(row.get('volume') or 0)
+    
+    def poll(self) -> Optional[TickBatch]:
+        if self._rows is None:
+            self._rows = self._read_rows()
+        chunk = []
+        for row in self._rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                break
+        if not chunk:
+            return None
+        symbols, ts, price, volume = zip(*chunk)
+        return np.array(symbols), np.array(ts), np.array(price), np.array(volume)
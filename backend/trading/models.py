@@ -0,0 +1,40 @@
+'''
+Схемы запросов функции trading. Импортируются лениво в ветке POST,
+чтобы OPTIONS и чтение баланса не загружали pydantic.
+'''
+import os
+from typing import List
+from pydantic import BaseModel, Field
+
+BATCH_MAX_TRADES = int(os.environ.get('BATCH_MAX_TRADES', '500'))
+
+class TradeRequest(BaseModel):
+    user_id: int
+    action: str = Field(..., pattern='^(buy|sell)$')
+    symbol: str
+    amount: float = Field(..., gt=0)
+    price_usd: float = Field(..., gt=0)
+
+class LimitOrderRequest(BaseModel):
+    user_id: int
+    order_type: str = Field(..., pattern='^limit$')
+    side: str = Field(..., pattern='^(buy|sell)$')
+    symbol: str
+    amount: float = Field(..., gt=0)
+    price_usd: float = Field(..., gt=0)
+
+class CancelOrderRequest(BaseModel):
+    user_id: int
+    action: str = Field(..., pattern='^cancel$')
+    order_id: int
+
+class BatchTradeItem(BaseModel):
+    action: str = Field(..., pattern='^(buy|sell)$')
+    symbol: str
+    amount: float = Field(..., gt=0)
+    price_usd: float = Field(..., gt=0)
+
+class BatchTradeRequest(BaseModel):
+    user_id: int
+    mode: str = Field('atomic', pattern='^(atomic|best_effort)$')
+    trades: List[BatchTradeItem] = Field(..., min_length=1, max_length=BATCH_MAX_TRADES)
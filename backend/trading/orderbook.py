@@ -0,0 +1,139 @@
+'''
+Лимитный стакан заявок с ценово-временным приоритетом.
+Цены хранятся в центах, объёмы — в единицах 1e-8, чтобы сопоставление шло в целых числах.
+'''
+import heapq
+from collections import deque
+from typing import Dict, List, Optional, NamedTuple
+
+PRICE_SCALE = 2
+AMOUNT_SCALE = 8
+
+class Order:
+    __slots__ = ('id', 'user_id', 'side', 'price', 'remaining', 'reserved')
+    
+    def __init__(self, id: int, user_id: int, side: str, price: int, remaining: int, reserved: int = 0):
+        self.id = id
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+        self.reserved = reserved
+
+class Fill(NamedTuple):
+    maker: Order
+    taker: Order
+    price: int
+    amount: int
+
+class PriceLevel:
+    __slots__ = ('price', 'orders', 'live')
+    
+    def __init__(self, price: int):
+        self.price = price
+        self.orders: deque = deque()
+        self.live = 0
+
+class OrderBook:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.version = 0
+        self.orders: Dict[int, Order] = {}
+        self._levels: Dict[str, Dict[int, PriceLevel]] = {'buy': {}, 'sell': {}}
+        self._heaps: Dict[str, List[int]] = {'buy': [], 'sell': []}
+    
+    def _best_level(self, side: str) -> Optional[PriceLevel]:
+        levels = self._levels[side]
+        heap = self._heaps[side]
+        while heap:
+            price = -heap[0] if side == 'buy' else heap[0]
+            level = levels.get(price)
+            if level:
+                return level
+            heapq.heappop(heap)
+        return None
+    
+    def best_bid(self) -> Optional[int]:
+        level = self._best_level('buy')
+        return level.price if level else None
+    
+    def best_ask(self) -> Optional[int]:
+        level = self._best_level('sell')
+        return level.price if level else None
+    
+    def rest(self, order: Order):
+        levels = self._levels[order.side]
+        level = levels.get(order.price)
+        if level is None:
+            level = PriceLevel(order.price)
+            levels[order.price] = level
+            heapq.heappush(self._heaps[order.side], -order.price if order.side == 'buy' else order.price)
+        level.orders.append(order)
+        level.live += 1
+        self.orders[order.id] = order
+    
+    def _drop_level(self, side: str, level: PriceLevel):
+        del self._levels[side][level.price]
+    
+    def add(self, order: Order) -> List[Fill]:
+        fills: List[Fill] = []
+        opposite = 'sell' if order.side == 'buy' else 'buy'
+        
+        while order.remaining:
+            level = self._best_level(opposite)
+            if level is None:
+                break
+            if order.side == 'buy' and level.price > order.price:
+                break
+            if order.side == 'sell' and level.price < order.price:
+                break
+            
+            queue = level.orders
+            while queue and order.remaining:
+                maker = queue[0]
+                if not maker.remaining:
+                    queue.popleft()
+                    continue
+                
+                amount = maker.remaining if maker.remaining < order.remaining else order.remaining
+                maker.remaining -= amount
+                order.remaining -= amount
+                fills.append(Fill(maker, order, level.price, amount))
+                
+                if not maker.remaining:
+                    queue.popleft()
+                    del self.orders[maker.id]
+                    level.live -= 1
+            
+            if not level.live:
+                self._drop_level(opposite, level)
+        
+        if order.remaining:
+            self.rest(order)
+        
+        return fills
+    
+    def cancel(self, order_id: int) -> Optional[Order]:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        
+        level = self._levels[order.side].get(order.price)
+        if level:
+            level.live -= 1
+            if not level.live:
+                self._drop_level(order.side, level)
+        
+        remaining = order.remaining
+        order.remaining = 0
+        return Order(order.id, order.user_id, order.side, order.price, remaining, order.reserved)
+    
+    def depth(self, limit: int) -> Dict[str, List[List[int]]]:
+        result = {}
+        for side in ('buy', 'sell'):
+            prices = sorted(self._levels[side], reverse=(side == 'buy'))[:limit]
+            result[side] = [
+                [price, sum(o.remaining for o in self._levels[side][price].orders)]
+                for price in prices
+            ]
+        return result
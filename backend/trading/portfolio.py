@@ -0,0 +1,133 @@
+'''
+Векторный расчёт себестоимости и PnL позиции по методам FIFO и средней цены.
+Состояние позиции продолжается инкрементально с последней обработанной транзакции.
+'''
+from typing import List, Tuple
+import numpy as np
+
+AVG_CHUNK_SIZE = 64
+LOG_ZERO = -1e4
+
+class PositionState:
+    __slots__ = ('position', 'avg_cost', 'realized_avg', 'realized_fifo', 'last_price', 'lot_amounts', 'lot_prices')
+    
+    def __init__(self, position: float = 0.0, avg_cost: float = 0.0, realized_avg: float = 0.0,
+                 realized_fifo: float = 0.0, last_price: float = 0.0,
+                 lot_amounts: List[float] = None, lot_prices: List[float] = None):
+        self.position = position
+        self.avg_cost = avg_cost
+        self.realized_avg = realized_avg
+        self.realized_fifo = realized_fifo
+        self.last_price = last_price
+        self.lot_amounts = np.asarray(lot_amounts or [], dtype=np.float64)
+        self.lot_prices = np.asarray(lot_prices or [], dtype=np.float64)
+    
+    def summary(self) -> dict:
+        fifo_cost = float(np.dot(self.lot_amounts, self.lot_prices))
+        avg_cost_basis = self.avg_cost * self.position
+        market_value = self.position * self.last_price
+        return {
+            'position': round(self.position, 8),
+            'last_price': round(self.last_price, 2),
+            'avg_cost': round(self.avg_cost, 8),
+            'cost_basis_avg': round(avg_cost_basis, 2),
+            'realized_pnl_avg': round(self.realized_avg, 2),
+            'unrealized_pnl_avg': round(market_value - avg_cost_basis, 2),
+            'cost_basis_fifo': round(fifo_cost, 2),
+            'realized_pnl_fifo': round(self.realized_fifo, 2),
+            'unrealized_pnl_fifo': round(market_value - fifo_cost, 2)
+        }
+
+def _linear_recurrence(start: float, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    '''x_k = a_k * x_{k-1} + b_k, решается блоками через матрицу затуханий exp(s_k - s_j).'''
+    result = np.empty(len(a), dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        logs = np.where(a > 0, np.log(np.where(a > 0, a, 1.0)), LOG_ZERO)
+    
+    prev = start
+    for offset in range(0, len(a), AVG_CHUNK_SIZE):
+        s = np.cumsum(logs[offset:offset + AVG_CHUNK_SIZE])
+        diff = s[:, None] - s[None, :]
+        decay = np.exp(np.where(np.tri(len(s), dtype=bool), diff, -np.inf))
+        chunk = decay @ b[offset:offset + AVG_CHUNK_SIZE] + np.exp(s) * prev
+        result[offset:offset + len(s)] = chunk
+        prev = chunk[-1]
+    
+    return result
+
+def _fifo_cost(cum_bought: np.ndarray, cum_cost: np.ndarray, lot_prices: np.ndarray, sold: np.ndarray) -> np.ndarray:
+    sold = np.minimum(sold, cum_bought[-1])
+    idx = np.minimum(np.searchsorted(cum_bought, sold, side='left'), len(cum_bought) - 1)
+    prev_bought = np.where(idx > 0, cum_bought[idx - 1], 0.0)
+    prev_cost = np.where(idx > 0, cum_cost[idx - 1], 0.0)
+    return prev_cost + (sold - prev_bought) * lot_prices[idx]
+
+def apply_trades(state: PositionState, is_buy: np.ndarray, amounts: np.ndarray, prices: np.ndarray) -> PositionState:
+    if not len(amounts):
+        return state
+    
+    signed = np.where(is_buy, amounts, -amounts)
+    position_after = state.position + np.cumsum(signed)
+    position_before = position_after - signed
+    
+    buy_idx = np.flatnonzero(is_buy)
+    sell_idx = np.flatnonzero(~is_buy)
+    
+    if len(buy_idx):
+        q = amounts[buy_idx]
+        after = position_after[buy_idx]
+        a = np.where(after > 0, np.maximum(position_before[buy_idx], 0.0) / after, 0.0)
+        b = np.where(after > 0, q * prices[buy_idx] / after, prices[buy_idx])
+        avg_after_buys = _linear_recurrence(state.avg_cost, a, b)
+    else:
+        avg_after_buys = np.empty(0, dtype=np.float64)
+    
+    realized_avg = state.realized_avg
+    realized_fifo = state.realized_fifo
+    lot_amounts = np.concatenate([state.lot_amounts, amounts[buy_idx]])
+    lot_prices = np.concatenate([state.lot_prices, prices[buy_idx]])
+    
+    if len(sell_idx):
+        preceding_buy = np.searchsorted(buy_idx, sell_idx) - 1
+        if len(buy_idx):
+            avg_at_sell = np.where(preceding_buy >= 0, avg_after_buys[np.maximum(preceding_buy, 0)], state.avg_cost)
+        else:
+            avg_at_sell = np.full(len(sell_idx), state.avg_cost)
+        sell_q = amounts[sell_idx]
+        proceeds = sell_q * prices[sell_idx]
+        realized_avg += float(np.sum(proceeds - sell_q * avg_at_sell))
+        
+        if len(lot_amounts):
+            cum_bought = np.cumsum(lot_amounts)
+            cum_cost = np.cumsum(lot_amounts * lot_prices)
+            sold = np.cumsum(sell_q)
+            cost_after = _fifo_cost(cum_bought, cum_cost, lot_prices, sold)
+            realized_fifo += float(np.sum(proceeds)) - float(cost_after[-1])
+            
+            total_sold = min(sold[-1], cum_bought[-1])
+            first_open = int(np.searchsorted(cum_bought, total_sold, side='right'))
+            lot_amounts = lot_amounts[first_open:].copy()
+            lot_prices = lot_prices[first_open:]
+            if len(lot_amounts):
+                lot_amounts[0] = cum_bought[first_open] - total_sold
+        else:
+            realized_fifo += float(np.sum(proceeds))
+    
+    position = float(position_after[-1])
+    if len(buy_idx):
+        avg_cost = float(avg_after_buys[-1])
+    else:
+        avg_cost = state.avg_cost
+    if position <= 0:
+        avg_cost = 0.0
+    
+    result = PositionState(position, avg_cost, realized_avg, realized_fifo, float(prices[-1]))
+    result.lot_amounts = lot_amounts
+    result.lot_prices = lot_prices
+    return result
+
+def split_by_symbol(symbols: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+    order = np.argsort(symbols, kind='stable')
+    unique, starts = np.unique(symbols[order], return_index=True)
+    bounds = list(starts[1:]) + [len(order)]
+    return [(str(symbol), order[start:end]) for symbol, start, end in zip(unique, starts, bounds)]
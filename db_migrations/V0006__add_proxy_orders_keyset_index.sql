@@ -0,0 +1,2 @@
+-- Составной индекс для постраничной выдачи заказов по курсору (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_proxy_orders_user_created_id ON proxy_orders(user_id, created_at DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Запрет отрицательных балансов (NOT VALID: проверяются только новые и изменённые строки)
+ALTER TABLE users ADD CONSTRAINT chk_users_balance_usd_non_negative CHECK (balance_usd >= 0) NOT VALID;
+ALTER TABLE crypto_balances ADD CONSTRAINT chk_crypto_balances_amount_non_negative CHECK (amount >= 0) NOT VALID;
@@ -0,0 +1,71 @@
+-- Создание таблицы пула прокси-эндпоинтов
+CREATE TABLE IF NOT EXISTS proxy_inventory (
+    id SERIAL PRIMARY KEY,
+    location VARCHAR(100) NOT NULL,
+    plan_type VARCHAR(50) NOT NULL,
+    host VARCHAR(255) NOT NULL,
+    port INTEGER NOT NULL,
+    username VARCHAR(100) NOT NULL,
+    password VARCHAR(100) NOT NULL,
+    status VARCHAR(50) DEFAULT 'available',
+    order_id INTEGER REFERENCES proxy_orders(id),
+    allocated_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(host, port)
+);
+
+-- Индекс для выдачи свободных эндпоинтов по локации и типу тарифа
+CREATE INDEX IF NOT EXISTS idx_proxy_inventory_available ON proxy_inventory(location, plan_type, id) WHERE status = 'available';
+CREATE INDEX IF NOT EXISTS idx_proxy_inventory_order_id ON proxy_inventory(order_id) WHERE order_id IS NOT NULL;
+
+-- Наполнение пула: SELECT seed_proxy_inventory('USA', 'private', '192.168.', 10000);
+CREATE OR REPLACE FUNCTION seed_proxy_inventory(p_location VARCHAR, p_plan_type VARCHAR, p_base_ip VARCHAR, p_count INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_offset INTEGER;
+    v_inserted INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO v_offset FROM proxy_inventory WHERE host LIKE p_base_ip || '%';
+    
+    INSERT INTO proxy_inventory (location, plan_type, host, port, username, password)
+    SELECT p_location,
+           p_plan_type,
+           p_base_ip || ((n / 256) % 256) || '.' || (n % 256),
+           8000 + n / 65536,
+           'user_' || substr(md5(random()::text), 1, 8),
+           'pass_' || substr(md5(random()::text), 1, 12)
+    FROM generate_series(v_offset, v_offset + p_count - 1) AS n
+    ON CONFLICT (host, port) DO NOTHING;
+    
+    GET DIAGNOSTICS v_inserted = ROW_COUNT;
+    RETURN v_inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Возврат эндпоинтов истёкших заказов в пул
+CREATE OR REPLACE FUNCTION release_expired_proxy_inventory()
+RETURNS INTEGER AS $$
+DECLARE
+    v_released INTEGER;
+BEGIN
+    UPDATE proxy_inventory pi
+    SET status = 'available', order_id = NULL, allocated_at = NULL
+    FROM proxy_orders po
+    WHERE pi.order_id = po.id AND po.expires_at < CURRENT_TIMESTAMP;
+    
+    GET DIAGNOSTICS v_released = ROW_COUNT;
+    RETURN v_released;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Начальная ёмкость пула для всех локаций тарифов
+SELECT seed_proxy_inventory(loc.location, pt.plan_type, loc.base_ip, 1000)
+FROM (VALUES
+    ('Russia', '45.141.'),
+    ('USA', '192.168.'),
+    ('Germany', '195.201.'),
+    ('France', '51.158.'),
+    ('Japan', '103.75.'),
+    ('Singapore', '128.199.')
+) AS loc(location, base_ip)
+CROSS JOIN (VALUES ('public'), ('private'), ('dedicated')) AS pt(plan_type);
@@ -0,0 +1,25 @@
+-- Версии кэшируемых справочников для инвалидации in-process кэшей
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name) VALUES ('proxy_plans') ON CONFLICT (name) DO NOTHING;
+
+-- Увеличение версии при любом изменении тарифов
+CREATE OR REPLACE FUNCTION bump_proxy_plans_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE cache_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE name = 'proxy_plans';
+    PERFORM pg_notify('cache_invalidate', 'proxy_plans');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_proxy_plans_version ON proxy_plans;
+CREATE TRIGGER trg_proxy_plans_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON proxy_plans
+FOR EACH STATEMENT EXECUTE FUNCTION bump_proxy_plans_version();
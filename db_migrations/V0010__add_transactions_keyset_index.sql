@@ -0,0 +1,5 @@
+-- Составной индекс для постраничной истории транзакций по курсору (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_id ON transactions(user_id, created_at DESC, id DESC);
+
+-- Одиночный индекс по user_id покрывается составным
+DROP INDEX IF EXISTS idx_transactions_user_id;
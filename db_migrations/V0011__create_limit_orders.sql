@@ -0,0 +1,24 @@
+-- Создание таблицы лимитных заявок
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    symbol VARCHAR(10) NOT NULL,
+    side VARCHAR(10) NOT NULL CHECK (side IN ('buy', 'sell')),
+    price_usd DECIMAL(20, 2) NOT NULL,
+    amount DECIMAL(20, 8) NOT NULL,
+    remaining DECIMAL(20, 8) NOT NULL,
+    reserved_usd DECIMAL(20, 2) DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'open' CHECK (status IN ('open', 'partial', 'filled', 'cancelled')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Версия стакана по символу: строка служит блокировкой и признаком устаревшего in-memory стакана
+CREATE TABLE IF NOT EXISTS order_book_state (
+    symbol VARCHAR(10) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1
+);
+
+-- Индексы для восстановления стакана и списка заявок пользователя
+CREATE INDEX IF NOT EXISTS idx_orders_symbol_open ON orders(symbol, id) WHERE status IN ('open', 'partial');
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id, id DESC);
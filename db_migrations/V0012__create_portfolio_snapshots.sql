@@ -0,0 +1,15 @@
+-- Снимки позиций для инкрементального расчёта себестоимости и PnL
+CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+    user_id INTEGER REFERENCES users(id),
+    symbol VARCHAR(10) NOT NULL,
+    last_tx_id INTEGER NOT NULL DEFAULT 0,
+    position DOUBLE PRECISION NOT NULL DEFAULT 0,
+    avg_cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    realized_pnl_avg DOUBLE PRECISION NOT NULL DEFAULT 0,
+    realized_pnl_fifo DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_price DOUBLE PRECISION NOT NULL DEFAULT 0,
+    fifo_lot_amounts DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    fifo_lot_prices DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, symbol)
+);
@@ -0,0 +1,11 @@
+-- Создание таблицы сессий (хранится только SHA-256 хеш токена)
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
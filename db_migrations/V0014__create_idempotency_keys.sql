@@ -0,0 +1,16 @@
+-- Ключи идемпотентности для POST-запросов trading и proxy: повтор с тем же ключом
+-- возвращает сохранённый ответ вместо повторного списания
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(32) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_headers JSONB,
+    response_body TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, user_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
@@ -0,0 +1,38 @@
+-- Частичные индексы по активным заказам: очередь на истечение и постраничная выдача без мёртвых строк
+CREATE INDEX IF NOT EXISTS idx_proxy_orders_active_expires_at ON proxy_orders(expires_at, id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_proxy_orders_active_user_created_id ON proxy_orders(user_id, created_at DESC, id DESC) WHERE status = 'active';
+DROP INDEX IF EXISTS idx_proxy_orders_status;
+
+-- Истечение одной порции заказов: заказ, его учётные данные и эндпоинты пула в одной транзакции.
+-- SKIP LOCKED позволяет нескольким воркерам разбирать очередь параллельно.
+CREATE OR REPLACE FUNCTION expire_proxy_orders(p_batch_size INTEGER)
+RETURNS TABLE(orders INTEGER, credentials INTEGER, inventory INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    WITH due AS (
+        SELECT id FROM proxy_orders
+        WHERE status = 'active' AND expires_at < CURRENT_TIMESTAMP
+        ORDER BY expires_at, id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    expired AS (
+        UPDATE proxy_orders po SET status = 'expired'
+        FROM due WHERE po.id = due.id
+        RETURNING po.id
+    ),
+    expired_credentials AS (
+        UPDATE proxy_credentials pc SET status = 'expired'
+        FROM expired WHERE pc.order_id = expired.id AND pc.status = 'active'
+        RETURNING pc.id
+    ),
+    released AS (
+        UPDATE proxy_inventory pi SET status = 'available', order_id = NULL, allocated_at = NULL
+        FROM expired WHERE pi.order_id = expired.id
+        RETURNING pi.id
+    )
+    SELECT (SELECT COUNT(*) FROM expired)::INTEGER,
+           (SELECT COUNT(*) FROM expired_credentials)::INTEGER,
+           (SELECT COUNT(*) FROM released)::INTEGER;
+END;
+$$ LANGUAGE plpgsql;
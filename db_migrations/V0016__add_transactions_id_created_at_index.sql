@@ -0,0 +1,3 @@
+-- Подготовка к секционированию transactions (V0018–V0020): уникальный индекс (id, created_at)
+-- станет первичным ключом старой кучи. CONCURRENTLY не блокирует запись, поэтому индекс — в отдельной миграции
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS transactions_id_created_at ON transactions(id, created_at);
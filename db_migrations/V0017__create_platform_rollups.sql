@@ -0,0 +1,52 @@
+-- Агрегаты по платформе для дашбордов: объём торгов по символу и дню, суммарные остатки по символу,
+-- выручка прокси по тарифу и локации. Обновляются функциями trading и proxy в транзакции самой записи;
+-- сверка с полным пересчётом — scripts/check_rollups.py
+
+CREATE TABLE IF NOT EXISTS trade_volume_daily (
+    day DATE NOT NULL,
+    symbol VARCHAR(10) NOT NULL,
+    trades BIGINT NOT NULL DEFAULT 0,
+    buy_amount DECIMAL(30, 8) NOT NULL DEFAULT 0,
+    sell_amount DECIMAL(30, 8) NOT NULL DEFAULT 0,
+    volume_usd DECIMAL(30, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, symbol)
+);
+
+CREATE TABLE IF NOT EXISTS holdings_totals (
+    symbol VARCHAR(10) PRIMARY KEY,
+    amount DECIMAL(30, 8) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS proxy_revenue (
+    plan_id INTEGER NOT NULL REFERENCES proxy_plans(id),
+    location VARCHAR(100) NOT NULL,
+    orders BIGINT NOT NULL DEFAULT 0,
+    proxies BIGINT NOT NULL DEFAULT 0,
+    revenue_usd DECIMAL(30, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (plan_id, location)
+);
+
+-- Начальное заполнение из существующих данных. Строки без created_at V0018 заполнит текущим
+-- временем, поэтому и здесь они относятся к сегодняшнему дню
+INSERT INTO trade_volume_daily (day, symbol, trades, buy_amount, sell_amount, volume_usd)
+SELECT COALESCE(created_at, CURRENT_TIMESTAMP)::date, symbol, COUNT(*),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'buy'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'sell'), 0),
+       SUM(total_usd)
+FROM transactions
+GROUP BY COALESCE(created_at, CURRENT_TIMESTAMP)::date, symbol
+ON CONFLICT (day, symbol) DO NOTHING;
+
+INSERT INTO holdings_totals (symbol, amount)
+SELECT symbol, SUM(amount) FROM crypto_balances GROUP BY symbol
+ON CONFLICT (symbol) DO NOTHING;
+
+INSERT INTO proxy_revenue (plan_id, location, orders, proxies, revenue_usd)
+SELECT plan_id, location, COUNT(*), COALESCE(SUM(quantity), 0), SUM(total_price)
+FROM proxy_orders
+WHERE plan_id IS NOT NULL
+GROUP BY plan_id, location
+ON CONFLICT (plan_id, location) DO NOTHING;
@@ -0,0 +1,17 @@
+-- Ограничения, которые позволят V0020 выполнить SET NOT NULL и ATTACH PARTITION без сканирования таблицы.
+-- NOT VALID берёт ACCESS EXCLUSIVE лишь на мгновение; проверка существующих строк — в V0019.
+-- Верхняя граница — начало месяца через два от текущего: запас на случай, если V0020 применится не сразу;
+-- до V0020 строки с created_at позже границы не вставятся.
+
+UPDATE transactions SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE transactions ADD CONSTRAINT chk_transactions_created_at_not_null CHECK (created_at IS NOT NULL) NOT VALID;
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE transactions ADD CONSTRAINT chk_transactions_legacy_range CHECK (created_at < %L) NOT VALID',
+        date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months'
+    );
+END;
+$$;
@@ -0,0 +1,3 @@
+-- VALIDATE CONSTRAINT держит SHARE UPDATE EXCLUSIVE: полный проход по таблице идёт без блокировки записи
+ALTER TABLE transactions VALIDATE CONSTRAINT chk_transactions_created_at_not_null;
+ALTER TABLE transactions VALIDATE CONSTRAINT chk_transactions_legacy_range;
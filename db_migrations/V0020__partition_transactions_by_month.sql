@@ -0,0 +1,110 @@
+-- Помесячное секционирование transactions по created_at.
+-- Существующая куча не копируется: она становится секцией transactions_legacy с верхней границей из
+-- chk_transactions_legacy_range. Индекс из V0016 и ограничения, проверенные в V0019, сводят каждый шаг
+-- под ACCESS EXCLUSIVE к изменению каталога, без прохода по таблице.
+
+-- Проверенный CHECK (created_at IS NOT NULL) избавляет SET NOT NULL от сканирования
+ALTER TABLE transactions ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE transactions
+    DROP CONSTRAINT transactions_pkey,
+    ADD CONSTRAINT transactions_legacy_pkey PRIMARY KEY USING INDEX transactions_id_created_at;
+
+ALTER TABLE transactions RENAME TO transactions_legacy;
+ALTER INDEX IF EXISTS idx_transactions_user_created_id RENAME TO idx_transactions_legacy_user_created_id;
+DROP INDEX IF EXISTS idx_transactions_created_at;
+
+-- Имя CHECK по type совпадает с ограничением старой кучи: ATTACH сопоставляет их по имени
+CREATE TABLE transactions (
+    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id INTEGER REFERENCES users(id),
+    type VARCHAR(10) NOT NULL CONSTRAINT transactions_type_check CHECK (type IN ('buy', 'sell')),
+    symbol VARCHAR(10) NOT NULL,
+    amount DECIMAL(20, 8) NOT NULL,
+    price_usd DECIMAL(20, 2) NOT NULL,
+    total_usd DECIMAL(20, 2) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Последовательность переходит к новой таблице, чтобы удаление архивной секции её не затронуло
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+-- Индексы на родителе создаются в каждой секции автоматически; у старой кучи подхватывается существующий
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_id ON transactions(user_id, created_at DESC, id DESC);
+
+DO $$
+DECLARE
+    v_bound TIMESTAMP;
+BEGIN
+    SELECT (regexp_match(pg_get_constraintdef(oid), '''([^'']+)'''))[1]::TIMESTAMP INTO v_bound
+    FROM pg_constraint
+    WHERE conrelid = 'transactions_legacy'::regclass AND conname = 'chk_transactions_legacy_range';
+
+    EXECUTE format(
+        'ALTER TABLE transactions ATTACH PARTITION transactions_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        v_bound
+    );
+END;
+$$;
+
+ALTER TABLE transactions_legacy
+    DROP CONSTRAINT chk_transactions_legacy_range,
+    DROP CONSTRAINT chk_transactions_created_at_not_null;
+
+-- Создание помесячных секций на p_months_ahead месяцев вперёд; уже покрытые диапазоны пропускаются.
+-- Вызывается из scripts/archive_transactions.py по cron, не из обработчиков: CREATE TABLE ... PARTITION OF
+-- встаёт в очередь за долгими читателями родителя, поэтому ожидание блокировки ограничено lock_timeout
+CREATE OR REPLACE FUNCTION ensure_transactions_partitions(p_months_ahead INTEGER)
+RETURNS INTEGER
+SET lock_timeout = '5s'
+AS $$
+DECLARE
+    v_month TIMESTAMP;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    FOR i IN 0..p_months_ahead LOOP
+        v_month := date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => i);
+        v_name := 'transactions_' || to_char(v_month, 'YYYY_MM');
+
+        IF to_regclass(v_name) IS NOT NULL THEN
+            CONTINUE;
+        END IF;
+
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_month + INTERVAL '1 month'
+            );
+            v_created := v_created + 1;
+        EXCEPTION
+            WHEN invalid_object_definition THEN
+                -- Диапазон уже покрыт другой секцией (например, transactions_legacy)
+                NULL;
+            WHEN duplicate_table THEN
+                -- Секцию одновременно создал другой запуск
+                NULL;
+        END;
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_transactions_partitions(6);
+
+-- Секции, целиком лежащие раньше p_before: кандидаты на отключение и архивирование
+CREATE OR REPLACE FUNCTION transactions_partitions_before(p_before TIMESTAMP)
+RETURNS TABLE(partition_name TEXT, range_end TIMESTAMP) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT c.relname::TEXT, bounds.range_end
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    CROSS JOIN LATERAL (
+        SELECT (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::TIMESTAMP AS range_end
+    ) bounds
+    WHERE i.inhparent = 'transactions'::regclass AND bounds.range_end <= p_before
+    ORDER BY bounds.range_end;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,4 @@
+-- Учтённые в снимке id транзакций в окне ниже last_tx_id: окно перечитывается, чтобы не пропустить
+-- сделку с меньшим id, зафиксированную позже, а эти id отсекают уже учтённые.
+-- Константный DEFAULT не переписывает таблицу (PostgreSQL 11+)
+ALTER TABLE portfolio_snapshots ADD COLUMN IF NOT EXISTS recent_tx_ids INTEGER[] NOT NULL DEFAULT '{}';
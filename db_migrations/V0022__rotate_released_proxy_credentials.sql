@@ -0,0 +1,45 @@
+-- Эндпоинт, вернувшийся в пул после истечения заказа, получает новые логин и пароль: иначе прежний
+-- покупатель продолжает входить в прокси следующего. Пароль истёкших учётных данных обнуляется.
+CREATE OR REPLACE FUNCTION expire_proxy_orders(p_batch_size INTEGER)
+RETURNS TABLE(orders INTEGER, credentials INTEGER, inventory INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    WITH due AS (
+        SELECT id FROM proxy_orders
+        WHERE status = 'active' AND expires_at < CURRENT_TIMESTAMP
+        ORDER BY expires_at, id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    expired AS (
+        UPDATE proxy_orders po SET status = 'expired'
+        FROM due WHERE po.id = due.id
+        RETURNING po.id
+    ),
+    expired_credentials AS (
+        UPDATE proxy_credentials pc SET status = 'expired', proxy_password = NULL
+        FROM expired WHERE pc.order_id = expired.id AND pc.status = 'active'
+        RETURNING pc.id
+    ),
+    released AS (
+        UPDATE proxy_inventory pi
+        SET status = 'available', order_id = NULL, allocated_at = NULL,
+            username = 'user_' || substr(md5(random()::text), 1, 8),
+            password = 'pass_' || substr(md5(random()::text), 1, 12)
+        FROM expired WHERE pi.order_id = expired.id
+        RETURNING pi.id
+    )
+    SELECT (SELECT COUNT(*) FROM expired)::INTEGER,
+           (SELECT COUNT(*) FROM expired_credentials)::INTEGER,
+           (SELECT COUNT(*) FROM released)::INTEGER;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Эндпоинты, уже возвращённые в пул со старыми учётными данными
+UPDATE proxy_inventory pi
+SET username = 'user_' || substr(md5(random()::text), 1, 8),
+    password = 'pass_' || substr(md5(random()::text), 1, 12)
+WHERE pi.status = 'available'
+  AND EXISTS (SELECT 1 FROM proxy_credentials pc WHERE pc.proxy_host = pi.host AND pc.proxy_port = pi.port);
+
+UPDATE proxy_credentials SET proxy_password = NULL WHERE status <> 'active' AND proxy_password IS NOT NULL;
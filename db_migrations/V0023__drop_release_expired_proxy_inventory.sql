@@ -0,0 +1,3 @@
+-- release_expired_proxy_inventory() возвращала эндпоинты в пул без смены учётных данных и нигде не вызывалась:
+-- истечение заказов целиком выполняет expire_proxy_orders (V0022)
+DROP FUNCTION IF EXISTS release_expired_proxy_inventory();
@@ -0,0 +1,8 @@
+-- Строки trade_volume_daily (символ, день) и holdings_totals (символ) обновлялись каждой сделкой по символу
+-- и сериализовали все сделки на блокировке одной строки. Счётчики разбиваются на шарды: сделка прибавляет
+-- свою дельту к случайному шарду, читатели суммируют шарды. Существующие строки становятся шардом 0
+ALTER TABLE trade_volume_daily ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE trade_volume_daily DROP CONSTRAINT IF EXISTS trade_volume_daily_pkey, ADD PRIMARY KEY (day, symbol, shard);
+
+ALTER TABLE holdings_totals ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE holdings_totals DROP CONSTRAINT IF EXISTS holdings_totals_pkey, ADD PRIMARY KEY (symbol, shard);
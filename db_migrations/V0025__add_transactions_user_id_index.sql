@@ -0,0 +1,5 @@
+-- Инкрементальный пересчёт портфеля читает сделки пользователя по id (user_id = ? AND id > ? ORDER BY id).
+-- Индекс (user_id, created_at DESC, id DESC) этот порядок не даёт, поэтому каждая секция читалась целиком.
+-- Индекс на родителе создаётся в каждой секции, и новые секции получают его автоматически;
+-- на время построения запись в секцию блокируется (SHARE), поэтому миграцию стоит запускать вне пика
+CREATE INDEX IF NOT EXISTS idx_transactions_user_id_id ON transactions(user_id, id);
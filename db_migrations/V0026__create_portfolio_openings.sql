@@ -0,0 +1,18 @@
+-- Открывающие позиции на границе архива transactions: scripts/archive_transactions.py перед отключением
+-- секции сворачивает её сделки в состояние позиции (с лотами FIFO). Пересчёт портфеля начинается с этого
+-- состояния и читает только сделки с created_at >= archived_through, поэтому удалённые секции ему не нужны
+CREATE TABLE IF NOT EXISTS portfolio_openings (
+    user_id INTEGER REFERENCES users(id),
+    symbol VARCHAR(10) NOT NULL,
+    last_tx_id INTEGER NOT NULL DEFAULT 0,
+    archived_through TIMESTAMP NOT NULL,
+    position DOUBLE PRECISION NOT NULL DEFAULT 0,
+    avg_cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    realized_pnl_avg DOUBLE PRECISION NOT NULL DEFAULT 0,
+    realized_pnl_fifo DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_price DOUBLE PRECISION NOT NULL DEFAULT 0,
+    fifo_lot_amounts DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    fifo_lot_prices DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, symbol)
+);
@@ -0,0 +1,10 @@
+-- Уведомление cache_invalidate никто не слушал: инстансы сверяют версию в cache_versions по PLANS_CACHE_TTL
+CREATE OR REPLACE FUNCTION bump_proxy_plans_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE cache_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE name = 'proxy_plans';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
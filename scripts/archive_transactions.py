@@ -0,0 +1,174 @@
+'''
+Обслуживание секций transactions: создаёт помесячные секции наперёд, а секции старше --keep-months
+отключает от родителя, выгружает в gzip-CSV и удаляет после сверки числа строк. Перед отключением сделки
+секции сворачиваются в открывающие позиции portfolio_openings, с которых trading пересчитывает портфель.
+Создание секций вынесено из обработчиков trading, поэтому скрипт должен запускаться по cron (например, ежедневно).
+Запуск: DATABASE_URL=... python scripts/archive_transactions.py --keep-months 12 --archive-dir archive/transactions
+'''
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORTFOLIO = os.path.join(ROOT, 'backend', 'trading', 'portfolio.py')
+
+def load_portfolio():
+    spec = importlib.util.spec_from_file_location('trading_portfolio', PORTFOLIO)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def record_openings(conn, portfolio, name: str, range_end) -> int:
+    # Секция ещё подключена: пока открывающие позиции не записаны, её сделки видны пересчёту, а после —
+    # отсекаются условием created_at >= archived_through, поэтому двойного учёта нет
+    cur = conn.cursor()
+    try:
+        cur.execute(sql.SQL('SELECT DISTINCT user_id FROM {} WHERE user_id IS NOT NULL').format(sql.Identifier(name)))
+        user_ids = [row['user_id'] for row in cur.fetchall()]
+        
+        for user_id in user_ids:
+            cur.execute("SELECT * FROM portfolio_openings WHERE user_id = %s", (user_id,))
+            states = {
+                row['symbol']: portfolio.PositionState(
+                    row['position'], row['avg_cost'], row['realized_pnl_avg'], row['realized_pnl_fifo'],
+                    row['last_price'], row['fifo_lot_amounts'], row['fifo_lot_prices']
+                )
+                for row in cur.fetchall()
+            }
+            cur.execute(
+                sql.SQL("SELECT id, symbol, type = 'buy' AS is_buy, amount::float8 AS amount, price_usd::float8 AS price FROM {} WHERE user_id = %s ORDER BY id").format(sql.Identifier(name)),
+                (user_id,)
+            )
+            rows = cur.fetchall()
+            symbols = np.array([row['symbol'] for row in rows])
+            is_buy = np.fromiter((row['is_buy'] for row in rows), dtype=bool, count=len(rows))
+            amounts = np.fromiter((row['amount'] for row in rows), dtype=np.float64, count=len(rows))
+            prices = np.fromiter((row['price'] for row in rows), dtype=np.float64, count=len(rows))
+            last_ids = {}
+            for symbol, idx in portfolio.split_by_symbol(symbols):
+                states[symbol] = portfolio.apply_trades(states.get(symbol, portfolio.PositionState()), is_buy[idx], amounts[idx], prices[idx])
+                last_ids[symbol] = rows[idx[-1]]['id']
+            
+            execute_values(
+                cur,
+                '''INSERT INTO portfolio_openings
+                   (user_id, symbol, last_tx_id, archived_through, position, avg_cost, realized_pnl_avg, realized_pnl_fifo,
+                    last_price, fifo_lot_amounts, fifo_lot_prices)
+                   VALUES %s
+                   ON CONFLICT (user_id, symbol) DO UPDATE SET
+                       last_tx_id = GREATEST(portfolio_openings.last_tx_id, EXCLUDED.last_tx_id),
+                       archived_through = EXCLUDED.archived_through, position = EXCLUDED.position,
+                       avg_cost = EXCLUDED.avg_cost, realized_pnl_avg = EXCLUDED.realized_pnl_avg,
+                       realized_pnl_fifo = EXCLUDED.realized_pnl_fifo, last_price = EXCLUDED.last_price,
+                       fifo_lot_amounts = EXCLUDED.fifo_lot_amounts, fifo_lot_prices = EXCLUDED.fifo_lot_prices,
+                       updated_at = CURRENT_TIMESTAMP''',
+                [
+                    (user_id, symbol, last_ids.get(symbol, 0), range_end, state.position, state.avg_cost, state.realized_avg,
+                     state.realized_fifo, state.last_price, state.lot_amounts.tolist(), state.lot_prices.tolist())
+                    for symbol, state in sorted(states.items())
+                ],
+                template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s::float8[], %s::float8[])'
+            )
+        return len(user_ids)
+    finally:
+        cur.close()
+
+def archive_partition(conn, portfolio, name: str, range_end, archive_dir: str, keep_detached: bool, concurrently: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    users = record_openings(conn, portfolio, name, range_end)
+    cur = conn.cursor()
+    try:
+        detach = 'ALTER TABLE transactions DETACH PARTITION {} CONCURRENTLY' if concurrently else 'ALTER TABLE transactions DETACH PARTITION {}'
+        cur.execute(sql.SQL(detach).format(sql.Identifier(name)))
+        
+        cur.execute(sql.SQL('SELECT COUNT(*) AS rows FROM {}').format(sql.Identifier(name)))
+        expected = cur.fetchone()['rows']
+        
+        path = os.path.join(archive_dir, f'{name}.csv.gz')
+        with open(path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                cur.copy_expert(
+                    sql.SQL('COPY (SELECT * FROM {} ORDER BY created_at, id) TO STDOUT WITH (FORMAT csv, HEADER)').format(sql.Identifier(name)).as_string(conn),
+                    f
+                )
+                exported = cur.rowcount
+            raw.flush()
+            os.fsync(raw.fileno())
+        
+        if exported != expected:
+            raise RuntimeError(f'{name}: exported {exported} rows, expected {expected}; partition kept detached')
+        
+        if not keep_detached:
+            cur.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(name)))
+        
+        return {
+            'partition': name,
+            'rows': exported,
+            'opening_users': users,
+            'file': path,
+            'bytes': os.path.getsize(path),
+            'dropped': not keep_detached,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    finally:
+        cur.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Create upcoming transactions partitions and archive old ones')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--months-ahead', type=int, default=6)
+    parser.add_argument('--keep-months', type=int, default=12)
+    parser.add_argument('--archive-dir', default='archive/transactions')
+    parser.add_argument('--keep-detached', action='store_true', help='do not drop partitions after export')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    
+    conn = psycopg2.connect(args.dsn, cursor_factory=RealDictCursor)
+    conn.autocommit = True
+    cur = conn.cursor()
+    
+    try:
+        cur.execute('SELECT ensure_transactions_partitions(%s) AS created', (args.months_ahead,))
+        created = cur.fetchone()['created']
+        
+        cur.execute(
+            "SELECT partition_name, range_end FROM transactions_partitions_before((date_trunc('month', CURRENT_TIMESTAMP) - make_interval(months => %s))::timestamp)",
+            (args.keep_months,)
+        )
+        candidates = cur.fetchall()
+        
+        archived: List[Dict[str, Any]] = []
+        if not args.dry_run and candidates:
+            os.makedirs(args.archive_dir, exist_ok=True)
+            concurrently = conn.server_version >= 140000
+            portfolio = load_portfolio()
+            for row in candidates:
+                archived.append(archive_partition(
+                    conn, portfolio, row['partition_name'], row['range_end'], args.archive_dir, args.keep_detached, concurrently
+                ))
+        
+        print(json.dumps({
+            'event': 'transactions_partitions',
+            'created': created,
+            'candidates': [row['partition_name'] for row in candidates],
+            'archived': archived,
+            'dry_run': args.dry_run
+        }, default=str))
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
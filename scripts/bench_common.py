@@ -0,0 +1,42 @@
+'''
+Общие помощники бенчмарков из scripts/: загрузка модулей backend-функций по пути к файлу
+и перцентили латентности. Скрипты запускаются как python scripts/<name>.py, поэтому каталог
+scripts/ уже в sys.path и модуль импортируется напрямую: from bench_common import ...
+'''
+import importlib.util
+import os
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+
+def load_module(module_name: str, path: str):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_function(name: str, module_name: str):
+    # index.py импортирует соседние модули функции (models.py и др.), поэтому её каталог добавляется в sys.path
+    function_dir = os.path.join(BACKEND, name)
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    return load_module(module_name, os.path.join(function_dir, 'index.py'))
+
+def load_trading(module_name: str = 'bench_trading_index'):
+    return load_function('trading', module_name)
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3)
+    }
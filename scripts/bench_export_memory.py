@@ -0,0 +1,134 @@
+'''
+Проверка памяти экспорта: пользователю с большой историей (по умолчанию 10 000 000 сделок) выгружается
+вся история постранично через action=export функции trading, по X-Next-Cursor до конца. Каждая страница
+должна укладываться в EXPORT_MAX_BYTES, а пиковый RSS процесса после первой страницы — почти не расти:
+память ограничена одной страницей, а не размером истории. При нарушении скрипт завершается с кодом 1.
+Запуск: DATABASE_URL=... python scripts/bench_export_memory.py --rows 10000000 --format ndjson --output export_memory_output.json
+'''
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from typing import Dict, Any
+
+import psycopg2
+
+from bench_common import load_trading
+
+ROW_SLACK_BYTES = 4096
+LOAD_CHUNK = 1000000
+
+def seed_history(dsn: str, rows: int) -> int:
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (email, password_hash, full_name) VALUES (%s, 'x', 'Export Memory') RETURNING id",
+                (f'export-{uuid.uuid4().hex[:12]}@example.com',)
+            )
+            user_id = cur.fetchone()[0]
+            conn.commit()
+            # Время сделок идёт назад от текущего момента и попадает в уже созданные секции transactions;
+            # вставка частями по LOAD_CHUNK, чтобы 1e7 строк не шли одной транзакцией
+            for offset in range(1, rows + 1, LOAD_CHUNK):
+                cur.execute(
+                    '''INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd, created_at)
+                       SELECT %s, CASE WHEN mod(g, 2) = 0 THEN 'buy' ELSE 'sell' END, (ARRAY['BTC', 'ETH', 'SOL'])[mod(g, 3) + 1],
+                              0.01250000, 61234.56, 765.43, CURRENT_TIMESTAMP - make_interval(secs => g)
+                       FROM generate_series(%s::bigint, %s::bigint) g''',
+                    (user_id, offset, min(offset + LOAD_CHUNK, rows + 1) - 1)
+                )
+                conn.commit()
+            cur.execute('ANALYZE transactions')
+        return user_id
+    finally:
+        conn.close()
+
+def max_rss_mb() -> float:
+    # ru_maxrss в Linux — килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a large history page by page and check that memory stays bounded')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--max-rss-growth-mb', type=float, default=32.0, help='allowed peak RSS growth after the first page')
+    parser.add_argument('--output', default='export_memory_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['AUTH_REQUIRED'] = '0'
+    os.environ['RATE_LIMIT_USER_RPS'] = '0'
+    os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    trading = load_trading('export_trading_index')
+    user_id = seed_history(args.dsn, args.rows)
+    
+    pages = []
+    cursor = None
+    baseline_rss = None
+    started = time.perf_counter()
+    while True:
+        params = {'action': 'export', 'user_id': str(user_id), 'format': args.format}
+        if cursor:
+            params['cursor'] = cursor
+        page_started = time.perf_counter()
+        response = trading.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': params}, None)
+        if response['statusCode'] != 200:
+            raise SystemExit(f"export failed with {response['statusCode']}: {response['body'][:200]}")
+        
+        pages.append({
+            'rows': int(response['headers']['X-Export-Rows']),
+            'bytes': len(response['body'].encode()),
+            'ms': round((time.perf_counter() - page_started) * 1000, 1),
+            'max_rss_mb': round(max_rss_mb(), 1)
+        })
+        if baseline_rss is None:
+            baseline_rss = max_rss_mb()
+        cursor = response['headers'].get('X-Next-Cursor')
+        del response
+        if not cursor:
+            break
+    elapsed = time.perf_counter() - started
+    
+    exported = sum(page['rows'] for page in pages)
+    largest = max(page['bytes'] for page in pages)
+    rss_growth = max_rss_mb() - baseline_rss
+    result: Dict[str, Any] = {
+        'user_id': user_id,
+        'format': args.format,
+        'rows_seeded': args.rows,
+        'rows_exported': exported,
+        'pages': len(pages),
+        'elapsed_s': round(elapsed, 2),
+        'export_max_rows': trading.EXPORT_MAX_ROWS,
+        'export_max_bytes': trading.EXPORT_MAX_BYTES,
+        'largest_page_bytes': largest,
+        'baseline_rss_mb': round(baseline_rss, 1),
+        'peak_rss_mb': round(max_rss_mb(), 1),
+        'rss_growth_mb': round(rss_growth, 1),
+        'page_samples': pages[:3] + pages[-3:]
+    }
+    result['passed'] = (
+        exported == args.rows
+        and largest <= trading.EXPORT_MAX_BYTES + ROW_SLACK_BYTES
+        and rss_growth <= args.max_rss_growth_mb
+    )
+    
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    
+    print(f"{exported}/{args.rows} rows in {len(pages)} pages, {result['elapsed_s']} s; largest page {largest} B "
+          f"(limit {trading.EXPORT_MAX_BYTES} B); peak RSS {result['peak_rss_mb']} MB, "
+          f"growth after first page {result['rss_growth_mb']} MB")
+    if not result['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
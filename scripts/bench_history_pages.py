@@ -0,0 +1,143 @@
+'''
+Латентность страниц action=history функции trading у пользователя с малой (по умолчанию 1e3) и большой (1e7)
+историей в одной таблице transactions: первая страница, страница из середины и из конца истории по курсору,
+фильтр по символу и окно по дате. Благодаря индексу (user_id, created_at DESC, id DESC) каждая страница —
+один проход по диапазону индекса, поэтому p50 большого пользователя не должен заметно отличаться от малого;
+иначе скрипт завершается с кодом 1.
+Запуск: DATABASE_URL=... python scripts/bench_history_pages.py --small-rows 1000 --large-rows 10000000 --output history_pages_output.json
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, Any
+
+import psycopg2
+
+from bench_common import load_trading, latency_stats
+
+LOAD_CHUNK = 1000000
+SECONDS_PER_DAY = 86400
+
+def seed_user(cur, rows: int, days: int) -> int:
+    cur.execute(
+        "INSERT INTO users (email, password_hash, full_name) VALUES (%s, 'x', 'History Bench') RETURNING id",
+        (f'history-{uuid.uuid4().hex[:12]}@example.com',)
+    )
+    user_id = cur.fetchone()[0]
+    # Сделки равномерно распределены по последним --days дням, от новых к старым
+    for offset in range(0, rows, LOAD_CHUNK):
+        cur.execute(
+            '''INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd, created_at)
+               SELECT %s, CASE WHEN mod(n, 2) = 0 THEN 'buy' ELSE 'sell' END, (ARRAY['BTC', 'ETH', 'SOL'])[mod(n, 3) + 1],
+                      0.01, 60000, 600, CURRENT_TIMESTAMP - make_interval(secs => n * %s::float8 / %s)
+               FROM generate_series(%s::bigint, %s::bigint) AS n''',
+            (user_id, days * SECONDS_PER_DAY, rows, offset, min(offset + LOAD_CHUNK, rows) - 1)
+        )
+    return user_id
+
+def row_at(cur, user_id: int, offset: int):
+    cur.execute(
+        "SELECT created_at, id FROM transactions WHERE user_id = %s ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1",
+        (user_id, offset)
+    )
+    return cur.fetchone()
+
+def bench_page(trading, user_id: int, params: Dict[str, str], samples: int) -> Dict[str, Any]:
+    timings = []
+    rows = 0
+    for _ in range(samples):
+        query = {'action': 'history', 'user_id': str(user_id), **params}
+        started = time.perf_counter()
+        response = trading.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': query}, None)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            raise SystemExit(f"history failed with {response['statusCode']}: {response['body'][:200]}")
+        rows = len(json.loads(response['body']))
+    return {**latency_stats(timings), 'rows': rows}
+
+def scenarios(trading, cur, user_id: int, rows: int, days: int, limit: int) -> Dict[str, Dict[str, str]]:
+    def cursor_at(offset: int) -> str:
+        row = row_at(cur, user_id, offset)
+        return trading.encode_cursor(row[0], row[1])
+    
+    window_end = row_at(cur, user_id, rows // 2)[0]
+    base = {'limit': str(limit)}
+    return {
+        'first_page': base,
+        'middle_page': {**base, 'cursor': cursor_at(rows // 2)},
+        'last_page': {**base, 'cursor': cursor_at(max(rows - limit - 1, 0))},
+        'symbol_filter': {**base, 'symbol': 'ETH'},
+        'date_window': {
+            **base,
+            'from': (window_end - timedelta(days=max(days // 30, 1))).isoformat(),
+            'to': window_end.isoformat()
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that history page latency does not grow with the size of the history')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--small-rows', type=int, default=1000)
+    parser.add_argument('--large-rows', type=int, default=10000000)
+    parser.add_argument('--days', type=int, default=365, help='history span for both users')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--max-ratio', type=float, default=2.0, help='allowed large/small p50 ratio')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='absolute p50 difference always accepted')
+    parser.add_argument('--output', default='history_pages_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['AUTH_REQUIRED'] = '0'
+    os.environ['RATE_LIMIT_USER_RPS'] = '0'
+    os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    trading = load_trading('history_trading_index')
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    report: Dict[str, Any] = {'small_rows': args.small_rows, 'large_rows': args.large_rows, 'days': args.days, 'limit': args.limit}
+    
+    try:
+        users = {}
+        for name, rows in (('small', args.small_rows), ('large', args.large_rows)):
+            started = time.perf_counter()
+            users[name] = (seed_user(cur, rows, args.days), rows)
+            report[f'{name}_load_s'] = round(time.perf_counter() - started, 1)
+        cur.execute('ANALYZE transactions')
+        
+        for name, (user_id, rows) in users.items():
+            report[name] = {
+                scenario: bench_page(trading, user_id, params, args.samples)
+                for scenario, params in scenarios(trading, cur, user_id, rows, args.days, args.limit).items()
+            }
+    finally:
+        cur.close()
+        conn.close()
+    
+    report['flat'] = {}
+    for scenario, small in report['small'].items():
+        large = report['large'][scenario]
+        report['flat'][scenario] = (
+            large['p50_ms'] <= small['p50_ms'] * args.max_ratio or large['p50_ms'] - small['p50_ms'] <= args.slack_ms
+        )
+    report['passed'] = all(report['flat'].values())
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for scenario in report['small']:
+        small, large = report['small'][scenario], report['large'][scenario]
+        print(f"{scenario}: {args.small_rows} rows p50 {small['p50_ms']} / p99 {small['p99_ms']} ms, "
+              f"{args.large_rows} rows p50 {large['p50_ms']} / p99 {large['p99_ms']} ms, flat {report['flat'][scenario]}")
+    if not report['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
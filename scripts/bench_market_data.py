@@ -0,0 +1,153 @@
+'''
+Пропускная способность кэша рыночных данных backend/trading/marketdata.py без БД и без handler:
+приём тиков пачками (ingest_batch), по одному (ingest) и через ReplayTickSource из NDJSON, затем чтение
+свечей всех интервалов и последней цены. Свечи после пачечного и поштучного приёма одного потока
+должны совпадать; при расхождении или пачечном приёме ниже --target тиков в секунду скрипт завершается с кодом 1.
+Запуск: python scripts/bench_market_data.py --ticks 1000000 --symbols 3 --batch-size 1000 --output market_data_bench_output.json
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from bench_common import BACKEND, load_module, percentile
+
+MARKETDATA = os.path.join(BACKEND, 'trading', 'marketdata.py')
+
+def make_ticks(count: int, symbols: int, rate: float, seed: int):
+    # Поток генерируется заранее: случайное блуждание цены и пуассоновские интервалы между тиками
+    rng = np.random.default_rng(seed)
+    names = np.array([f'SYM{i}' for i in range(symbols)])
+    symbol = names[rng.integers(0, symbols, count)]
+    ts = 1700000000 + np.cumsum(rng.exponential(1 / rate, count))
+    price = 60000 * np.exp(np.cumsum(rng.normal(0, 1e-4, count)))
+    volume = rng.uniform(0.001, 2.0, count)
+    return symbol, ts, price, volume
+
+def bench_batches(marketdata, ticks, batch_size: int, args):
+    market = marketdata.MarketData(args.tick_capacity, args.candle_capacity)
+    symbol, ts, price, volume = ticks
+    started = time.perf_counter()
+    for offset in range(0, len(ts), batch_size):
+        end = offset + batch_size
+        market.ingest_batch((symbol[offset:end], ts[offset:end], price[offset:end], volume[offset:end]))
+    return market, time.perf_counter() - started
+
+def bench_single(marketdata, ticks, count: int, args):
+    market = marketdata.MarketData(args.tick_capacity, args.candle_capacity)
+    rows = list(zip(*(column[:count].tolist() for column in ticks)))
+    started = time.perf_counter()
+    for symbol, ts, price, volume in rows:
+        market.ingest(symbol, ts, price, volume)
+    return market, time.perf_counter() - started
+
+def bench_replay(marketdata, ticks, count: int, args) -> float:
+    market = marketdata.MarketData(args.tick_capacity, args.candle_capacity)
+    with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+        path = f.name
+        for symbol, ts, price, volume in zip(*(column[:count].tolist() for column in ticks)):
+            f.write(json.dumps({'symbol': symbol, 'ts': ts, 'price': price, 'volume': volume}) + '\n')
+    try:
+        source = marketdata.ReplayTickSource(path, args.batch_size)
+        started = time.perf_counter()
+        batch = source.poll()
+        while batch is not None:
+            market.ingest_batch(batch)
+            batch = source.poll()
+        return time.perf_counter() - started
+    finally:
+        os.unlink(path)
+
+def bench_reads(marketdata, market, reads: int, limit: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    symbols = sorted(market.symbols)
+    report: Dict[str, Any] = {}
+    for interval in list(marketdata.INTERVALS) + ['last_price']:
+        timings = []
+        for _ in range(reads):
+            symbol = rng.choice(symbols)
+            started = time.perf_counter()
+            if interval == 'last_price':
+                market.last_price(symbol)
+            else:
+                market.candles(symbol, interval, limit)
+            timings.append((time.perf_counter() - started) * 1e6)
+        report[interval] = {
+            'reads_per_s': round(reads / (sum(timings) / 1e6)),
+            'p50_us': round(percentile(timings, 50), 1),
+            'p99_us': round(percentile(timings, 99), 1)
+        }
+    return report
+
+def same_candles(marketdata, left, right, symbols: List[str], limit: int) -> bool:
+    for symbol in symbols:
+        for interval in marketdata.INTERVALS:
+            a = np.array([list(row.values()) for row in left.candles(symbol, interval, limit)])
+            b = np.array([list(row.values()) for row in right.candles(symbol, interval, limit)])
+            if a.shape != b.shape or not np.allclose(a, b):
+                return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tick ingest and candle reads of the in-memory market data cache')
+    parser.add_argument('--ticks', type=int, default=1000000)
+    parser.add_argument('--symbols', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=20.0, help='mean ticks per second of market time')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--single-ticks', type=int, default=100000, help='ticks ingested one by one')
+    parser.add_argument('--replay-ticks', type=int, default=200000, help='ticks replayed from an NDJSON file')
+    parser.add_argument('--tick-capacity', type=int, default=4096)
+    parser.add_argument('--candle-capacity', type=int, default=1440)
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=100, help='candles per read')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--target', type=int, default=500000, help='minimum acceptable batch ingest ticks/s')
+    parser.add_argument('--output', default='market_data_bench_output.json')
+    args = parser.parse_args()
+    
+    marketdata = load_module('trading_marketdata', MARKETDATA)
+    ticks = make_ticks(args.ticks, args.symbols, args.rate, args.seed)
+    
+    market, batch_s = bench_batches(marketdata, ticks, args.batch_size, args)
+    single_market, single_s = bench_single(marketdata, ticks, args.single_ticks, args)
+    replay_s = bench_replay(marketdata, ticks, args.replay_ticks, args)
+    
+    # Сверка: тот же префикс потока пачками и по одному тику даёт одинаковые свечи
+    prefix = tuple(column[:args.single_ticks] for column in ticks)
+    prefix_market, _ = bench_batches(marketdata, prefix, args.batch_size, args)
+    consistent = same_candles(marketdata, prefix_market, single_market, sorted(single_market.symbols), args.candle_capacity)
+    
+    result: Dict[str, Any] = {
+        'ticks': args.ticks,
+        'symbols': args.symbols,
+        'batch_size': args.batch_size,
+        'batch_ingest_ticks_per_s': round(args.ticks / batch_s),
+        'single_ingest_ticks_per_s': round(args.single_ticks / single_s),
+        'replay_ingest_ticks_per_s': round(args.replay_ticks / replay_s),
+        'reads': bench_reads(marketdata, market, args.reads, args.limit, args.seed),
+        'candles_consistent': consistent,
+        'target_ticks_per_s': args.target
+    }
+    result['passed'] = consistent and result['batch_ingest_ticks_per_s'] >= args.target
+    
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    
+    reads = result['reads']
+    print(f"ingest: batch {result['batch_ingest_ticks_per_s']} ticks/s, single {result['single_ingest_ticks_per_s']} ticks/s, "
+          f"replay {result['replay_ingest_ticks_per_s']} ticks/s; "
+          + ', '.join(f"{name} {stats['reads_per_s']} reads/s (p99 {stats['p99_us']} us)" for name, stats in reads.items())
+          + f"; candles consistent {consistent}")
+    if not result['passed']:
+        if result['batch_ingest_ticks_per_s'] < args.target:
+            print(f"below target of {args.target} ticks/s", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+Пропускная способность стакана backend/trading/orderbook.py на синтетическом потоке заявок:
+лимитные заявки вокруг средней цены вперемешку с отменами, без БД и без handler.
+Цель — не меньше 100 000 операций в секунду; при более низком результате скрипт завершается с кодом 1.
+Запуск: python scripts/bench_matching.py --ops 1000000 --cancel-ratio 0.2 --output matching_bench_output.json
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, Any, List, Tuple
+
+from bench_common import BACKEND, load_module
+
+ORDERBOOK = os.path.join(BACKEND, 'trading', 'orderbook.py')
+
+def make_flow(count: int, cancel_ratio: float, users: int, spread_ticks: int, seed: int) -> List[Tuple[Any, ...]]:
+    # Поток генерируется заранее, чтобы в замер попадало только сопоставление
+    rng = random.Random(seed)
+    mid = 6_000_000
+    flow = []
+    next_id = 1
+    for _ in range(count):
+        if next_id > 1 and rng.random() < cancel_ratio:
+            flow.append(('cancel', rng.randrange(1, next_id)))
+            continue
+        side = 'buy' if rng.random() < 0.5 else 'sell'
+        offset = rng.randint(-spread_ticks, spread_ticks)
+        amount = rng.randint(1, 100) * 1_000_000
+        flow.append(('add', next_id, rng.randrange(1, users + 1), side, mid + offset, amount))
+        next_id += 1
+    return flow
+
+def run(orderbook, flow: List[Tuple[Any, ...]], chunk: int) -> Dict[str, Any]:
+    book = orderbook.OrderBook('BTC')
+    Order = orderbook.Order
+    fills = 0
+    cancels = 0
+    chunk_rates = []
+    
+    started = time.perf_counter()
+    chunk_started = started
+    for i, op in enumerate(flow, 1):
+        if op[0] == 'add':
+            _, order_id, user_id, side, price, amount = op
+            fills += len(book.add(Order(order_id, user_id, side, price, amount)))
+        elif book.cancel(op[1]) is not None:
+            cancels += 1
+        if i % chunk == 0:
+            now = time.perf_counter()
+            chunk_rates.append(chunk / (now - chunk_started))
+            chunk_started = now
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'ops': len(flow),
+        'elapsed_s': round(elapsed, 3),
+        'ops_per_s': round(len(flow) / elapsed),
+        'chunk_ops_per_s_min': round(min(chunk_rates)) if chunk_rates else None,
+        'chunk_ops_per_s_median': round(statistics.median(chunk_rates)) if chunk_rates else None,
+        'fills': fills,
+        'cancelled': cancels,
+        'resting_orders': len(book.orders),
+        'levels': {side: len(levels) for side, levels in book.depth(10 ** 9).items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the in-memory matching engine on synthetic order flow')
+    parser.add_argument('--ops', type=int, default=1000000)
+    parser.add_argument('--cancel-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--spread-ticks', type=int, default=500, help='price spread around the mid in cents')
+    parser.add_argument('--chunk', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--target', type=int, default=100000, help='minimum acceptable ops/s')
+    parser.add_argument('--output', default='matching_bench_output.json')
+    args = parser.parse_args()
+    
+    orderbook = load_module('trading_orderbook', ORDERBOOK)
+    flow = make_flow(args.ops, args.cancel_ratio, args.users, args.spread_ticks, args.seed)
+    result = run(orderbook, flow, args.chunk)
+    result['target_ops_per_s'] = args.target
+    result['passed'] = result['ops_per_s'] >= args.target
+    
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    
+    print(f"{result['ops']} ops in {result['elapsed_s']} s: {result['ops_per_s']} ops/s "
+          f"(chunk min {result['chunk_ops_per_s_min']}, median {result['chunk_ops_per_s_median']}), "
+          f"{result['fills']} fills, {result['cancelled']} cancels, {result['resting_orders']} resting")
+    if not result['passed']:
+        print(f"below target of {args.target} ops/s", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+'''
+Бенчмарк action=portfolio функции trading на пользователе с большой историей (по умолчанию 1 000 000 сделок):
+полный пересчёт (recompute=1) против инкрементального обновления снимка после новых сделок. Отдельно
+проверяется поздний commit: сделка с id ниже отметки снимка, зафиксированная после её сдвига, должна
+попасть в следующий инкрементальный расчёт. Итог инкрементальных шагов сверяется с полным пересчётом;
+при расхождении скрипт завершается с кодом 1.
+Запуск: DATABASE_URL=... python scripts/bench_portfolio.py --trades 1000000 --new-trades 1000 --output portfolio_bench_output.json
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Dict, Any
+
+import psycopg2
+
+from bench_common import load_trading
+
+TOLERANCE = 1e-6
+
+# Сделки идут тройками по одному символу: две покупки и продажа, закрывающая обе, кроме каждой сотой
+# тройки — позиция медленно растёт, а число открытых лотов FIFO остаётся реалистичным (тысячи, а не сотни тысяч)
+TRADES_SQL = '''INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd, created_at)
+                SELECT %s, CASE WHEN mod(g, 3) = 2 THEN 'sell' ELSE 'buy' END, (ARRAY['BTC', 'ETH', 'SOL'])[mod(g / 3, 3) + 1],
+                       q, 60000 + mod(g::bigint * 7919, 5000), round(q * (60000 + mod(g::bigint * 7919, 5000)), 2),
+                       CURRENT_TIMESTAMP - make_interval(secs => %s - g)
+                FROM generate_series(1, %s) g,
+                     LATERAL (SELECT CASE WHEN mod(g, 3) = 2 AND mod(g, 300) <> 2 THEN 0.02 ELSE 0.01 END::numeric AS q) amounts'''
+
+def seed_user(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (email, password_hash, full_name) VALUES (%s, 'x', 'Portfolio Bench') RETURNING id",
+            (f'portfolio-{uuid.uuid4().hex[:12]}@example.com',)
+        )
+        user_id = cur.fetchone()[0]
+    conn.commit()
+    return user_id
+
+def insert_trades(conn, user_id: int, count: int):
+    with conn.cursor() as cur:
+        cur.execute(TRADES_SQL, (user_id, count, count))
+    conn.commit()
+
+def portfolio(trading, user_id: int, recompute: bool) -> Dict[str, Any]:
+    params = {'action': 'portfolio', 'user_id': str(user_id)}
+    if recompute:
+        params['recompute'] = '1'
+    started = time.perf_counter()
+    response = trading.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': params}, None)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    if response['statusCode'] != 200:
+        raise SystemExit(f"portfolio failed with {response['statusCode']}: {response['body'][:200]}")
+    result = json.loads(response['body'])
+    result['elapsed_ms'] = elapsed_ms
+    return result
+
+def positions(result: Dict[str, Any]) -> Dict[str, float]:
+    return {item['symbol']: item['position'] for item in result['symbols']}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full portfolio recompute against incremental snapshot updates')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--trades', type=int, default=1000000)
+    parser.add_argument('--new-trades', type=int, default=1000, help='trades added before the incremental update')
+    parser.add_argument('--output', default='portfolio_bench_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['AUTH_REQUIRED'] = '0'
+    os.environ['RATE_LIMIT_USER_RPS'] = '0'
+    os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    trading = load_trading('portfolio_trading_index')
+    conn = psycopg2.connect(args.dsn)
+    try:
+        user_id = seed_user(conn)
+        seed_started = time.perf_counter()
+        insert_trades(conn, user_id, args.trades)
+        seed_s = round(time.perf_counter() - seed_started, 1)
+        
+        full = portfolio(trading, user_id, recompute=True)
+        noop = portfolio(trading, user_id, recompute=False)
+        
+        insert_trades(conn, user_id, args.new_trades)
+        incremental = portfolio(trading, user_id, recompute=False)
+        
+        # Поздний commit: id берётся до вставки других сделок, а сама сделка фиксируется после того,
+        # как снимок уже продвинулся дальше этого id
+        late_conn = psycopg2.connect(args.dsn)
+        try:
+            with late_conn.cursor() as late_cur:
+                late_cur.execute("SELECT nextval('transactions_id_seq')")
+                late_id = late_cur.fetchone()[0]
+                insert_trades(conn, user_id, args.new_trades)
+                before_late = portfolio(trading, user_id, recompute=False)
+                late_cur.execute(
+                    "INSERT INTO transactions (id, user_id, type, symbol, amount, price_usd, total_usd) VALUES (%s, %s, 'buy', 'BTC', 1, 60000, 60000)",
+                    (late_id, user_id)
+                )
+            late_conn.commit()
+        finally:
+            late_conn.close()
+        after_late = portfolio(trading, user_id, recompute=False)
+        
+        recomputed = portfolio(trading, user_id, recompute=True)
+    finally:
+        conn.close()
+    
+    expected, actual = positions(recomputed), positions(after_late)
+    mismatched = sorted(
+        symbol for symbol in expected.keys() | actual.keys()
+        if abs(expected.get(symbol, 0.0) - actual.get(symbol, 0.0)) > TOLERANCE
+    )
+    result: Dict[str, Any] = {
+        'user_id': user_id,
+        'trades': args.trades,
+        'new_trades': args.new_trades,
+        'seed_s': seed_s,
+        'late_commit_window': trading.PORTFOLIO_LATE_COMMIT_WINDOW,
+        'full_recompute': {'ms': full['elapsed_ms'], 'processed': full['processed']},
+        'incremental_noop': {'ms': noop['elapsed_ms'], 'processed': noop['processed']},
+        'incremental': {'ms': incremental['elapsed_ms'], 'processed': incremental['processed']},
+        'late_commit': {
+            'late_id': late_id,
+            'watermark_before': before_late['last_tx_id'],
+            'processed': after_late['processed'],
+            'ms': after_late['elapsed_ms']
+        },
+        'final_recompute': {'ms': recomputed['elapsed_ms'], 'processed': recomputed['processed']},
+        'position_mismatches': mismatched
+    }
+    result['speedup'] = round(full['elapsed_ms'] / incremental['elapsed_ms'], 1) if incremental['elapsed_ms'] else None
+    result['passed'] = (
+        full['processed'] == args.trades
+        and not noop['processed']
+        and incremental['processed'] == args.new_trades
+        and late_id < before_late['last_tx_id']
+        and after_late['processed'] == 1
+        and not mismatched
+    )
+    
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    
+    print(f"{args.trades} trades: full recompute {full['elapsed_ms']} ms, incremental (+{args.new_trades}) "
+          f"{incremental['elapsed_ms']} ms, no-op {noop['elapsed_ms']} ms, speedup {result['speedup']}x; "
+          f"late commit id {late_id} below watermark {before_late['last_tx_id']} processed {after_late['processed']}; "
+          f"position mismatches {mismatched}")
+    if not result['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
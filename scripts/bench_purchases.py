@@ -0,0 +1,192 @@
+'''
+Бенчмарк одновременных покупок прокси из пула proxy_inventory через handler() функции proxy.
+Для каждого числа процессов заводится отдельная локация с --capacity эндпоинтами (seed_proxy_inventory)
+и по покупателю на процесс с достаточным балансом; процессы выкупают пул заказами по --quantity, спрос превышает ёмкость
+на --oversubscribe, поэтому хвост покупок получает 409. После прогона проверяется, что host:port не выдан
+дважды, пул не продан сверх ёмкости и каждая успешная покупка получила ровно свои эндпоинты.
+Запуск: DATABASE_URL=... python scripts/bench_purchases.py --workers 1,4,16 --capacity 20000 --quantity 10 --output purchases_bench_output.json
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import multiprocessing
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Any, List
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from bench_common import load_function
+
+def seed_phase(dsn: str, plan_type: str, base_ip: str, capacity: int, buyers: int) -> Dict[str, Any]:
+    location = f'Bench-{uuid.uuid4().hex[:8]}'
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT seed_proxy_inventory(%s, %s, %s, %s)', (location, plan_type, base_ip, capacity))
+            seeded = cur.fetchone()[0]
+            cur.execute(
+                '''INSERT INTO users (email, password_hash, full_name, balance_usd)
+                   SELECT %s || g || '@example.com', 'x', 'Purchase Bench', 100000000 FROM generate_series(1, %s) g
+                   RETURNING id''',
+                (f'purchase-{uuid.uuid4().hex[:12]}-', buyers)
+            )
+            user_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    finally:
+        conn.close()
+    return {'location': location, 'seeded': seeded, 'user_ids': user_ids}
+
+def verify(dsn: str, location: str, purchased: int) -> Dict[str, Any]:
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                '''SELECT COUNT(*) AS credentials, COUNT(DISTINCT (c.proxy_host, c.proxy_port)) AS endpoints
+                   FROM proxy_credentials c JOIN proxy_orders o ON o.id = c.order_id WHERE o.location = %s''',
+                (location,)
+            )
+            credentials = cur.fetchone()
+            cur.execute(
+                "SELECT COUNT(*) FILTER (WHERE status = 'allocated') AS allocated, COUNT(*) FILTER (WHERE status = 'available') AS available FROM proxy_inventory WHERE location = %s",
+                (location,)
+            )
+            inventory = cur.fetchone()
+            cur.execute(
+                '''SELECT COUNT(*) AS mismatched FROM proxy_orders o
+                   WHERE o.location = %s AND o.quantity <> (SELECT COUNT(*) FROM proxy_inventory pi WHERE pi.order_id = o.id)''',
+                (location,)
+            )
+            mismatched = cur.fetchone()['mismatched']
+    finally:
+        conn.close()
+    
+    return {
+        'credentials': credentials['credentials'],
+        'distinct_endpoints': credentials['endpoints'],
+        'allocated': inventory['allocated'],
+        'available': inventory['available'],
+        'orders_with_wrong_quantity': mismatched,
+        'consistent': (
+            credentials['credentials'] == credentials['endpoints'] == inventory['allocated'] == purchased
+            and not mismatched
+        )
+    }
+
+_proxy = None
+
+def purchase_worker(task: Dict[str, Any]) -> Dict[str, Any]:
+    # Каждый процесс загружает функцию один раз и держит свой пул соединений, как отдельный инстанс
+    global _proxy
+    if _proxy is None:
+        _proxy = load_function('proxy', 'purchases_proxy_index')
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    for _ in range(task['purchases']):
+        started = time.perf_counter()
+        response = _proxy.handler({'httpMethod': 'POST', 'headers': {}, 'queryStringParameters': {}, 'body': json.dumps(task['body'])}, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response['statusCode']] += 1
+    return {'latencies': latencies, 'statuses': statuses}
+
+def run_phase(dsn: str, plan: Dict[str, Any], workers: int, args) -> Dict[str, Any]:
+    phase = seed_phase(dsn, plan['type'], args.base_ip, args.capacity, workers)
+    purchases = int(args.capacity * args.oversubscribe) // args.quantity
+    tasks = [
+        {
+            'purchases': purchases // workers + (1 if i < purchases % workers else 0),
+            'body': {
+                'user_id': user_id,
+                'plan_id': plan['id'],
+                'location': phase['location'],
+                'quantity': args.quantity,
+                'duration_months': 1
+            }
+        }
+        for i, user_id in enumerate(phase['user_ids'])
+    ]
+    
+    with multiprocessing.Pool(workers) as pool:
+        # Прогрев: загрузка модуля и первое соединение не входят в замер
+        pool.map(purchase_worker, [{'purchases': 0}] * workers)
+        started = time.perf_counter()
+        outcomes = pool.map(purchase_worker, tasks, chunksize=1)
+        elapsed = time.perf_counter() - started
+    
+    latencies = sorted(value for outcome in outcomes for value in outcome['latencies'])
+    statuses: Counter = sum((outcome['statuses'] for outcome in outcomes), Counter())
+    succeeded = statuses[200]
+    result = {
+        'workers': workers,
+        'location': phase['location'],
+        'capacity': phase['seeded'],
+        'purchases': purchases,
+        'quantity': args.quantity,
+        'elapsed_s': round(elapsed, 3),
+        'purchases_per_s': round(purchases / elapsed, 1),
+        'proxies_per_s': round(succeeded * args.quantity / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        **verify(dsn, phase['location'], succeeded * args.quantity)
+    }
+    # Отказы допустимы только с 409 и только когда в пуле не хватает эндпоинтов на ещё один заказ
+    result['passed'] = (
+        result['consistent']
+        and set(statuses) <= {200, 409}
+        and (not statuses[409] or result['available'] < args.quantity)
+    )
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent proxy purchases against the pre-provisioned inventory')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--workers', default='1,4,16', help='comma-separated worker process counts, one phase each')
+    parser.add_argument('--capacity', type=int, default=20000, help='endpoints seeded per phase')
+    parser.add_argument('--quantity', type=int, default=10, help='proxies per purchase')
+    parser.add_argument('--oversubscribe', type=float, default=1.1, help='demand relative to capacity')
+    parser.add_argument('--plan-type', default='private')
+    parser.add_argument('--base-ip', default='198.19.', help='host prefix for the seeded endpoints')
+    parser.add_argument('--output', default='purchases_bench_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    worker_counts = [int(value) for value in args.workers.split(',')]
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['AUTH_REQUIRED'] = '0'
+    os.environ['RATE_LIMIT_USER_RPS'] = '0'
+    os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    conn = psycopg2.connect(args.dsn, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id, type FROM proxy_plans WHERE type = %s ORDER BY price_per_month LIMIT 1', (args.plan_type,))
+            plan = cur.fetchone()
+    finally:
+        conn.close()
+    if not plan:
+        raise SystemExit(f'no proxy plan of type {args.plan_type}')
+    
+    phases = [run_phase(args.dsn, plan, workers, args) for workers in worker_counts]
+    report = {'plan_id': plan['id'], 'plan_type': plan['type'], 'phases': phases, 'passed': all(phase['passed'] for phase in phases)}
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for phase in phases:
+        print(f"{phase['workers']} workers: {phase['purchases']} purchases x {phase['quantity']} in {phase['elapsed_s']} s "
+              f"({phase['purchases_per_s']} purchases/s, {phase['proxies_per_s']} proxies/s), "
+              f"p50 {phase['p50_ms']} ms, p95 {phase['p95_ms']} ms, p99 {phase['p99_ms']} ms, statuses {phase['statuses']}, "
+              f"allocated {phase['allocated']}/{phase['capacity']}, duplicates {phase['credentials'] - phase['distinct_endpoints']}, "
+              f"consistent {phase['consistent']}")
+    if not report['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
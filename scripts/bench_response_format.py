@@ -0,0 +1,205 @@
+'''
+Сравнение размера ответа и времени сериализации: текущий формат «словарь на строку» против format=columnar,
+без сжатия, с gzip и с brotli. Строки синтетические (Decimal и datetime, как из RealDictCursor), БД не нужна.
+Запуск: python scripts/bench_response_format.py --history-rows 500 --orders 50 --proxies-per-order 100 --output format_bench_output.json
+'''
+import argparse
+import base64
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Any, List, Callable
+
+from bench_common import load_function
+
+ENCODINGS = {'identity': '', 'gzip': 'gzip', 'br': 'br'}
+
+def make_transactions(count: int) -> List[Dict[str, Any]]:
+    started = datetime(2024, 1, 1)
+    return [
+        {
+            'id': 1000000 + i,
+            'type': 'buy' if i % 2 else 'sell',
+            'symbol': ('BTC', 'ETH', 'SOL')[i % 3],
+            'amount': Decimal('0.01250000'),
+            'price_usd': Decimal('61234.56'),
+            'total_usd': Decimal('765.43'),
+            'created_at': started + timedelta(seconds=37 * i)
+        }
+        for i in range(count)
+    ]
+
+def make_orders(count: int, proxies_per_order: int):
+    started = datetime(2024, 1, 1)
+    orders = [
+        {
+            'id': 5000 + i,
+            'plan_name': 'Residential Pro',
+            'plan_type': 'residential',
+            'location': 'Germany',
+            'quantity': proxies_per_order,
+            'duration_months': 1,
+            'total_price': Decimal('599.00'),
+            'status': 'active',
+            'expires_at': started + timedelta(days=30, minutes=i),
+            'created_at': started + timedelta(minutes=i)
+        }
+        for i in range(count)
+    ]
+    credentials = [
+        {
+            'order_id': order['id'],
+            'host': f'10.{order["id"] % 256}.{k // 256}.{k % 256}',
+            'port': 8000 + k,
+            'username': f'user_{order["id"]}_{k}',
+            'password': f'p{(order["id"] * 7919 + k) % 10 ** 10:010d}',
+            'location': 'Germany',
+            'status': 'active'
+        }
+        for order in orders for k in range(proxies_per_order)
+    ]
+    return orders, credentials
+
+def make_plans(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            'id': i + 1,
+            'name': f'Plan {i + 1}',
+            'type': ('datacenter', 'residential', 'mobile')[i % 3],
+            'description': 'High-speed proxies with unlimited bandwidth',
+            'price_per_month': Decimal('5.99') * (i + 1),
+            'max_connections': 100 * (i + 1),
+            'speed': '1 Gbps',
+            'locations': ['Russia', 'USA', 'Germany', 'Netherlands']
+        }
+        for i in range(count)
+    ]
+
+# Повторяет построение ответа в handler до format=columnar
+def history_rows(transactions: List[Dict[str, Any]]) -> str:
+    return json.dumps([
+        {
+            'id': tx['id'],
+            'type': tx['type'],
+            'symbol': tx['symbol'],
+            'amount': float(tx['amount']),
+            'price_usd': float(tx['price_usd']),
+            'total_usd': float(tx['total_usd']),
+            'created_at': tx['created_at'].isoformat() if tx['created_at'] else None
+        }
+        for tx in transactions
+    ])
+
+def orders_rows(orders: List[Dict[str, Any]], credentials: List[Dict[str, Any]]) -> str:
+    by_order: Dict[int, List[Dict[str, Any]]] = {}
+    for cred in credentials:
+        by_order.setdefault(cred['order_id'], []).append({
+            'host': cred['host'],
+            'port': cred['port'],
+            'username': cred['username'],
+            'password': cred['password'],
+            'location': cred['location'],
+            'status': cred['status']
+        })
+    return json.dumps([
+        {
+            'id': order['id'],
+            'plan_name': order['plan_name'],
+            'plan_type': order['plan_type'],
+            'location': order['location'],
+            'quantity': order['quantity'],
+            'duration_months': order['duration_months'],
+            'total_price': float(order['total_price']),
+            'status': order['status'],
+            'expires_at': order['expires_at'].isoformat() if order['expires_at'] else None,
+            'created_at': order['created_at'].isoformat() if order['created_at'] else None,
+            'proxies': by_order.get(order['id'], [])
+        }
+        for order in orders
+    ])
+
+def plans_rows(plans: List[Dict[str, Any]]) -> str:
+    return json.dumps([dict(plan, price_per_month=float(plan['price_per_month'])) for plan in plans])
+
+def measure(build: Callable[[], str], compress: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]], runs: int) -> Dict[str, Any]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = build()
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    result: Dict[str, Any] = {'serialize_ms': round(statistics.median(timings), 3)}
+    for name, header in ENCODINGS.items():
+        event = {'headers': {'Accept-Encoding': header}}
+        compress_timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            response = compress(event, {'statusCode': 200, 'headers': {}, 'body': body})
+            compress_timings.append((time.perf_counter() - started) * 1000)
+        encoded = response['body']
+        size = len(base64.b64decode(encoded)) if response.get('isBase64Encoded') else len(encoded.encode())
+        result[f'{name}_bytes'] = size
+        if name != 'identity':
+            result[f'{name}_ms'] = round(statistics.median(compress_timings), 3)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dict-per-row vs columnar response payloads')
+    parser.add_argument('--history-rows', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--proxies-per-order', type=int, default=100)
+    parser.add_argument('--plans', type=int, default=12)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--output', default='format_bench_output.json')
+    args = parser.parse_args()
+    
+    trading = load_function('trading', 'trading_index')
+    proxy = load_function('proxy', 'proxy_index')
+    transactions = make_transactions(args.history_rows)
+    orders, credentials = make_orders(args.orders, args.proxies_per_order)
+    plans = make_plans(args.plans)
+    
+    cases = {
+        'history': (
+            trading.compress_response,
+            lambda: history_rows(transactions),
+            lambda: trading.serialize_body(trading.columnar(transactions, trading.EXPORT_COLUMNS), compact=True)
+        ),
+        'orders': (
+            proxy.compress_response,
+            lambda: orders_rows(orders, credentials),
+            lambda: proxy.serialize_body(
+                dict(proxy.columnar(orders, proxy.ORDER_COLUMNS), proxies=proxy.columnar(credentials, proxy.CREDENTIAL_COLUMNS)),
+                compact=True
+            )
+        ),
+        'plans': (
+            proxy.compress_response,
+            lambda: plans_rows(plans),
+            lambda: proxy.serialize_body(proxy.columnar(plans, proxy.PLAN_COLUMNS), compact=True)
+        )
+    }
+    
+    report: Dict[str, Any] = {
+        'history_rows': args.history_rows,
+        'orders': args.orders,
+        'proxies_per_order': args.proxies_per_order,
+        'plans': args.plans,
+        'brotli': trading.negotiate_encoding({'headers': {'Accept-Encoding': 'br'}}) == 'br'
+    }
+    for name, (compress, rows, columns) in cases.items():
+        report[name] = {'rows': measure(rows, compress, args.runs), 'columnar': measure(columns, compress, args.runs)}
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for name in cases:
+        for fmt in ('rows', 'columnar'):
+            stats = report[name][fmt]
+            print(f"{name} {fmt}: {stats['identity_bytes']} B raw, {stats['gzip_bytes']} B gzip, {stats['br_bytes']} B br, "
+                  f"serialize {stats['serialize_ms']} ms, gzip {stats['gzip_ms']} ms, br {stats['br_ms']} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+'''
+Сравнение секционированной и обычной таблицы транзакций: загрузка --rows строк в обе,
+затем латентность одиночных INSERT и запроса истории (с окном по дате и без).
+Запуск: DATABASE_URL=... python scripts/bench_transactions_partitioning.py --rows 100000000 --output partitioning_bench_output.json
+'''
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, Any
+
+import psycopg2
+
+from bench_common import latency_stats
+
+SECONDS_PER_MONTH = 30 * 86400
+LOAD_CHUNK = 1000000
+TABLES = {'unpartitioned': 'bench_tx_plain', 'partitioned': 'bench_tx_part'}
+COLUMNS = '''
+    user_id INTEGER NOT NULL,
+    type VARCHAR(10) NOT NULL,
+    symbol VARCHAR(10) NOT NULL,
+    amount DECIMAL(20, 8) NOT NULL,
+    price_usd DECIMAL(20, 2) NOT NULL,
+    total_usd DECIMAL(20, 2) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+'''
+
+def create_tables(cur, months: int):
+    for table in TABLES.values():
+        cur.execute(f'DROP TABLE IF EXISTS {table}')
+    
+    cur.execute(f'CREATE TABLE bench_tx_plain (id SERIAL PRIMARY KEY, {COLUMNS})')
+    cur.execute(f'CREATE TABLE bench_tx_part (id SERIAL, {COLUMNS}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)')
+    for i in range(-months, 2):
+        cur.execute(
+            "SELECT date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => %s) AS start_at",
+            (i,)
+        )
+        start_at = cur.fetchone()[0]
+        cur.execute(
+            f"CREATE TABLE bench_tx_part_{i + months} PARTITION OF bench_tx_part FOR VALUES FROM (%s) TO (%s::timestamp + INTERVAL '1 month')",
+            (start_at, start_at)
+        )
+
+def load(cur, table: str, rows: int, users: int, months: int):
+    for offset in range(0, rows, LOAD_CHUNK):
+        cur.execute(
+            f'''INSERT INTO {table} (user_id, type, symbol, amount, price_usd, total_usd, created_at)
+                SELECT 1 + (n * 31) %% %s,
+                       CASE WHEN n %% 2 = 0 THEN 'buy' ELSE 'sell' END,
+                       (ARRAY['BTC', 'ETH', 'SOL'])[1 + n %% 3],
+                       0.01, 60000, 600,
+                       CURRENT_TIMESTAMP - ((n * 7919) %% %s) * INTERVAL '1 second'
+                FROM generate_series(%s::bigint, %s::bigint) AS n''',
+            (users, months * SECONDS_PER_MONTH, offset, min(offset + LOAD_CHUNK, rows) - 1)
+        )
+    cur.execute(f'CREATE INDEX ON {table} (user_id, created_at DESC, id DESC)')
+    cur.execute(f'ANALYZE {table}')
+
+def bench_inserts(cur, table: str, count: int, users: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        cur.execute(
+            f"INSERT INTO {table} (user_id, type, symbol, amount, price_usd, total_usd) VALUES (%s, 'buy', 'BTC', 0.01, 60000, 600)",
+            (random.randint(1, users),)
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+    return latency_stats(samples)
+
+def bench_history(cur, table: str, count: int, users: int, window_days: int) -> Dict[str, float]:
+    samples = []
+    window = 'AND created_at >= CURRENT_TIMESTAMP - make_interval(days => %s)' if window_days else ''
+    for _ in range(count):
+        params = [random.randint(1, users)] + ([window_days] if window_days else [])
+        started = time.perf_counter()
+        cur.execute(
+            f'SELECT id, type, symbol, amount, price_usd, total_usd, created_at FROM {table} WHERE user_id = %s {window} ORDER BY created_at DESC, id DESC LIMIT 50',
+            params
+        )
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return latency_stats(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark partitioned vs unpartitioned transactions tables')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=100000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--inserts', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--window-days', type=int, default=90)
+    parser.add_argument('--skip-load', action='store_true', help='reuse tables from a previous run')
+    parser.add_argument('--output', default='partitioning_bench_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    report: Dict[str, Any] = {'rows': args.rows, 'users': args.users, 'months': args.months}
+    
+    try:
+        if not args.skip_load:
+            create_tables(cur, args.months)
+            for name, table in TABLES.items():
+                started = time.perf_counter()
+                load(cur, table, args.rows, args.users, args.months)
+                report[f'{name}_load_s'] = round(time.perf_counter() - started, 1)
+        
+        for name, table in TABLES.items():
+            report[name] = {
+                'insert': bench_inserts(cur, table, args.inserts, args.users),
+                'history_window': bench_history(cur, table, args.queries, args.users, args.window_days),
+                'history_unbounded': bench_history(cur, table, args.queries, args.users, 0)
+            }
+    finally:
+        cur.close()
+        conn.close()
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for name in TABLES:
+        stats = report[name]
+        print(f"{name}: insert p50 {stats['insert']['p50_ms']} / p99 {stats['insert']['p99_ms']} ms, "
+              f"history ({args.window_days}d) p50 {stats['history_window']['p50_ms']} / p99 {stats['history_window']['p99_ms']} ms, "
+              f"history (all) p50 {stats['history_unbounded']['p50_ms']} / p99 {stats['history_unbounded']['p99_ms']} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Сверка агрегатов trade_volume_daily, holdings_totals и proxy_revenue с полным пересчётом
+по transactions, crypto_balances и proxy_orders. Расхождения печатаются; с --repair строки
+перезаписываются пересчитанными значениями. Функции обновляют агрегаты в транзакции самой записи,
+поэтому при работающей платформе расхождений быть не должно. Шарды trade_volume_daily и holdings_totals
+суммируются по ключу; исправленный ключ сводится в одну строку шарда 0.
+Запуск: DATABASE_URL=... python scripts/check_rollups.py [--repair] [--sample 20]
+'''
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+ROLLUPS = {
+    'trade_volume_daily': {
+        'keys': ['day', 'symbol'],
+        'columns': ['trades', 'buy_amount', 'sell_amount', 'volume_usd'],
+        'recompute': '''SELECT created_at::date AS day, symbol, COUNT(*) AS trades,
+                               COALESCE(SUM(amount) FILTER (WHERE type = 'buy'), 0) AS buy_amount,
+                               COALESCE(SUM(amount) FILTER (WHERE type = 'sell'), 0) AS sell_amount,
+                               SUM(total_usd) AS volume_usd
+                        FROM transactions GROUP BY created_at::date, symbol''',
+        # Заархивированные секции transactions пересчитать нельзя: сверяются только дни, которые ещё в таблице
+        'scope': 'day >= (SELECT MIN(created_at)::date FROM transactions)'
+    },
+    'holdings_totals': {
+        'keys': ['symbol'],
+        'columns': ['amount'],
+        'recompute': 'SELECT symbol, SUM(amount) AS amount FROM crypto_balances GROUP BY symbol',
+        'scope': 'TRUE'
+    },
+    'proxy_revenue': {
+        'keys': ['plan_id', 'location'],
+        'columns': ['orders', 'proxies', 'revenue_usd'],
+        'recompute': '''SELECT plan_id, location, COUNT(*) AS orders, COALESCE(SUM(quantity), 0) AS proxies,
+                               SUM(total_price) AS revenue_usd
+                        FROM proxy_orders WHERE plan_id IS NOT NULL GROUP BY plan_id, location''',
+        'scope': 'TRUE'
+    }
+}
+
+def diff_query(table: str, spec: Dict[str, Any]) -> str:
+    keys, columns = spec['keys'], spec['columns']
+    select_keys = ', '.join(f'COALESCE(e.{k}, a.{k}) AS {k}' for k in keys)
+    select_columns = ', '.join(f'COALESCE(e.{c}, 0) AS expected_{c}, COALESCE(a.{c}, 0) AS actual_{c}' for c in columns)
+    join = ' AND '.join(f'e.{k} = a.{k}' for k in keys)
+    differs = ' OR '.join(f'COALESCE(e.{c}, 0) <> COALESCE(a.{c}, 0)' for c in columns)
+    sums = ', '.join(f'SUM({c}) AS {c}' for c in columns)
+    return f'''WITH expected AS ({spec['recompute']}),
+                    actual AS (SELECT {', '.join(keys)}, {sums} FROM {table} WHERE {spec['scope']} GROUP BY {', '.join(keys)})
+               SELECT {select_keys}, {select_columns}
+               FROM expected e FULL OUTER JOIN actual a ON {join}
+               WHERE {differs}
+               ORDER BY {', '.join(keys)}'''
+
+def repair(cur, table: str, spec: Dict[str, Any], rows):
+    keys, columns = spec['keys'], spec['columns']
+    execute_values(
+        cur,
+        f"DELETE FROM {table} WHERE ({', '.join(keys)}) IN (VALUES %s)",
+        [tuple(row[k] for k in keys) for row in rows]
+    )
+    execute_values(
+        cur,
+        f"INSERT INTO {table} ({', '.join(keys + columns)}) VALUES %s",
+        [tuple(row[k] for k in keys) + tuple(row[f'expected_{c}'] for c in columns) for row in rows]
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare rollup tables with a full recompute')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--tables', default=','.join(ROLLUPS))
+    parser.add_argument('--repair', action='store_true', help='overwrite mismatched rows with recomputed values')
+    parser.add_argument('--sample', type=int, default=20)
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    
+    conn = psycopg2.connect(args.dsn, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    report: Dict[str, Any] = {'event': 'rollup_check', 'repaired': args.repair, 'tables': {}}
+    
+    try:
+        # REPEATABLE READ: пересчёт и чтение агрегатов видят один снимок
+        conn.set_session(isolation_level='REPEATABLE READ')
+        for table in args.tables.split(','):
+            spec = ROLLUPS[table]
+            if args.repair:
+                cur.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+            cur.execute(diff_query(table, spec))
+            mismatches = cur.fetchall()
+            if args.repair and mismatches:
+                repair(cur, table, spec, mismatches)
+            report['tables'][table] = {'mismatches': len(mismatches), 'sample': mismatches[:args.sample]}
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    
+    print(json.dumps(report, default=str, indent=2))
+    if not args.repair and any(stats['mismatches'] for stats in report['tables'].values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Замер холодного старта backend-функций: каждый прогон — отдельный процесс Python,
+в котором импортируется index.py и выполняются OPTIONS и первый запрос из tests.json.
+Запуск: python scripts/coldstart.py --runs 5 [--dsn ...] --output coldstart_output.json
+'''
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+HEAVY_MODULES = ['pydantic', 'email_validator', 'psycopg2', 'numpy']
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+PROBE = '''
+import json, sys, time
+
+class Context:
+    request_id = 'coldstart'
+    function_name = sys.argv[1]
+
+def loaded():
+    return sorted(m for m in %(heavy)r if m in sys.modules)
+
+started = time.perf_counter()
+import index
+result = {'import_ms': (time.perf_counter() - started) * 1000}
+
+started = time.perf_counter()
+index.handler({'httpMethod': 'OPTIONS'}, Context())
+result['options_ms'] = (time.perf_counter() - started) * 1000
+result['loaded_after_options'] = loaded()
+
+test = json.loads(sys.argv[2])
+if test:
+    event = {
+        'httpMethod': test.get('method', 'GET'),
+        'headers': test.get('headers', {}),
+        'queryStringParameters': test.get('queryStringParameters', {})
+    }
+    if 'body' in test:
+        event['body'] = json.dumps(test['body'])
+    started = time.perf_counter()
+    response = index.handler(event, Context())
+    result['first_request'] = test['name']
+    result['first_request_ms'] = (time.perf_counter() - started) * 1000
+    result['first_request_status'] = response.get('statusCode')
+    result['loaded_after_first_request'] = loaded()
+
+print(json.dumps(result))
+''' % {'heavy': HEAVY_MODULES}
+
+def first_test(name: str, with_db: bool) -> Dict[str, Any]:
+    with open(os.path.join(BACKEND, name, 'tests.json')) as f:
+        tests = json.load(f).get('tests', [])
+    for test in tests:
+        if with_db or test.get('method') == 'OPTIONS':
+            return test
+    return {}
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 3:
+            modules.append({'module': match.group(4), 'self_us': int(match.group(1)), 'cumulative_us': int(match.group(2))})
+    return modules
+
+def probe(name: str, test: Dict[str, Any]) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, name, json.dumps(test)],
+        cwd=os.path.join(BACKEND, name), capture_output=True, text=True, env=os.environ.copy()
+    )
+    output = [line for line in proc.stdout.splitlines() if line.startswith('{"import_ms"')]
+    if proc.returncode != 0 or not output:
+        raise SystemExit(f'{name}: probe failed\n{proc.stderr[-2000:]}')
+    result = json.loads(output[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+def measure(name: str, runs: int, with_db: bool, top: int) -> Dict[str, Any]:
+    test = first_test(name, with_db)
+    samples = [probe(name, test) for _ in range(runs)]
+    last = samples[-1]
+    report = {
+        'runs': runs,
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 2),
+        'options_ms': round(statistics.median(s['options_ms'] for s in samples), 2),
+        'loaded_after_options': last['loaded_after_options'],
+        'top_imports': sorted(last['imports'], key=lambda m: m['cumulative_us'], reverse=True)[:top]
+    }
+    if 'first_request_ms' in last:
+        report['first_request'] = last['first_request']
+        report['first_request_ms'] = round(statistics.median(s['first_request_ms'] for s in samples), 2)
+        report['first_request_status'] = last['first_request_status']
+        report['loaded_after_first_request'] = last['loaded_after_first_request']
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import and first-request time of backend handlers')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--functions', default='auth,trading,proxy')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--output', default='coldstart_output.json')
+    args = parser.parse_args()
+    
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    
+    report = {name: measure(name, args.runs, bool(args.dsn), args.top) for name in args.functions.split(',')}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for name, stats in report.items():
+        line = f"{name}: import {stats['import_ms']} ms, OPTIONS {stats['options_ms']} ms, loaded {stats['loaded_after_options'] or 'nothing heavy'}"
+        if 'first_request_ms' in stats:
+            line += f"; first request '{stats['first_request']}' {stats['first_request_ms']} ms ({stats['first_request_status']})"
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+'''
+Нагрузочный прогон backend-функций: handler() импортируется напрямую и вызывается
+с взвешенной смесью сценариев из секции "loadtest" файлов backend/<function>/tests.json.
+Запуск: DATABASE_URL=... python scripts/loadtest.py --seed --workers 8 --duration 30 --output bench_output.json
+'''
+import argparse
+import builtins
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from bench_common import BACKEND, percentile
+
+SEED_PASSWORD = 'loadtest123'
+SYMBOLS = {'BTC': 60000.0, 'ETH': 3000.0, 'SOL': 150.0}
+LOCATIONS = ['Russia', 'USA', 'Germany']
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+_sql_counter = threading.local()
+
+def counting_cursor(base):
+    class CountingCursor(base):
+        def execute(self, query, vars=None):
+            _sql_counter.count = getattr(_sql_counter, 'count', 0) + 1
+            return super().execute(query, vars)
+    return CountingCursor
+
+class Context:
+    def __init__(self, function_name: str):
+        self.request_id = str(uuid.uuid4())
+        self.function_name = function_name
+
+def load_module(module_name: str, path: str, module_builtins: Dict[str, Any]):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    module.__builtins__ = module_builtins
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def load_function(name: str):
+    # Функции деплоятся по отдельности, а здесь живут в одном процессе: одноимённые соседние модули
+    # (models.py есть у каждой) грузятся под именем <function>_<module> через собственный __import__
+    function_dir = os.path.join(BACKEND, name)
+    local_names = {f[:-3] for f in os.listdir(function_dir) if f.endswith('.py') and f != 'index.py'}
+    local_modules: Dict[str, Any] = {}
+    lock = threading.RLock()
+    
+    def scoped_import(module_name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and module_name in local_names:
+            with lock:
+                if module_name not in local_modules:
+                    local_modules[module_name] = load_module(
+                        f'{name}_{module_name}', os.path.join(function_dir, f'{module_name}.py'), scoped_builtins
+                    )
+            return local_modules[module_name]
+        return builtins.__import__(module_name, globals, locals, fromlist, level)
+    
+    scoped_builtins = dict(vars(builtins), __import__=scoped_import)
+    return load_module(f'{name}_index', os.path.join(function_dir, 'index.py'), scoped_builtins)
+
+def load_handler(name: str):
+    module = load_function(name)
+    # Пул соединений и фабрика курсоров живут в соседнем db.py, загруженном под именем <function>_db
+    db = sys.modules[f'{name}_db']
+    db._cursor_factory = counting_cursor(db.get_cursor_factory())
+    return module.handler
+
+def load_scenarios(name: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(BACKEND, name, 'tests.json')) as f:
+        spec = json.load(f)
+    return [dict(scenario, function=name) for scenario in spec.get('loadtest', {}).get('scenarios', [])]
+
+def seed(dsn: str, users: int, trades_per_user: int, orders_per_user: int) -> List[Tuple[int, str]]:
+    password_hash = hashlib.sha256(SEED_PASSWORD.encode()).hexdigest()
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            '''INSERT INTO users (email, password_hash, full_name, balance_usd)
+               SELECT 'loadtest+' || n || '@example.com', %s, 'Load Test ' || n, 100000000
+               FROM generate_series(1, %s) AS n
+               ON CONFLICT (email) DO UPDATE SET balance_usd = 100000000, password_hash = EXCLUDED.password_hash
+               RETURNING id, email''',
+            (password_hash, users)
+        )
+        seeded = [(row['id'], row['email']) for row in cur.fetchall()]
+        user_ids = [user_id for user_id, _ in seeded]
+        symbols = list(SYMBOLS)
+        prices = list(SYMBOLS.values())
+        
+        cur.execute(
+            '''INSERT INTO crypto_balances (user_id, symbol, amount)
+               SELECT u, s, 1000000 FROM unnest(%s) AS u CROSS JOIN unnest(%s) AS s
+               ON CONFLICT (user_id, symbol) DO UPDATE SET amount = 1000000''',
+            (user_ids, symbols)
+        )
+        
+        cur.execute(
+            '''INSERT INTO transactions (user_id, type, symbol, amount, price_usd, total_usd, created_at)
+               SELECT u, CASE WHEN n %% 2 = 0 THEN 'buy' ELSE 'sell' END,
+                      (%s::text[])[1 + n %% 3], 0.01, (%s::float8[])[1 + n %% 3],
+                      0.01 * (%s::float8[])[1 + n %% 3], CURRENT_TIMESTAMP - n * INTERVAL '1 minute'
+               FROM unnest(%s) AS u CROSS JOIN generate_series(1, %s) AS n''',
+            (symbols, prices, prices, user_ids, trades_per_user)
+        )
+        
+        if orders_per_user:
+            cur.execute(
+                '''WITH orders AS (
+                       INSERT INTO proxy_orders (user_id, plan_id, location, quantity, duration_months, total_price, expires_at)
+                       SELECT u, (SELECT MIN(id) FROM proxy_plans), %s, 10, 1, 59.90, CURRENT_TIMESTAMP + INTERVAL '30 days'
+                       FROM unnest(%s) AS u CROSS JOIN generate_series(1, %s) AS n
+                       RETURNING id, location
+                   )
+                   INSERT INTO proxy_credentials (order_id, proxy_host, proxy_port, proxy_username, proxy_password, location)
+                   SELECT o.id, '10.0.' || (o.id %% 256) || '.' || k, 8000 + k, 'user_' || k, 'pass_' || k, o.location
+                   FROM orders o CROSS JOIN generate_series(1, 10) AS k''',
+                (LOCATIONS[0], user_ids, orders_per_user)
+            )
+        
+        conn.commit()
+        return seeded
+    
+    finally:
+        cur.close()
+        conn.close()
+
+def load_seeded_users(dsn: str) -> List[Tuple[int, str]]:
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT id, email FROM users WHERE email LIKE 'loadtest+%' ORDER BY id")
+        return [(row['id'], row['email']) for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+
+def render(value: Any, ctx: Dict[str, Any]) -> Any:
+    if isinstance(value, dict):
+        return {k: render(v, ctx) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, ctx) for v in value]
+    if isinstance(value, str):
+        match = PLACEHOLDER.fullmatch(value)
+        if match:
+            return ctx[match.group(1)]
+        return PLACEHOLDER.sub(lambda m: str(ctx[m.group(1)]), value)
+    return value
+
+def request_context(users: List[Tuple[int, str]]) -> Dict[str, Any]:
+    user_id, email = random.choice(users)
+    symbol = random.choice(list(SYMBOLS))
+    return {
+        'user_id': user_id,
+        'email': email,
+        'password': SEED_PASSWORD,
+        'unique_email': f'loadtest-{uuid.uuid4().hex}@example.com',
+        'symbol': symbol,
+        'price': SYMBOLS[symbol],
+        'location': random.choice(LOCATIONS),
+        # Адрес из диапазона для тестов (198.18.0.0/15), свой у каждого пользователя: по нему ключуется ограничитель
+        'source_ip': f'198.18.{user_id // 256 % 256}.{user_id % 256}'
+    }
+
+def build_event(scenario: Dict[str, Any], ctx: Dict[str, Any]) -> Dict[str, Any]:
+    event = {
+        'httpMethod': scenario.get('method', 'GET'),
+        'headers': render(scenario.get('headers', {}), ctx),
+        'queryStringParameters': render(scenario.get('queryStringParameters', {}), ctx),
+        'requestContext': {'identity': {'sourceIp': ctx['source_ip']}}
+    }
+    if 'body' in scenario:
+        event['body'] = json.dumps(render(scenario['body'], ctx))
+    return event
+
+def summarize(samples: List[Tuple[str, float, int, int]], elapsed: float) -> Dict[str, Any]:
+    groups: Dict[str, List[Tuple[str, float, int, int]]] = {'all': samples}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    
+    report = {}
+    for name, rows in groups.items():
+        latencies = [row[1] for row in rows]
+        statuses: Dict[str, int] = {}
+        for row in rows:
+            statuses[str(row[2])] = statuses.get(str(row[2]), 0) + 1
+        report[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[2] >= 500),
+            'throttled': statuses.get('429', 0),
+            'non_2xx': sum(1 for row in rows if not 200 <= row[2] < 300),
+            'statuses': dict(sorted(statuses.items())),
+            'rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'sql_per_request': round(sum(row[3] for row in rows) / len(rows), 2) if rows else 0.0
+        }
+    return report
+
+def run(args) -> Dict[str, Any]:
+    functions = args.functions.split(',')
+    handlers = {name: load_handler(name) for name in functions}
+    scenarios = [scenario for name in functions for scenario in load_scenarios(name)]
+    if not scenarios:
+        raise SystemExit('No loadtest scenarios found in tests.json')
+    
+    users = seed(args.dsn, args.users, args.trades_per_user, args.orders_per_user) if args.seed else load_seeded_users(args.dsn)
+    if not users:
+        raise SystemExit('No seeded users, run with --seed')
+    
+    weights = [scenario.get('weight', 1) for scenario in scenarios]
+    samples: List[Tuple[str, float, int, int]] = []
+    samples_lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    
+    def worker():
+        local = []
+        while time.monotonic() < deadline:
+            scenario = random.choices(scenarios, weights)[0]
+            event = build_event(scenario, request_context(users))
+            _sql_counter.count = 0
+            started = time.perf_counter()
+            try:
+                status = handlers[scenario['function']](event, Context(scenario['function'])).get('statusCode', 500)
+            except Exception:
+                status = 599
+            latency = (time.perf_counter() - started) * 1000
+            local.append((f"{scenario['function']}: {scenario['name']}", latency, status, _sql_counter.count))
+        with samples_lock:
+            samples.extend(local)
+    
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for _ in range(args.workers):
+            pool.submit(worker)
+    elapsed = time.monotonic() - started
+    
+    return {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': args.workers,
+        'duration_s': round(elapsed, 2),
+        'seed': {'users': len(users), 'trades_per_user': args.trades_per_user, 'orders_per_user': args.orders_per_user},
+        'scenarios': summarize(samples, elapsed)
+    }
+
+def compare(report: Dict[str, Any], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for name, stats in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        print(f"{name}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms, rps {before['rps']} -> {stats['rps']}, "
+              f"sql/req {before['sql_per_request']} -> {stats['sql_per_request']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test backend handlers against a local Postgres')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--functions', default='auth,trading,proxy')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', action='store_true')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--trades-per-user', type=int, default=1000)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--rate-limits', action='store_true', help='keep the functions\' rate limiters on; 429s are reported as throttled')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    os.environ['DATABASE_URL'] = args.dsn
+    # Сценарии подставляют user_id без сессий: проверка токена выключена, как и в остальных скриптах
+    os.environ['AUTH_REQUIRED'] = '0'
+    os.environ.setdefault('DB_POOL_SIZE', str(args.workers))
+    if not args.rate_limits:
+        # Весь прогон идёт из одного процесса: глобальный бакет отвечал бы 429 вместо замера
+        os.environ['RATE_LIMIT_USER_RPS'] = '0'
+        os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for name, stats in report['scenarios'].items():
+        print(f"{name}: {stats['requests']} req, {stats['rps']} rps, p50 {stats['p50_ms']} / p95 {stats['p95_ms']} / p99 {stats['p99_ms']} ms, "
+              f"{stats['sql_per_request']} sql/req, {stats['errors']} errors, {stats['throttled']} throttled, {stats['non_2xx']} non-2xx")
+    if args.baseline:
+        compare(report, args.baseline)
+
+if __name__ == '__main__':
+    main()
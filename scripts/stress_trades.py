@@ -0,0 +1,198 @@
+'''
+Стресс-тест рыночных сделок по одному счёту: потоки одновременно покупают и продают через handler()
+функции trading. Отдельный поток всё время читает остатки и фиксирует любое отрицательное значение;
+в конце остатки сверяются с суммой записанных сделок. С --accounts N потоки распределяются по N счетам:
+они не ждут друг друга на строке users и упираются только в общие строки (агрегаты по символу).
+Пропускная способность печатается для сравнения версий: --function-dir можно направить на backend/trading
+другой ревизии (например, из git worktree).
+Запуск: DATABASE_URL=... python scripts/stress_trades.py --threads 16 --trades 4000 [--accounts 16] --output stress_output.json
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Any, List
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_handler(function_dir: str):
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location('stress_trading_index', os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+def seed_account(dsn: str, symbol: str, usd: Decimal, crypto: Decimal) -> int:
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (email, password_hash, full_name, balance_usd) VALUES (%s, 'x', 'Stress Test', %s) RETURNING id",
+                (f'stress-{uuid.uuid4().hex[:12]}@example.com', usd)
+            )
+            user_id = cur.fetchone()[0]
+            cur.execute("INSERT INTO crypto_balances (user_id, symbol, amount) VALUES (%s, %s, %s)", (user_id, symbol, crypto))
+        conn.commit()
+        return user_id
+    finally:
+        conn.close()
+
+def monitor(dsn: str, user_ids: List[int], symbol: str, stop: threading.Event, report: Dict[str, Any]):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            while not stop.is_set():
+                cur.execute(
+                    "SELECT u.balance_usd, c.amount FROM users u JOIN crypto_balances c ON c.user_id = u.id AND c.symbol = %s WHERE u.id = ANY(%s)",
+                    (symbol, user_ids)
+                )
+                for usd, crypto in cur.fetchall():
+                    report['samples'] += 1
+                    report['min_usd'] = min(report['min_usd'], usd)
+                    report['min_crypto'] = min(report['min_crypto'], crypto)
+                    if usd < 0 or crypto < 0:
+                        report['negative_samples'] += 1
+                time.sleep(0.005)
+    finally:
+        conn.close()
+
+def verify(dsn: str, user_id: int, symbol: str, usd: Decimal, crypto: Decimal) -> Dict[str, Any]:
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                '''SELECT COALESCE(SUM(CASE WHEN type = 'sell' THEN total_usd ELSE -total_usd END), 0) AS usd_delta,
+                          COALESCE(SUM(CASE WHEN type = 'buy' THEN amount ELSE -amount END), 0) AS crypto_delta,
+                          COUNT(*) AS trades
+                   FROM transactions WHERE user_id = %s AND symbol = %s''',
+                (user_id, symbol)
+            )
+            recorded = cur.fetchone()
+            cur.execute(
+                "SELECT u.balance_usd, c.amount FROM users u JOIN crypto_balances c ON c.user_id = u.id AND c.symbol = %s WHERE u.id = %s",
+                (symbol, user_id)
+            )
+            final = cur.fetchone()
+    finally:
+        conn.close()
+    
+    return {
+        'recorded_trades': recorded['trades'],
+        'final_usd': final['balance_usd'],
+        'final_crypto': final['amount'],
+        'expected_usd': usd + recorded['usd_delta'],
+        'expected_crypto': crypto + recorded['crypto_delta'],
+        'consistent': final['balance_usd'] == usd + recorded['usd_delta'] and final['amount'] == crypto + recorded['crypto_delta']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent buys and sells on one account; checks that balances never go negative')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--function-dir', default=os.path.join(ROOT, 'backend', 'trading'))
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--trades', type=int, default=4000)
+    parser.add_argument('--accounts', type=int, default=1, help='accounts the threads are spread over')
+    parser.add_argument('--symbol', default='BTC')
+    parser.add_argument('--price', type=float, default=100.0, help='must fall inside the slippage band of the last market price')
+    parser.add_argument('--usd', default='1000.00', help='starting USD balance')
+    parser.add_argument('--crypto', default='10', help='starting crypto balance')
+    parser.add_argument('--max-amount', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='stress_output.json')
+    args = parser.parse_args()
+    
+    if not args.dsn:
+        raise SystemExit('DATABASE_URL or --dsn is required')
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['AUTH_REQUIRED'] = '0'
+    # Ограничитель запросов отвечал бы 429 вместо сделок: в стресс-тесте он выключен
+    os.environ['RATE_LIMIT_USER_RPS'] = '0'
+    os.environ['RATE_LIMIT_GLOBAL_RPS'] = '0'
+    
+    handler = load_handler(os.path.abspath(args.function_dir))
+    usd, crypto = Decimal(args.usd), Decimal(args.crypto)
+    user_ids = [seed_account(args.dsn, args.symbol, usd, crypto) for _ in range(args.accounts)]
+    
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    counter_lock = threading.Lock()
+    remaining = [args.trades]
+    
+    def worker(seed: int, user_id: int):
+        rng = random.Random(seed)
+        while True:
+            with counter_lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            # Объёмы сопоставимы с остатками, чтобы заметная часть сделок упиралась в нехватку средств
+            body = {
+                'user_id': user_id,
+                'action': rng.choice(('buy', 'sell')),
+                'symbol': args.symbol,
+                'amount': round(rng.uniform(0.01, args.max_amount), 8),
+                'price_usd': args.price
+            }
+            try:
+                response = handler({'httpMethod': 'POST', 'headers': {}, 'queryStringParameters': {}, 'body': json.dumps(body)}, None)
+                status = response['statusCode']
+            except Exception as e:
+                status = 599
+                with counter_lock:
+                    errors[type(e).__name__] += 1
+            with counter_lock:
+                statuses[status] += 1
+    
+    report: Dict[str, Any] = {'samples': 0, 'negative_samples': 0, 'min_usd': usd, 'min_crypto': crypto}
+    stop = threading.Event()
+    watcher = threading.Thread(target=monitor, args=(args.dsn, user_ids, args.symbol, stop, report))
+    watcher.start()
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(args.seed + i, user_ids[i % len(user_ids)])) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    watcher.join()
+    
+    result = {
+        'function_dir': os.path.abspath(args.function_dir),
+        'user_ids': user_ids,
+        'threads': args.threads,
+        'requests': args.trades,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(args.trades / elapsed, 1),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'exceptions': dict(errors),
+        'monitor': report,
+        'accounts': [verify(args.dsn, user_id, args.symbol, usd, crypto) for user_id in user_ids]
+    }
+    result['consistent'] = all(account['consistent'] for account in result['accounts'])
+    result['passed'] = not report['negative_samples'] and result['consistent'] and not any(k >= 500 for k in statuses)
+    
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    
+    print(f"{args.trades} requests on {args.threads} threads over {args.accounts} accounts in {result['elapsed_s']} s ({result['requests_per_s']} req/s), "
+          f"statuses {result['statuses']}, exceptions {result['exceptions']}, "
+          f"min usd {report['min_usd']}, min crypto {report['min_crypto']}, consistent {result['consistent']}")
+    if not result['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
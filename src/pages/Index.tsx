@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -42,7 +42,7 @@ interface ProxyOrder {
     host: string;
     port: number;
     username: string;
-    password: string;
+    password: string | null;
     location: string;
     status: string;
   }[];
@@ -53,12 +53,15 @@ const Index = () => {
   const [showAuthDialog, setShowAuthDialog] = useState(false);
   const [authMode, setAuthMode] = useState<'login' | 'register'>('login');
   const [user, setUser] = useState<User | null>(null);
+  const [authToken, setAuthToken] = useState('');
   const [plans, setPlans] = useState<ProxyPlan[]>([]);
   const [orders, setOrders] = useState<ProxyOrder[]>([]);
   const [selectedPlan, setSelectedPlan] = useState<ProxyPlan | null>(null);
   const [selectedLocation, setSelectedLocation] = useState('');
   const [quantity, setQuantity] = useState(1);
   const [duration, setDuration] = useState(1);
+  // Один ключ на намерение покупки: повтор после сбоя сети не создаёт второй заказ
+  const purchaseKey = useRef<string | null>(null);
   const [activeTab, setActiveTab] = useState('plans');
   const { toast } = useToast();
 
@@ -82,10 +85,11 @@ const Index = () => {
     }
   };
 
-  const loadOrders = async (userId: number) => {
+  const loadOrders = async (userId: number, token: string = authToken) => {
     try {
       const response = await fetch(
-        `https://functions.poehali.dev/942358f4-933a-4af3-93eb-e5e26ca2fee8?action=orders&user_id=${userId}`
+        `https://functions.poehali.dev/942358f4-933a-4af3-93eb-e5e26ca2fee8?action=orders&user_id=${userId}`,
+        { headers: { 'X-Auth-Token': token } }
       );
       const data = await response.json();
       setOrders(data);
@@ -111,13 +115,14 @@ const Index = () => {
 
       if (data.success) {
         setUser(data.user);
+        setAuthToken(data.token);
         setIsLoggedIn(true);
         setShowAuthDialog(false);
         toast({
           title: authMode === 'login' ? 'Вход выполнен' : 'Регистрация успешна',
           description: `Добро пожаловать, ${data.user.full_name}!`
         });
-        loadOrders(data.user.id);
+        loadOrders(data.user.id, data.token);
       } else {
         toast({
           title: 'Ошибка',
@@ -134,13 +139,39 @@ const Index = () => {
     }
   };
 
+  const handleLogout = async () => {
+    try {
+      await fetch('https://functions.poehali.dev/512b9ee2-9d11-4fb8-9889-4772bca0fb7d', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-Auth-Token': authToken },
+        body: JSON.stringify({ action: 'logout' })
+      });
+    } catch (error) {
+      console.error('Failed to logout:', error);
+    }
+    setAuthToken('');
+    setIsLoggedIn(false);
+  };
+
+  useEffect(() => {
+    purchaseKey.current = null;
+  }, [selectedPlan, selectedLocation, quantity, duration]);
+
   const handlePurchase = async () => {
     if (!selectedPlan || !selectedLocation || !user) return;
 
+    if (!purchaseKey.current) {
+      purchaseKey.current = crypto.randomUUID();
+    }
+
     try {
       const response = await fetch('https://functions.poehali.dev/942358f4-933a-4af3-93eb-e5e26ca2fee8', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Auth-Token': authToken,
+          'Idempotency-Key': purchaseKey.current
+        },
         body: JSON.stringify({
           user_id: user.id,
           plan_id: selectedPlan.id,
@@ -153,6 +184,7 @@ const Index = () => {
       const data = await response.json();
 
       if (data.success) {
+        purchaseKey.current = null;
         toast({
           title: 'Покупка успешна!',
           description: `Вы приобрели ${quantity} прокси на ${duration} мес.`
@@ -164,7 +196,8 @@ const Index = () => {
         loadOrders(user.id);
         
         const userResponse = await fetch(
-          `https://functions.poehali.dev/76a66d2e-16fb-4539-9246-170421ed41d1?user_id=${user.id}&action=balance`
+          `https://functions.poehali.dev/76a66d2e-16fb-4539-9246-170421ed41d1?user_id=${user.id}&action=balance`,
+          { headers: { 'X-Auth-Token': authToken } }
         );
         const balanceData = await userResponse.json();
         setUser({ ...user, balance_usd: balanceData.usd });
@@ -244,7 +277,7 @@ const Index = () => {
                   <p className="text-sm text-muted-foreground">{user.full_name}</p>
                   <p className="text-lg font-bold text-primary">${user.balance_usd.toFixed(2)}</p>
                 </div>
-                <Button variant="outline" onClick={() => setIsLoggedIn(false)}>
+                <Button variant="outline" onClick={handleLogout}>
                   <Icon name="LogOut" size={18} />
                 </Button>
               </div>
@@ -423,14 +456,16 @@ const Index = () => {
                               <div>
                                 <Label className="text-xs text-muted-foreground">Авторизация</Label>
                                 <div className="flex items-center gap-2">
-                                  <code className="text-sm font-mono">{proxy.username}:{proxy.password}</code>
-                                  <Button
-                                    size="sm"
-                                    variant="ghost"
-                                    onClick={() => copyToClipboard(`${proxy.username}:${proxy.password}`)}
-                                  >
-                                    <Icon name="Copy" size={14} />
-                                  </Button>
+                                  <code className="text-sm font-mono">{proxy.username}:{proxy.password ?? '••••••'}</code>
+                                  {proxy.password && (
+                                    <Button
+                                      size="sm"
+                                      variant="ghost"
+                                      onClick={() => copyToClipboard(`${proxy.username}:${proxy.password}`)}
+                                    >
+                                      <Icon name="Copy" size={14} />
+                                    </Button>
+                                  )}
                                 </div>
                               </div>
                             </div>